@@ -1,7 +1,15 @@
-import sys, os, math, json
+import sys, os, math, json, time, threading, shutil
+from concurrent.futures import ThreadPoolExecutor
 
 from PySide2 import QtCore, QtWidgets, QtGui
-from objects import Box, Sphere, Camera, rot_quat, load_objs
+from objects import Box, Sphere, Instances, Mesh, Camera, PixelGrid, rot_quat, load_scene, object_bounds, \
+    translate_group, rotate_group, USE_KERNELS
+import quaternions
+import kernels
+import tracing
+from render_cache import RenderCache, SceneCache, render_key
+from render_profile import RenderProfile
+from spatial import SpatialIndex
 import numpy as np
 from enum import Enum
 
@@ -15,6 +23,42 @@ ROTATION_STEP = math.pi / 30
 PIVOT_COLOR = [255, 180, 100]
 # Outline color used to highlight object currently selected by the inspector
 SELECT_COLOR = [255, 255, 180]
+# Border color of the viewport that camera controls apply to, when there are several viewports
+ACTIVE_VIEWPORT_COLOR = [120, 200, 255]
+# Draw frame mode with OpenGL vertex buffers instead of QPainter (set CUBETEA_OPENGL=1)
+USE_OPENGL_VIEWPORT = os.environ.get("CUBETEA_OPENGL") == "1"
+# Render non anti-aliased raytrace mode frames with the analytic rasterizer (set CUBETEA_RASTERIZER=1)
+USE_ANALYTIC_RASTERIZER = os.environ.get("CUBETEA_RASTERIZER") == "1"
+# Minimum time (in milliseconds) between two consecutive viewport renders
+FRAME_INTERVAL_MS = 16
+# Frame time (in seconds) that raytraces should stay under while the camera is moving
+TARGET_FRAME_TIME = 1 / 20
+# Resolution levels available to raytraces during camera motion (1 = full resolution)
+RESOLUTION_LEVELS = [1, 2, 3, 4, 6, 8, 12, 16]
+# How long (in milliseconds) camera input must be idle before a full resolution frame is rendered
+IDLE_FULL_RESOLUTION_MS = 250
+# Raytrace precision used while the camera is moving in scenes the compiled kernels cannot trace,
+#     final frames and kernel traced frames always use float64
+PREVIEW_PRECISION = "float32"
+# How long (in milliseconds) the scene must go unchanged before it is auto-saved
+AUTOSAVE_DELAY_MS = 500
+# Name an auto-save that could not be restored is copied to, so that the next auto-save does not overwrite it
+FAILED_AUTOSAVE_NAME = "cubetea_AUTO.failed.json"
+# Threads raytracing the viewports that need a new frame at the same time
+VIEWPORT_RENDER_WORKERS = 4
+# Viewports placed side by side before a new row of viewports is started
+VIEWPORT_COLUMNS = 2
+# Camera rotations (axis, angle) away from the default camera giving preset views, "Free" copies the active camera
+VIEW_ROTATIONS = {"Free": None, "Front": ([0, 0, 1], 0), "Top": ([1, 0, 0], math.pi / 2),
+                  "Side": ([0, 0, 1], math.pi / 2)}
+# Edited properties that change an object's bounds in the scene's spatial index
+BOUNDS_PROPERTIES = ["pos", "rot", "quat", "dims", "rad"]
+# Rubber bands smaller than this many pixels along both sides count as clicks
+RUBBER_BAND_MIN_SIZE = 4
+# Columns of the render profile table: title, RenderProfile row key and the factor values are shown at
+PROFILE_COLUMNS = [("Object", "name", None), ("Type", "type", None), ("Tests", "tests", None),
+                   ("Hits", "hits", None), ("Hit Ratio", "hitRatio", 1), ("Intersect (ms)", "distTime", 1000),
+                   ("Shade (ms)", "renderTime", 1000), ("Total (ms)", "time", 1000)]
 
 # Types of rendering onto the raster surface
 class RasterMode(Enum):
@@ -26,98 +70,281 @@ class FileOperation(Enum):
     SAVE = 0,
     LOAD = 1
 
-# Rendering component
-class CubeTeaRasterWidget(QtWidgets.QWidget):
-    def __init__(self, objs, camera, parent=None):
-        super().__init__(parent)
+# Rendering logic shared by the QPainter and OpenGL viewports
+#     viewports of one scene may share a RenderCache and a SceneCache, see CubeTeaWidget.add_viewport
+class CubeTeaRasterMixin:
+    def init_raster(self, objs, camera, render_cache=None, scene_cache=None):
         self.objs = objs
         self.camera = camera
         self.resize(SCALE_FACTOR * self.camera.vdims[0], SCALE_FACTOR * self.camera.vdims[1])
         self.show()
         self.repaintRaytace = True
-        self.cache = []
+        # persistent raytrace framebuffers keyed by traced resolution, see framebuffer
+        self.framebuffers = {}
+        # hit distances of the raytrace in each framebuffer, used to reuse it after camera pans
+        self.depthbuffers = {}
+        # pixel coordinates and trace scratch arrays of each framebuffer's resolution
+        self.pixelgrids = {}
+        # camera pose and settings of the last raytrace that pans may reuse, see pan_source
+        self.panSource = None
+        self.image = None
+        # finished raytraces, so returning to an earlier view does not retrace it
+        self.renderCache = RenderCache() if render_cache is None else render_cache
+        # camera independent data of the current scene version (digest, bounds, packed geometry)
+        self.sceneCache = SceneCache() if scene_cache is None else scene_cache
+        # outlined as the viewport camera controls apply to
+        self.active = False
         self.mode = RasterMode.FRAME
         self.selectIdx = -1
+        self.selectIdxs = []
         self.pivotIdx = -1
-
-    def paintEvent(self, event):
-        painter = QtGui.QPainter()
-        painter.begin(self)
-
-        if (self.mode == RasterMode.FRAME):
-            frameItems = self.camera.frame_rasterize(self.objs)
-            painter.setBrush(QtGui.QColor(*self.camera.color))
-            painter.fillRect(QtCore.QRectF(0, 0, SCALE_FACTOR * self.camera.vdims[0],
-                                                 SCALE_FACTOR * self.camera.vdims[1]), painter.brush())
-            painter.setBrush(QtGui.QColor(0, 0, 0, 0))
-            for item in frameItems:
-                framePen = painter.pen()
-                framePen.setWidth(5.0)
-                framePen.setStyle(QtCore.Qt.DashDotDotLine)
-                framePen.setColor(QtGui.QColor(*item[2]))
-                painter.setPen(framePen)
-                if item[3] == "Line":
-                    painter.drawLine(SCALE_FACTOR * QtCore.QPointF(*item[0]), SCALE_FACTOR * QtCore.QPointF(*item[1]))
-                elif item[3] == "Circle":
-                    painter.drawEllipse(SCALE_FACTOR * QtCore.QPointF(*item[0]), SCALE_FACTOR * item[1],
-                                        SCALE_FACTOR * item[1])
-        elif (self.mode == RasterMode.RAYTRACE):
-            print(self.repaintRaytace)
-            if self.repaintRaytace:
-                raster = np.transpose(self.camera.raytrace(self.objs, False), (1, 0, 2)).copy()
-                raster8 = raster.astype(np.uint8, order='C', casting='unsafe')
-                image = QtGui.QImage(raster8.data, raster8.shape[1], raster8.shape[0], QtGui.QImage.Format_RGB888)
-                pixmap = QtGui.QPixmap(image).scaled(
-                    SCALE_FACTOR * self.camera.vdims[0],
-                    SCALE_FACTOR * self.camera.vdims[1],
-                    QtCore.Qt.KeepAspectRatio,
-                    QtCore.Qt.SmoothTransformation)
-                painter.drawPixmap(QtCore.QPointF(0, 0), pixmap,
-                                   QtCore.QRectF(0, 0, SCALE_FACTOR * self.camera.vdims[0],
-                                                 SCALE_FACTOR * self.camera.vdims[1]))
-                self.cache = pixmap
-                self.repaintRaytace = False
+        # bumped by the frame scheduler whenever scene geometry changes
+        self.sceneVersion = 0
+        # adaptive resolution state used while the camera is being moved
+        self.interactive = False
+        self.resolutionLevel = 1
+        self.pixelCost = 0
+        # anti-aliasing mode passed to raytraces, see Camera.raytrace
+        self.antialias = None
+        # draws every object with its full frame even when it only covers a few pixels
+        self.fullDetail = False
+        self.idleTimer = QtCore.QTimer(self)
+        self.idleTimer.setSingleShot(True)
+        self.idleTimer.setInterval(IDLE_FULL_RESOLUTION_MS)
+        self.idleTimer.timeout.connect(self.end_interaction)
+        # rubber band dragged out with the mouse to select the objects under it
+        self.rubberBand = QtWidgets.QRubberBand(QtWidgets.QRubberBand.Rectangle, self)
+        self.bandOrigin = None
+
+    def paint_frame(self, painter):
+        with tracing.span("frame_rasterize", "render", objects=len(self.objs), fullDetail=self.fullDetail) as span:
+            frameItems = self.camera.frame_rasterize(self.objs, full_detail=self.fullDetail, scene=self.sceneCache)
+            span.set(items=len(frameItems))
+        painter.setBrush(QtGui.QColor(*self.camera.color))
+        painter.fillRect(QtCore.QRectF(0, 0, SCALE_FACTOR * self.camera.vdims[0],
+                                             SCALE_FACTOR * self.camera.vdims[1]), painter.brush())
+        painter.setBrush(QtGui.QColor(0, 0, 0, 0))
+        self.paint_points(painter, [item for item in frameItems if item[3] == "Point"])
+        for item in frameItems:
+            if item[3] == "Point":
+                continue
+            framePen = painter.pen()
+            framePen.setWidth(5.0)
+            framePen.setStyle(QtCore.Qt.DashDotDotLine)
+            framePen.setColor(QtGui.QColor(*item[2]))
+            painter.setPen(framePen)
+            if item[3] == "Line":
+                painter.drawLine(SCALE_FACTOR * QtCore.QPointF(*item[0]), SCALE_FACTOR * QtCore.QPointF(*item[1]))
+            elif item[3] == "Circle":
+                painter.drawEllipse(SCALE_FACTOR * QtCore.QPointF(*item[0]), SCALE_FACTOR * item[1],
+                                    SCALE_FACTOR * item[1])
+
+    # Draws level-of-detail points as filled squares, one drawPoints call per color and size
+    def paint_points(self, painter, items):
+        batches = {}
+        for item in items:
+            key = (tuple(item[2]), int(math.ceil(SCALE_FACTOR * item[1])))
+            batches.setdefault(key, []).append(SCALE_FACTOR * QtCore.QPointF(*item[0]))
+        for (color, size), points in batches.items():
+            pointPen = QtGui.QPen(QtGui.QColor(*color))
+            pointPen.setWidth(size)
+            pointPen.setCapStyle(QtCore.Qt.SquareCap)
+            painter.setPen(pointPen)
+            painter.drawPoints(QtGui.QPolygonF(points))
+
+    def paint_raytrace(self, painter):
+        if self.repaintRaytace:
+            self.render_raytrace()
+        if self.image is None:
+            return
+        target = QtCore.QRectF(0, 0, SCALE_FACTOR * self.camera.vdims[0], SCALE_FACTOR * self.camera.vdims[1])
+        scaled = self.image.width() != target.width() or self.image.height() != target.height()
+        # converting the framebuffer to the screen's format (and scaling it) happens inside drawImage
+        with tracing.span("draw_image", "image", width=self.image.width(), height=self.image.height(), scaled=scaled):
+            if not scaled:
+                painter.drawImage(QtCore.QPointF(0, 0), self.image)
             else:
-                painter.drawPixmap(QtCore.QPointF(0, 0), self.cache,
-                                   QtCore.QRectF(0, 0, SCALE_FACTOR * self.camera.vdims[0],
-                                                 SCALE_FACTOR * self.camera.vdims[1]))
-        if self.pivotIdx != -1:
-            painter.setBrush(QtGui.QColor(0, 0, 0, 0))
-            pivot = self.objs[self.pivotIdx]
-            items = self.camera.frame_rasterize([pivot])
-            for item in items:
-                framePen = painter.pen()
-                framePen.setWidth(2.5)
-                framePen.setStyle(QtCore.Qt.DashDotDotLine)
-                framePen.setColor(QtGui.QColor(*PIVOT_COLOR))
-                painter.setPen(framePen)
-                if item[3] == "Line":
-                    painter.drawLine(SCALE_FACTOR * QtCore.QPointF(*item[0]), SCALE_FACTOR * QtCore.QPointF(*item[1]))
-                elif item[3] == "Circle":
-                    painter.drawEllipse(SCALE_FACTOR * QtCore.QPointF(*item[0]), SCALE_FACTOR * item[1],
-                                        SCALE_FACTOR * item[1])
-        elif self.selectIdx != -1:
-            painter.setBrush(QtGui.QColor(0, 0, 0, 0))
-            select = self.objs[self.selectIdx]
-            items = self.camera.frame_rasterize([select])
-            for item in items:
-                framePen = painter.pen()
-                framePen.setWidth(2.5)
-                framePen.setStyle(QtCore.Qt.DashDotDotLine)
-                framePen.setColor(QtGui.QColor(*SELECT_COLOR))
-                painter.setPen(framePen)
-                if item[3] == "Line":
-                    painter.drawLine(SCALE_FACTOR * QtCore.QPointF(*item[0]), SCALE_FACTOR * QtCore.QPointF(*item[1]))
-                elif item[3] == "Circle":
-                    painter.drawEllipse(SCALE_FACTOR * QtCore.QPointF(*item[0]), SCALE_FACTOR * item[1],
-                                        SCALE_FACTOR * item[1])
-        painter.end()
+                # only scale when the traced resolution differs from the widget size
+                painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform)
+                painter.drawImage(target, self.image)
+
+    # Precision of frames traced while the camera is moving
+    #     the compiled kernels only trace float64 and beat float32 NumPy traces by far, so PREVIEW_PRECISION
+    #     only applies when they are unavailable or the scene holds objects they cannot trace
+    def preview_precision(self):
+        if USE_KERNELS and kernels.available() and \
+                self.sceneCache.get("pack", lambda: kernels.pack_scene(self.objs)) is not None:
+            return "float64"
+        return PREVIEW_PRECISION
+
+    # Raytraces the next frame into the framebuffer without painting it
+    #     makes no widget calls, so the frame scheduler may run it for several viewports at once
+    def render_raytrace(self):
+        self.resolutionLevel = self.choose_resolution_level()
+        antialias = self.antialias if self.resolutionLevel == 1 else None
+        precision = self.preview_precision() if self.interactive else "float64"
+        I, J = self.camera.trace_dims(self.resolutionLevel)
+        self.image = self.framebuffer(I, J)
+        buffer = self.framebuffers[(I, J)][0]
+        key = render_key(self.camera, self.objs, self.sceneCache, level=self.resolutionLevel, antialias=antialias,
+                         precision=precision)
+        source = self.pan_source(I, J, antialias, precision)
+        with tracing.span("raytrace", "render", objects=len(self.objs), level=self.resolutionLevel,
+                          antialias=antialias, precision=precision, pixels=I * J) as span:
+            depth = self.depthbuffers[(I, J)]
+            # panning keeps the depth buffer going, so it is tried before cached frames
+            traced, cached = None, None
+            if source is not None:
+                traced = self.camera.pan_into(buffer, depth, source, self.objs, False, self.resolutionLevel,
+                                              precision, self.sceneCache)
+            if traced is None:
+                cached = self.renderCache.get(key)
+            if cached is not None:
+                np.copyto(buffer, cached)
+            elif traced is None:
+                start = time.perf_counter()
+                if USE_ANALYTIC_RASTERIZER and antialias is None:
+                    sheet = self.camera.rasterize(self.objs, False, self.resolutionLevel)
+                    buffer[:, :, :3] = sheet.transpose((1, 0, 2))
+                else:
+                    self.camera.raytrace_into(buffer, self.objs, False, self.resolutionLevel, antialias, precision,
+                                              depth=depth, scene=self.sceneCache, grid=self.pixelgrids[(I, J)])
+                # pans are not representative of full raytraces, so only full traces set the cost
+                self.pixelCost = (time.perf_counter() - start) / (I * J)
+                traced = I * J
+            if cached is None:
+                self.renderCache.put(key, buffer)
+            span.set(cached=cached is not None, traced=traced if traced is not None else 0)
+            # cached frames come without depth, anti-aliased and rasterized ones are not pixel exact
+            reusable = cached is None and antialias is None and not USE_ANALYTIC_RASTERIZER
+            self.panSource = {
+                "size": (I, J),
+                "camera": self.camera.copy(),
+                "sceneVersion": self.sceneVersion,
+                "objects": len(self.objs),
+                "precision": precision
+            } if reusable else None
+        self.repaintRaytace = False
+
+    # Returns the persistent QImage wrapping a uint8 framebuffer for an I x J raytrace
+    #     buffers are allocated once per resolution and reused by every later frame
+    def framebuffer(self, I, J):
+        if (I, J) not in self.framebuffers:
+            with tracing.span("framebuffer", "image", width=I, height=J):
+                buffer = np.full((J, I, 4), 255, dtype=np.uint8)
+                image = QtGui.QImage(buffer.data, I, J, 4 * I, QtGui.QImage.Format_RGBX8888)
+                self.framebuffers[(I, J)] = (buffer, image)
+                self.depthbuffers[(I, J)] = np.full((J, I), float("inf"))
+                self.pixelgrids[(I, J)] = PixelGrid(I, J)
+        return self.framebuffers[(I, J)][1]
+
+    # Camera pose of the raytrace in the I x J framebuffer if the next frame may be panned from it
+    #     the scene and trace settings must be unchanged, Camera.pan_into checks the pose itself
+    def pan_source(self, I, J, antialias, precision):
+        source = self.panSource
+        if source is None or antialias is not None or USE_ANALYTIC_RASTERIZER:
+            return None
+        if source["size"] != (I, J) or source["sceneVersion"] != self.sceneVersion or \
+                source["objects"] != len(self.objs) or source["precision"] != precision:
+            return None
+        return source["camera"]
+
+    # Outlines the group selection, then the pivot object or the focused object if there is no pivot,
+    # and borders the active viewport
+    def paint_overlays(self, painter):
+        with tracing.span("overlays", "paint", selected=len(self.selectIdxs)):
+            if self.active:
+                borderPen = QtGui.QPen(QtGui.QColor(*ACTIVE_VIEWPORT_COLOR))
+                borderPen.setWidth(3)
+                painter.setPen(borderPen)
+                painter.setBrush(QtGui.QColor(0, 0, 0, 0))
+                painter.drawRect(QtCore.QRectF(1.5, 1.5, SCALE_FACTOR * self.camera.vdims[0] - 3,
+                                               SCALE_FACTOR * self.camera.vdims[1] - 3))
+            group = [self.objs[idx] for idx in self.selectIdxs if idx < len(self.objs)]
+            if len(group) > 1:
+                self.paint_outlines(painter, group, SELECT_COLOR)
+            if self.pivotIdx != -1:
+                self.paint_outlines(painter, [self.objs[self.pivotIdx]], PIVOT_COLOR)
+            elif self.selectIdx != -1:
+                self.paint_outlines(painter, [self.objs[self.selectIdx]], SELECT_COLOR)
+
+    def paint_outlines(self, painter, objs, color):
+        painter.setBrush(QtGui.QColor(0, 0, 0, 0))
+        items = self.camera.frame_rasterize(objs, full_detail=True)
+        for item in items:
+            framePen = painter.pen()
+            framePen.setWidth(2.5)
+            framePen.setStyle(QtCore.Qt.DashDotDotLine)
+            framePen.setColor(QtGui.QColor(*color))
+            painter.setPen(framePen)
+            if item[3] == "Line":
+                painter.drawLine(SCALE_FACTOR * QtCore.QPointF(*item[0]), SCALE_FACTOR * QtCore.QPointF(*item[1]))
+            elif item[3] == "Circle":
+                painter.drawEllipse(SCALE_FACTOR * QtCore.QPointF(*item[0]), SCALE_FACTOR * item[1],
+                                    SCALE_FACTOR * item[1])
+
+    # Scene size and mode recorded with every traced frame
+    def frame_args(self):
+        return {
+            "objects": len(self.objs),
+            "mode": self.mode.name,
+            "interactive": self.interactive,
+            "sceneVersion": self.sceneVersion,
+            "width": int(self.camera.vdims[0]),
+            "height": int(self.camera.vdims[1])
+        }
+
+    # Picks the finest resolution level whose estimated raytrace cost meets TARGET_FRAME_TIME
+    def choose_resolution_level(self):
+        if not self.interactive or self.pixelCost <= 0:
+            return 1
+        for level in RESOLUTION_LEVELS:
+            I, J = self.camera.trace_dims(level)
+            if self.pixelCost * I * J <= TARGET_FRAME_TIME:
+                return level
+        return RESOLUTION_LEVELS[-1]
+
+    # Marks camera input as active, postponing the full resolution frame until input goes idle
+    def begin_interaction(self):
+        self.interactive = True
+        self.idleTimer.start()
+
+    # Renders one full resolution frame once camera input has gone idle
+    def end_interaction(self):
+        self.interactive = False
+        if self.mode == RasterMode.RAYTRACE and self.resolutionLevel != 1:
+            self.window().update_render(True, viewport=self)
+
+    # Clicking a viewport hands it the camera controls, dragging selects the objects under the rubber band
+    def mousePressEvent(self, event):
+        self.window().activate_viewport(self)
+        if event.button() == QtCore.Qt.LeftButton:
+            self.bandOrigin = event.pos()
+            self.rubberBand.setGeometry(QtCore.QRect(self.bandOrigin, QtCore.QSize()))
+            self.rubberBand.show()
+
+    def mouseMoveEvent(self, event):
+        if self.bandOrigin is not None:
+            self.rubberBand.setGeometry(QtCore.QRect(self.bandOrigin, event.pos()).normalized())
+
+    def mouseReleaseEvent(self, event):
+        if self.bandOrigin is None:
+            return
+        band = QtCore.QRect(self.bandOrigin, event.pos()).normalized()
+        self.bandOrigin = None
+        self.rubberBand.hide()
+        if band.width() >= RUBBER_BAND_MIN_SIZE or band.height() >= RUBBER_BAND_MIN_SIZE:
+            self.window().select_region(self, band)
 
     def toggleRenderMode(self):
         self.mode = RasterMode.FRAME if self.mode == RasterMode.RAYTRACE else RasterMode.RAYTRACE
         self.repaintRaytace = True
         self.update()
 
+    def reselect_group(self, selectIdxs):
+        self.selectIdxs = selectIdxs
+        self.update()
+
     def reselect(self, selectIdx, repaint=True):
         self.repaintRaytace = repaint
         self.pivotIdx = -1
@@ -125,6 +352,267 @@ class CubeTeaRasterWidget(QtWidgets.QWidget):
         self.repaintRaytace = repaint
         self.update()
 
+# Rendering component
+class CubeTeaRasterWidget(CubeTeaRasterMixin, QtWidgets.QWidget):
+    def __init__(self, objs, camera, render_cache=None, scene_cache=None, parent=None):
+        QtWidgets.QWidget.__init__(self, parent)
+        self.init_raster(objs, camera, render_cache, scene_cache)
+
+    def paintEvent(self, event):
+        with tracing.span("frame", "paint", **self.frame_args()):
+            painter = QtGui.QPainter()
+            painter.begin(self)
+            if (self.mode == RasterMode.FRAME):
+                self.paint_frame(painter)
+            elif (self.mode == RasterMode.RAYTRACE):
+                self.paint_raytrace(painter)
+            self.paint_overlays(painter)
+            painter.end()
+
+# OpenGL rendering component, frame mode is drawn from vertex buffers (see glviewport.py)
+class CubeTeaGLRasterWidget(CubeTeaRasterMixin, QtWidgets.QOpenGLWidget):
+    def __init__(self, objs, camera, render_cache=None, scene_cache=None, parent=None):
+        QtWidgets.QOpenGLWidget.__init__(self, parent)
+        self.renderer = None
+        self.uploadedVersion = -1
+        self.init_raster(objs, camera, render_cache, scene_cache)
+
+    def initializeGL(self):
+        # imported here so PyOpenGL is only loaded when the OpenGL viewport is in use
+        import glviewport
+        self.renderer = glviewport.GLFrameRenderer()
+        self.renderer.initialize()
+        self.uploadedVersion = -1
+
+    def paintGL(self):
+        with tracing.span("frame", "paint", **self.frame_args()):
+            painter = QtGui.QPainter()
+            painter.begin(self)
+            if (self.mode == RasterMode.FRAME):
+                painter.beginNativePainting()
+                if self.uploadedVersion != self.sceneVersion:
+                    # every viewport has its own context and buffer, but the vertices are built once
+                    import glviewport
+                    self.renderer.upload(self.objs, self.sceneCache.get(
+                        "vertices", lambda: glviewport.build_vertices(self.objs)))
+                    self.uploadedVersion = self.sceneVersion
+                self.renderer.draw(self.camera)
+                painter.endNativePainting()
+            elif (self.mode == RasterMode.RAYTRACE):
+                self.paint_raytrace(painter)
+            self.paint_overlays(painter)
+            painter.end()
+
+# Coalesces render requests so that every viewport renders at most once per display interval
+#     viewports is a list of viewports, shared with the owner so that viewports added later are scheduled
+#     too; raytraces of several viewports that need a new frame run at the same time
+class CubeTeaFrameScheduler(QtCore.QObject):
+    def __init__(self, viewports, scene_cache=None, on_flush=None, parent=None):
+        super().__init__(parent)
+        self.viewports = viewports
+        self.sceneCache = scene_cache
+        self.onFlush = on_flush
+        # versions are bumped on every scene/camera change; a render is only worth doing
+        # for the most recent pair of versions of a viewport
+        self.sceneVersion = 0
+        self.cameraVersion = 0
+        self.cameraVersions = {}
+        self.renderedVersions = {}
+        # viewports whose next frame must be rendered even if their versions did not change
+        self.forced = set()
+        self.dirty = False
+        self.requested = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.rendered = 0
+        self.concurrent = 0
+        self.pool = None
+        self.clock = QtCore.QElapsedTimer()
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.flush)
+
+    # Marks the scene dirty and schedules a render for the next free display interval
+    #     camera changes and repaints concern viewport, or every viewport when it is None
+    def request(self, scene=False, camera=False, repaint=False, viewport=None):
+        self.requested += 1
+        targets = self.viewports if viewport is None else [viewport]
+        if scene:
+            self.sceneVersion += 1
+            # data of the old scene must not outlive the change, even if a viewport paints before the flush
+            if self.sceneCache is not None:
+                self.sceneCache.update(self.sceneVersion)
+            for target in self.viewports:
+                target.sceneVersion = self.sceneVersion
+        if camera:
+            self.cameraVersion += 1
+            for target in targets:
+                self.cameraVersions[target] = self.cameraVersion
+        if repaint:
+            self.forced.update(targets)
+        if self.dirty:
+            self.coalesced += 1
+            return
+        self.dirty = True
+        elapsed = self.clock.elapsed() if self.clock.isValid() else FRAME_INTERVAL_MS
+        self.timer.start(max(0, FRAME_INTERVAL_MS - elapsed))
+
+    # Renders the latest requested state, skipping work for viewports whose state was already rendered
+    def flush(self):
+        with tracing.span("flush", "schedule", sceneVersion=self.sceneVersion, cameraVersion=self.cameraVersion,
+                          viewports=len(self.viewports)):
+            if not self.dirty:
+                return
+            self.dirty = False
+            self.clock.start()
+            stale = []
+            for viewport in self.viewports:
+                version = (self.sceneVersion, self.cameraVersions.get(viewport, 0))
+                if version != self.renderedVersions.get(viewport) or viewport in self.forced:
+                    viewport.repaintRaytace = True
+                    stale.append(viewport)
+                self.renderedVersions[viewport] = version
+                viewport.sceneVersion = self.sceneVersion
+            self.forced.clear()
+            changed = len(stale) > 0
+            if changed:
+                self.rendered += 1
+            else:
+                self.dropped += 1
+            self.render_concurrently([viewport for viewport in stale if viewport.mode == RasterMode.RAYTRACE])
+            for viewport in self.viewports:
+                viewport.update()
+            if self.onFlush is not None:
+                self.onFlush(changed)
+
+    # Raytraces several viewports at once, a single viewport simply renders when it is painted
+    #     NumPy releases the GIL in its array operations, compiled kernel launches are serialized
+    #     by kernels.py but are parallel themselves
+    def render_concurrently(self, viewports):
+        if len(viewports) < 2:
+            return
+        if self.pool is None:
+            kernels.start_threads()
+            self.pool = ThreadPoolExecutor(VIEWPORT_RENDER_WORKERS, thread_name_prefix="viewport")
+        with tracing.span("render_concurrently", "schedule", viewports=len(viewports)):
+            for future in [self.pool.submit(viewport.render_raytrace) for viewport in viewports]:
+                future.result()
+        self.concurrent += 1
+
+    # Removes a viewport that is no longer rendered
+    def forget(self, viewport):
+        self.cameraVersions.pop(viewport, None)
+        self.renderedVersions.pop(viewport, None)
+        self.forced.discard(viewport)
+
+    # Returns counters describing how render requests were handled
+    def stats(self):
+        return {
+            "requested": self.requested,
+            "rendered": self.rendered,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "concurrent": self.concurrent,
+            "viewports": len(self.viewports),
+            "sceneVersion": self.sceneVersion,
+            "cameraVersion": self.cameraVersion
+        }
+
+# Owns the objects and camera being edited and announces every change made to them
+#     widgets edit objects in place and then report the change here, so that every subscriber
+#     only updates the part of the UI the change affects
+class CubeTeaSceneModel(QtCore.QObject):
+    # index of an object appended to the scene
+    objectAdded = QtCore.Signal(int)
+    # index the removed object had in the scene
+    objectRemoved = QtCore.Signal(int)
+    # index of the edited object and the edited property ("name", "pos", "rot", "quat", "color", "dims", "rad")
+    propertyChanged = QtCore.Signal(int, str)
+    # indices of objects edited together (group transforms) and the edited properties, sent once per edit
+    propertiesChanged = QtCore.Signal(list, list)
+    # whether the camera moved because of interactive input
+    cameraChanged = QtCore.Signal(bool)
+    # every object (and possibly the cameras) was replaced
+    sceneReset = QtCore.Signal()
+    # index of a camera appended to the scene
+    cameraAdded = QtCore.Signal(int)
+    # index the removed camera had in the scene
+    cameraRemoved = QtCore.Signal(int)
+
+    def __init__(self, objs, camera, parent=None):
+        super().__init__(parent)
+        self.objs = objs
+        # one camera per viewport, camera is the one camera controls apply to
+        self.cameras = [camera]
+        self.camera = camera
+        # built by the first spatial query, then kept up to date by every edit
+        self.index = None
+
+    # Spatial index of the objects for range, nearest-object and overlap queries (see spatial.py)
+    def spatial_index(self):
+        if self.index is None:
+            with tracing.span("scene.spatial_index", "scene", objects=len(self.objs)):
+                self.index = SpatialIndex(self.objs)
+        return self.index
+
+    # Subscribers run inside the mutation spans, so traces show what each change cost the UI
+    def add(self, obj):
+        with tracing.span("scene.add", "scene", objects=len(self.objs)):
+            self.objs.append(obj)
+            if self.index is not None:
+                self.index.add(len(self.objs) - 1)
+            self.objectAdded.emit(len(self.objs) - 1)
+
+    def remove(self, idx):
+        with tracing.span("scene.remove", "scene", objects=len(self.objs), idx=idx):
+            del self.objs[idx]
+            if self.index is not None:
+                self.index.remove(idx)
+            self.objectRemoved.emit(idx)
+
+    def property_changed(self, idx, name):
+        with tracing.span("scene.property_changed", "scene", objects=len(self.objs), idx=idx, property=name):
+            if self.index is not None and name in BOUNDS_PROPERTIES:
+                self.index.update(idx)
+            self.propertyChanged.emit(idx, name)
+
+    def properties_changed(self, idxs, names):
+        with tracing.span("scene.properties_changed", "scene", objects=len(self.objs), edited=len(idxs),
+                          properties=",".join(names)):
+            if self.index is not None and any(name in BOUNDS_PROPERTIES for name in names):
+                self.index.update(idxs)
+            self.propertiesChanged.emit(idxs, names)
+
+    def camera_changed(self, interactive=False):
+        with tracing.span("scene.camera_changed", "scene", objects=len(self.objs), interactive=interactive):
+            self.cameraChanged.emit(interactive)
+
+    def add_camera(self, camera):
+        self.cameras.append(camera)
+        self.cameraAdded.emit(len(self.cameras) - 1)
+
+    def remove_camera(self, idx):
+        del self.cameras[idx]
+        self.cameraRemoved.emit(idx)
+
+    # Replaces every object, and the cameras if new_cameras is given
+    def reset(self, objs, new_cameras=None):
+        if new_cameras is not None:
+            # existing cameras take the new poses, so viewports keep their camera where they can
+            for camera, new_camera in zip(self.cameras, new_cameras):
+                camera.position = new_camera.position
+                camera.dims = new_camera.dims
+                camera.vdims = new_camera.vdims
+                camera.quaternion = new_camera.quaternion
+            self.cameras[len(new_cameras):] = []
+            self.cameras.extend(new_cameras[len(self.cameras):])
+        # widgets hold on to the objs list itself, so it is refilled rather than replaced
+        with tracing.span("scene.reset", "scene", objects=len(objs)):
+            self.objs[:] = objs
+            # the next spatial query indexes the new objects
+            self.index = None
+            self.sceneReset.emit()
+
 class DoubleValidator(QtGui.QDoubleValidator):
     def validate(self, arg__1, arg__2):
         if (len(arg__1) == 1 and arg__1 == '-'):
@@ -139,12 +627,17 @@ class DoubleValidator(QtGui.QDoubleValidator):
 
 # Object editing component
 class CubeTeaInspectorWidget(QtWidgets.QWidget):
-    def __init__(self, objs, idx):
+    def __init__(self, scene, idx):
         super().__init__()
         self.idx = idx
-        self.objs = objs
+        self.scene = scene
+        self.objs = scene.objs
         self.init = True
         self.allowPropertyCallbacks = True
+        # set while this inspector reports its own edit, so the edited field is not rewritten
+        self.editing = False
+        scene.propertyChanged.connect(self.on_property_changed)
+        scene.propertiesChanged.connect(self.on_properties_changed)
 
     def init_inspector(self):
         self.nameLineEdit = QtWidgets.QLineEdit("")
@@ -327,19 +820,14 @@ class CubeTeaInspectorWidget(QtWidgets.QWidget):
         self.radiusEdit.hide()
         self.allowPropertyCallbacks = True
 
-    def update_inspector(self):
-
-        focus = self.objs[self.idx]
-        self.nameLineEdit.setText(focus.name)
-
+    def show_position(self, focus):
         pos = np.round(focus.position, decimals=4)
         self.positionXEdit.setText(str(pos[0]))
         self.positionYEdit.setText(str(pos[1]))
         self.positionZEdit.setText(str(pos[2]))
 
-        euler = focus.get_euler()
-
-        rot = np.round(euler, decimals=4)
+    def show_rotation(self, focus):
+        rot = np.round(focus.get_euler(), decimals=4)
         self.rotationXEdit.setText(str(rot[0]))
         self.rotationYEdit.setText(str(rot[1]))
         self.rotationZEdit.setText(str(rot[2]))
@@ -350,15 +838,29 @@ class CubeTeaInspectorWidget(QtWidgets.QWidget):
         self.quaternionYEdit.setText(str(rot2[2]))
         self.quaternionZEdit.setText(str(rot2[3]))
 
+    def show_color(self, focus):
         self.colorREdit.setText(str(focus.color[0]))
         self.colorGEdit.setText(str(focus.color[1]))
         self.colorBEdit.setText(str(focus.color[2]))
 
+    def show_dims(self, focus):
+        dims = np.round(focus.dims, decimals=4)
+        self.dimensionXEdit.setText(str(dims[0]))
+        self.dimensionYEdit.setText(str(dims[1]))
+        self.dimensionZEdit.setText(str(dims[2]))
+
+    # Rewrites every field, only needed when the focus moves to another object
+    def update_inspector(self):
+        focus = self.objs[self.idx]
+        # filling in the fields must not write rounded values back into the object
+        self.allowPropertyCallbacks = False
+        self.nameLineEdit.setText(focus.name)
+        self.show_position(focus)
+        self.show_rotation(focus)
+        self.show_color(focus)
+
         if isinstance(focus, Box):
-            dims = np.round(focus.dims, decimals=4)
-            self.dimensionXEdit.setText(str(dims[0]))
-            self.dimensionYEdit.setText(str(dims[1]))
-            self.dimensionZEdit.setText(str(dims[2]))
+            self.show_dims(focus)
             self.layout().addWidget(self.dimensionLabel, 5, 0)
             self.layout().addWidget(self.dimensionXEdit, 5, 1)
             self.layout().addWidget(self.dimensionYEdit, 5, 2)
@@ -388,6 +890,32 @@ class CubeTeaInspectorWidget(QtWidgets.QWidget):
             self.layout().removeWidget(self.radiusEdit)
             self.radiusLabel.hide()
             self.radiusEdit.hide()
+        self.allowPropertyCallbacks = True
+
+    # Refreshes only the fields showing the edited property, and only if the focused object was edited
+    def on_property_changed(self, idx, name):
+        if idx != self.idx or self.init or self.editing:
+            return
+        focus = self.objs[idx]
+        self.allowPropertyCallbacks = False
+        if name == "name":
+            self.nameLineEdit.setText(focus.name)
+        elif name == "pos":
+            self.show_position(focus)
+        elif name == "rot" or name == "quat":
+            self.show_rotation(focus)
+        elif name == "color":
+            self.show_color(focus)
+        elif name == "dims":
+            self.show_dims(focus)
+        elif name == "rad":
+            self.radiusEdit.setText(str(round(focus.radius, 5)))
+        self.allowPropertyCallbacks = True
+
+    def on_properties_changed(self, idxs, names):
+        if self.idx in idxs:
+            for name in names:
+                self.on_property_changed(self.idx, name)
 
     def on_obj_entry_clicked(self, idx):
         prev_idx = self.idx
@@ -400,78 +928,78 @@ class CubeTeaInspectorWidget(QtWidgets.QWidget):
         elif not self.init:
             self.default_inspector()
 
-    def on_item_name_changed(self):
-        if self.idx != -1:
-            self.update_inspector()
-        else:
-            self.default_inspector()
-
     def on_item_name_changed_rev(self, text):
-        if self.idx != -1:
+        if self.idx != -1 and self.allowPropertyCallbacks:
             self.objs[self.idx].name = text
-            self.parentWidget().on_item_name_changed_rev(self.idx)
+            self.report_change("name")
+
+    def report_change(self, name):
+        self.editing = True
+        self.scene.property_changed(self.idx, name)
+        self.editing = False
 
     def on_item_property_change(self, tag, idx=-1):
         def inner_callback(text):
-            if text == "" or text == "-" or not self.allowPropertyCallbacks:
-                return
-            obj = self.objs[self.idx]
-            if tag == "pos":
-                obj.position[idx] = float(text)
-            elif tag == "rot":
-                euler = obj.get_euler()
-                euler[idx] = float(text)
-                obj.set_euler(np.array(euler))
-                rot2 = np.round(obj.quaternion, decimals=4)
-
-                self.quaternionWEdit.textChanged.disconnect()
-                self.quaternionWEdit.setText(str(rot2[0]))
-                self.quaternionWEdit.textChanged.connect(self.on_item_property_change("quat", 0))
-
-                self.quaternionXEdit.textChanged.disconnect()
-                self.quaternionXEdit.setText(str(rot2[1]))
-                self.quaternionXEdit.textChanged.connect(self.on_item_property_change("quat", 1))
-
-                self.quaternionYEdit.textChanged.disconnect()
-                self.quaternionYEdit.setText(str(rot2[2]))
-                self.quaternionYEdit.textChanged.connect(self.on_item_property_change("quat", 2))
-
-                self.quaternionZEdit.textChanged.disconnect()
-                self.quaternionZEdit.setText(str(rot2[3]))
-                self.quaternionZEdit.textChanged.connect(self.on_item_property_change("quat", 3))
-            elif tag == "quat":
-                obj.quaternion[idx] = float(text)
-                rot = np.round(obj.get_euler(), decimals=4)
-
-                self.rotationXEdit.textChanged.disconnect()
-                self.rotationXEdit.setText(str(rot[0]))
-                self.rotationXEdit.textChanged.connect(self.on_item_property_change("rot", 0))
-
-                self.rotationYEdit.textChanged.disconnect()
-                self.rotationYEdit.setText(str(rot[1]))
-                self.rotationYEdit.textChanged.connect(self.on_item_property_change("rot", 1))
-
-                self.rotationZEdit.textChanged.disconnect()
-                self.rotationZEdit.setText(str(rot[2]))
-                self.rotationZEdit.textChanged.connect(self.on_item_property_change("rot", 2))
-            elif tag == "color":
-                obj.color[idx] = int(text)
-                obj.update_colors()
-            elif tag == "dims":
-                obj.dims[idx] = float(text)
-            elif tag == "rad":
-                obj.radius = float(text)
-            self.parentWidget().update_render()
+            with tracing.span("on_item_property_change", "input", property=tag):
+                if text == "" or text == "-" or not self.allowPropertyCallbacks:
+                    return
+                obj = self.objs[self.idx]
+                if tag == "pos":
+                    obj.position[idx] = float(text)
+                elif tag == "rot":
+                    euler = obj.get_euler()
+                    euler[idx] = float(text)
+                    obj.set_euler(np.array(euler))
+                    rot2 = np.round(obj.quaternion, decimals=4)
+
+                    self.quaternionWEdit.textChanged.disconnect()
+                    self.quaternionWEdit.setText(str(rot2[0]))
+                    self.quaternionWEdit.textChanged.connect(self.on_item_property_change("quat", 0))
+
+                    self.quaternionXEdit.textChanged.disconnect()
+                    self.quaternionXEdit.setText(str(rot2[1]))
+                    self.quaternionXEdit.textChanged.connect(self.on_item_property_change("quat", 1))
+
+                    self.quaternionYEdit.textChanged.disconnect()
+                    self.quaternionYEdit.setText(str(rot2[2]))
+                    self.quaternionYEdit.textChanged.connect(self.on_item_property_change("quat", 2))
+
+                    self.quaternionZEdit.textChanged.disconnect()
+                    self.quaternionZEdit.setText(str(rot2[3]))
+                    self.quaternionZEdit.textChanged.connect(self.on_item_property_change("quat", 3))
+                elif tag == "quat":
+                    obj.quaternion[idx] = float(text)
+                    rot = np.round(obj.get_euler(), decimals=4)
+
+                    self.rotationXEdit.textChanged.disconnect()
+                    self.rotationXEdit.setText(str(rot[0]))
+                    self.rotationXEdit.textChanged.connect(self.on_item_property_change("rot", 0))
+
+                    self.rotationYEdit.textChanged.disconnect()
+                    self.rotationYEdit.setText(str(rot[1]))
+                    self.rotationYEdit.textChanged.connect(self.on_item_property_change("rot", 1))
+
+                    self.rotationZEdit.textChanged.disconnect()
+                    self.rotationZEdit.setText(str(rot[2]))
+                    self.rotationZEdit.textChanged.connect(self.on_item_property_change("rot", 2))
+                elif tag == "color":
+                    obj.color[idx] = int(text)
+                    obj.update_colors()
+                elif tag == "dims":
+                    obj.dims[idx] = float(text)
+                elif tag == "rad":
+                    obj.radius = float(text)
+                self.report_change(tag)
         return inner_callback
 
     def get_pivot(self):
         return self.idx
 
 class CubeTeaInspectorDockWidget(QtWidgets.QDockWidget):
-    def __init__(self, objs, idx=-1):
+    def __init__(self, scene, idx=-1):
         super().__init__()
         self.setWindowTitle("Inspector - Nothing Focused")
-        self.inspector = CubeTeaInspectorWidget(objs, idx=idx)
+        self.inspector = CubeTeaInspectorWidget(scene, idx=idx)
         self.setWidget(self.inspector)
         self.show()
 
@@ -479,15 +1007,6 @@ class CubeTeaInspectorDockWidget(QtWidgets.QDockWidget):
         self.setWindowTitle("Inspector" if idx != -1 else "Inspector - Nothing Focused")
         self.inspector.on_obj_entry_clicked(idx)
 
-    def on_item_name_changed(self):
-        self.inspector.on_item_name_changed()
-
-    def on_item_name_changed_rev(self, idx):
-        self.parentWidget().on_item_name_changed_rev(idx)
-
-    def update_render(self):
-        self.parentWidget().update_render()
-
     def on_new_object_added(self, idx):
         self.on_obj_entry_clicked(idx)
 
@@ -499,104 +1018,129 @@ class CubeTeaInspectorDockWidget(QtWidgets.QDockWidget):
 
 # Object selection component
 class CubeTeaHierarchyListWidget(QtWidgets.QListView):
-    def __init__(self, objs):
+    def __init__(self, scene):
         super().__init__()
         self.model = QtGui.QStandardItemModel(self)
-        self.objs = objs
-        for obj in objs:
-            symbol = "●" if isinstance(obj, Sphere) else "◼"
-            item = QtGui.QStandardItem("{0} {1}".format(symbol, obj.name))
-            self.model.appendRow(item)
+        self.scene = scene
+        self.objs = scene.objs
+        for obj in self.objs:
+            self.model.appendRow(self.entry(obj))
         self.setModel(self.model)
         self.setViewMode(QtWidgets.QListView.ListMode)
+        self.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
         self.show()
         self.clicked.connect(self.on_obj_entry_clicked)
         self.model.itemChanged.connect(self.on_item_changed)
+        self.selectionModel().selectionChanged.connect(self.on_selection_changed)
         self.allowCallbacks = True
+        scene.objectAdded.connect(self.on_object_added)
+        scene.objectRemoved.connect(self.on_object_removed)
+        scene.propertyChanged.connect(self.on_property_changed)
+        scene.sceneReset.connect(self.on_scene_reset)
+
+    # Hierarchy symbol of an object's type
+    def symbol(self, obj):
+        if isinstance(obj, Instances):
+            return "▦"
+        elif isinstance(obj, Mesh):
+            return "▲"
+        return "●" if isinstance(obj, Sphere) else "◼"
+
+    def entry(self, obj):
+        return QtGui.QStandardItem("{0} {1}".format(self.symbol(obj), obj.name))
 
     def on_obj_entry_clicked(self, index):
         if self.allowCallbacks:
             self.parentWidget().on_obj_entry_clicked(index.row())
 
+    def on_selection_changed(self, selected, deselected):
+        if self.allowCallbacks:
+            rows = sorted(index.row() for index in self.selectionModel().selectedRows())
+            self.parentWidget().on_selection_changed(rows)
+
     def on_item_changed(self, item):
         if self.allowCallbacks:
-            if item.index().row() >= len(self.objs):
+            row = item.index().row()
+            if row >= len(self.objs):
                 return
-            obj = self.objs[item.index().row()]
-            symbol = "● " if isinstance(obj, Sphere) else "◼ "
+            obj = self.objs[row]
+            symbol = self.symbol(obj) + " "
             if len(item.text()) >= 2 and item.text()[0:2] == symbol:
                 obj.name = item.text()[2:]
             else:
+                # replacing the entry deletes item
                 obj.name = ""
-                self.model.setItem(item.index().row(), 0, QtGui.QStandardItem(symbol))
-            self.parentWidget().on_item_name_changed()
-
-    def on_item_changed_rev(self, idx):
-        symbol = "● " if isinstance(self.objs[idx], Sphere) else "◼ "
-        self.model.setItem(idx, 0, QtGui.QStandardItem(symbol + self.objs[idx].name))
+                self.model.setItem(row, 0, QtGui.QStandardItem(symbol))
+            self.allowCallbacks = False
+            self.scene.property_changed(row, "name")
+            self.allowCallbacks = True
+
+    # Only the entry of a renamed object is rewritten
+    def on_property_changed(self, idx, name):
+        if name == "name" and self.allowCallbacks:
+            self.allowCallbacks = False
+            self.model.setItem(idx, 0, self.entry(self.objs[idx]))
+            self.allowCallbacks = True
+
+    def on_object_added(self, idx):
+        self.allowCallbacks = False
+        self.model.insertRow(idx, self.entry(self.objs[idx]))
+        self.allowCallbacks = True
 
-    def on_new_object_added(self):
+    def on_object_removed(self, idx):
         self.allowCallbacks = False
-        self.model.clear()
-        for obj in self.objs:
-            symbol = "●" if isinstance(obj, Sphere) else "◼"
-            item = QtGui.QStandardItem("{0} {1}".format(symbol, obj.name))
-            self.model.appendRow(item)
+        self.clearSelection()
+        self.model.removeRow(idx)
         self.allowCallbacks = True
 
-    def on_current_object_deleted(self):
+    def on_scene_reset(self):
         self.allowCallbacks = False
         self.model.clear()
         for obj in self.objs:
-            symbol = "●" if isinstance(obj, Sphere) else "◼"
-            item = QtGui.QStandardItem("{0} {1}".format(symbol, obj.name))
-            self.model.appendRow(item)
+            self.model.appendRow(self.entry(obj))
         self.allowCallbacks = True
 
+    # Replaces the selection with the entries of objects idxs, runs of consecutive entries are selected as ranges
+    def select(self, idxs):
+        selection = QtCore.QItemSelection()
+        idxs = np.asarray(idxs, dtype=int)
+        for run in np.split(idxs, np.flatnonzero(np.diff(idxs) != 1) + 1) if len(idxs) > 0 else []:
+            selection.select(self.model.index(int(run[0]), 0), self.model.index(int(run[-1]), 0))
+        self.selectionModel().select(selection, QtCore.QItemSelectionModel.ClearAndSelect)
+
 class CubeTeaHierarchyDockWidget(QtWidgets.QDockWidget):
-    def __init__(self, objs):
+    def __init__(self, scene):
         super().__init__()
         self.setWindowTitle("Object List")
-        self.hierarchy = CubeTeaHierarchyListWidget(objs=objs)
+        self.hierarchy = CubeTeaHierarchyListWidget(scene)
         self.setWidget(self.hierarchy)
         self.show()
 
     def on_obj_entry_clicked(self, idx):
         self.parentWidget().on_obj_entry_clicked(idx)
 
-    def on_item_name_changed(self):
-        self.parentWidget().on_item_name_changed()
-
-    def on_item_name_changed_rev(self, idx):
-        self.hierarchy.on_item_changed_rev(idx)
+    def on_selection_changed(self, idxs):
+        self.parentWidget().on_selection_changed(idxs)
 
-    def on_new_object_added(self):
-        self.hierarchy.on_new_object_added()
-
-    def on_current_object_deleted(self):
-        self.hierarchy.on_current_object_deleted()
+    def select(self, idxs):
+        self.hierarchy.select(idxs)
 
 # Object addition/removal component
 class CubeTeaHierarchyMenuDockWidget(QtWidgets.QDockWidget):
-    def __init__(self, objs):
+    def __init__(self, scene):
         super().__init__()
         self.setWindowTitle("List Actions")
-        self.hierarchyMenu = CubeTeaHierarchyMenuWidget(objs)
+        self.hierarchyMenu = CubeTeaHierarchyMenuWidget(scene)
         self.setWidget(self.hierarchyMenu)
 
-    def on_new_object_added(self):
-        self.parentWidget().on_new_object_added()
-
     def on_obj_entry_clicked(self, idx):
         self.hierarchyMenu.on_obj_entry_clicked(idx)
 
-    def on_current_object_deleted(self):
-        self.parentWidget().on_current_object_deleted()
-
 class CubeTeaHierarchyMenuWidget(QtWidgets.QWidget):
-    def __init__(self, objs):
+    def __init__(self, scene):
         super().__init__()
-        self.objs = objs
+        self.scene = scene
+        self.objs = scene.objs
         self.idx = -1
         gridLayout = QtWidgets.QGridLayout()
         self.addBoxButton = QtWidgets.QPushButton("&Add Box", self)
@@ -607,13 +1151,18 @@ class CubeTeaHierarchyMenuWidget(QtWidgets.QWidget):
         self.addSphereButton.setFixedHeight(30)
         self.addSphereButton.setContentsMargins(30, 5, 30, 5)
         self.addSphereButton.clicked.connect(self.add_sphere)
+        self.importMeshButton = QtWidgets.QPushButton("&Import Mesh", self)
+        self.importMeshButton.setFixedHeight(30)
+        self.importMeshButton.setContentsMargins(30, 5, 30, 5)
+        self.importMeshButton.clicked.connect(self.on_import_mesh)
         self.deleteButton = QtWidgets.QPushButton("&Delete", self)
         self.deleteButton.setFixedHeight(30)
         self.deleteButton.setContentsMargins(30, 5, 30, 5)
         self.deleteButton.clicked.connect(self.delete_current)
         gridLayout.addWidget(self.addBoxButton, 0, 0)
         gridLayout.addWidget(self.addSphereButton, 0, 1)
-        gridLayout.addWidget(self.deleteButton, 0, 2)
+        gridLayout.addWidget(self.importMeshButton, 0, 2)
+        gridLayout.addWidget(self.deleteButton, 0, 3)
         self.setLayout(gridLayout)
 
     def on_obj_entry_clicked(self, idx):
@@ -632,32 +1181,191 @@ class CubeTeaHierarchyMenuWidget(QtWidgets.QWidget):
                 primitives["Sphere"] += 1
         return primitives
 
+    # World position distance along the camera ray, mapped from camera space like camera translation
+    def in_front(self, distance):
+        camera = self.scene.camera
+        return camera.position + camera.basis().T @ np.array([0, distance, 0])
+
     def add_box(self):
+        camera = self.scene.camera
         new_name = "box{0}".format(self.get_primitive_count()["Box"] + 1)
-        box = Box(position=camera.position.copy() + camera.basis().copy() @ np.array([0, 2, 0]),
+        box = Box(position=self.in_front(2),
                   quaternion=camera.quaternion.copy(), name=new_name)
-        self.objs.append(box)
-        self.parentWidget().on_new_object_added()
+        self.scene.add(box)
 
     def add_sphere(self):
+        camera = self.scene.camera
         new_name = "sphere{0}".format(self.get_primitive_count()["Sphere"] + 1)
-        sphere = Sphere(position=camera.position.copy() + camera.basis().copy() @ np.array([0, 2, 0]),
+        sphere = Sphere(position=self.in_front(2),
                         quaternion=camera.quaternion.copy(), name=new_name)
-        self.objs.append(sphere)
-        self.parentWidget().on_new_object_added()
+        self.scene.add(sphere)
+
+    def on_import_mesh(self):
+        mesh_file = QtWidgets.QFileDialog.getOpenFileName(self,
+                    self.tr("Import Mesh"), "~/", self.tr("Mesh Files (*.obj *.ply *.npy)"))
+        if mesh_file[0] != "":
+            # a binary dump is picked through one of its .npy files
+            path = os.path.dirname(mesh_file[0]) if mesh_file[0].endswith(".npy") else mesh_file[0]
+            self.import_mesh(path)
+
+    # Imports a mesh and places it in front of the camera, returns None if the file cannot be read
+    def import_mesh(self, path):
+        camera = self.scene.camera
+        try:
+            mesh = Mesh(path, name=os.path.splitext(os.path.basename(path))[0])
+        except (OSError, ValueError, KeyError, IndexError):
+            return None
+        mesh.position = self.in_front(2 + mesh.bounding_radius())
+        mesh.quaternion = camera.quaternion.copy()
+        self.scene.add(mesh)
+        return mesh
 
     def delete_current(self):
         if self.idx != -1 and self.idx < len(self.objs):
-            del self.objs[self.idx]
-            self.parentWidget().on_current_object_deleted()
+            idx = self.idx
             self.idx = -1
+            self.scene.remove(idx)
+
+# Group transform component, moves or rotates every selected object at once
+class CubeTeaGroupDockWidget(QtWidgets.QDockWidget):
+    def __init__(self, scene):
+        super().__init__()
+        self.setWindowTitle("Group Transform - Nothing Selected")
+        self.group = CubeTeaGroupWidget(scene)
+        self.setWidget(self.group)
+        self.show()
+
+    def on_selection_changed(self, idxs):
+        self.setWindowTitle("Group Transform - {0} Selected".format(len(idxs)) if len(idxs) > 0
+                            else "Group Transform - Nothing Selected")
+        self.group.on_selection_changed(idxs)
+
+class CubeTeaGroupWidget(QtWidgets.QWidget):
+    def __init__(self, scene):
+        super().__init__()
+        self.scene = scene
+        self.objs = scene.objs
+        self.idxs = []
+        gridLayout = QtWidgets.QGridLayout()
+        doubleValidator = DoubleValidator(bottom=sys.float_info.min, decimals=4, top=sys.float_info.max)
+
+        self.translationLabel = QtWidgets.QLabel(self.tr("&Translate:"))
+        self.translationEdits = []
+        for i in range(3):
+            edit = QtWidgets.QLineEdit("0")
+            edit.setValidator(doubleValidator)
+            edit.setFixedWidth(80)
+            gridLayout.addWidget(edit, 0, i + 1)
+            self.translationEdits.append(edit)
+        self.translationLabel.setBuddy(self.translationEdits[0])
+
+        self.rotationLabel = QtWidgets.QLabel(self.tr("&Rotate (deg):"))
+        self.rotationEdits = []
+        for i in range(3):
+            edit = QtWidgets.QLineEdit("0")
+            edit.setValidator(doubleValidator)
+            edit.setFixedWidth(80)
+            gridLayout.addWidget(edit, 1, i + 1)
+            self.rotationEdits.append(edit)
+        self.rotationLabel.setBuddy(self.rotationEdits[0])
+
+        self.applyButton = QtWidgets.QPushButton("&Apply", self)
+        self.applyButton.setFixedHeight(30)
+        self.applyButton.setContentsMargins(30, 5, 30, 5)
+        self.applyButton.clicked.connect(self.apply)
+        self.applyButton.setEnabled(False)
+
+        gridLayout.addWidget(self.translationLabel, 0, 0)
+        gridLayout.addWidget(self.rotationLabel, 1, 0)
+        gridLayout.addWidget(self.applyButton, 2, 3)
+        self.setLayout(gridLayout)
+
+    def on_selection_changed(self, idxs):
+        self.idxs = [idx for idx in idxs if idx < len(self.objs)]
+        self.applyButton.setEnabled(len(self.idxs) > 0)
+
+    # Translates, then rotates the selection around its centroid
+    def apply(self):
+        if len(self.idxs) == 0:
+            return
+        read = lambda edit: float(edit.text()) if edit.text() not in ["", "-"] else 0.0
+        delta = np.array([read(edit) for edit in self.translationEdits])
+        angles = np.array([read(edit) for edit in self.rotationEdits]) / quaternions.DPR
+        names = []
+        if np.any(delta != 0):
+            translate_group(self.objs, self.idxs, delta)
+            names.append("pos")
+        if np.any(angles != 0):
+            rotation = np.array([[1.0, 0, 0, 0]])
+            for axis, angle in zip(np.eye(3), angles):
+                if angle != 0:
+                    rotation = quaternions.multiply(rotation, quaternions.from_axis_angle(axis, angle))
+            pivot = np.mean([self.objs[idx].position for idx in self.idxs], axis=0)
+            rotate_group(self.objs, self.idxs, rotation[0], pivot)
+            names = ["pos", "quat"]
+        # one change for the whole group, so subscribers do not update once per object
+        if len(names) > 0:
+            self.scene.properties_changed(list(self.idxs), names)
+
+# Render profiler component, shows what each object costs a full resolution raytrace of the view
+class CubeTeaProfileDockWidget(QtWidgets.QDockWidget):
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Render Profile")
+        self.profiler = CubeTeaProfileWidget()
+        self.setWidget(self.profiler)
+        self.show()
+
+    def profile_frame(self):
+        self.parentWidget().profile_frame()
+
+    def show_profile(self, profile):
+        self.profiler.show_profile(profile)
+
+class CubeTeaProfileWidget(QtWidgets.QWidget):
+    def __init__(self):
+        super().__init__()
+        gridLayout = QtWidgets.QGridLayout()
+        self.profileButton = QtWidgets.QPushButton("&Profile Frame", self)
+        self.profileButton.setFixedHeight(30)
+        self.profileButton.setContentsMargins(30, 5, 30, 5)
+        self.profileButton.clicked.connect(self.profile_frame)
+        self.summaryLabel = QtWidgets.QLabel(self.tr("No frame profiled yet"))
+        self.table = QtWidgets.QTableWidget(0, len(PROFILE_COLUMNS), self)
+        self.table.setHorizontalHeaderLabels([column[0] for column in PROFILE_COLUMNS])
+        self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.table.setSortingEnabled(True)
+        gridLayout.addWidget(self.profileButton, 0, 0)
+        gridLayout.addWidget(self.summaryLabel, 0, 1)
+        gridLayout.addWidget(self.table, 1, 0, 1, 2)
+        self.setLayout(gridLayout)
+
+    def profile_frame(self):
+        self.parentWidget().profile_frame()
+
+    def show_profile(self, profile):
+        stats = profile.stats()
+        self.summaryLabel.setText("{0} rays, {1:.1%} background, {2:.2f} tests per ray, {3:.1f} ms".format(
+            stats["rays"], stats["backgroundShare"], stats["testsPerRay"], 1000 * stats["seconds"]))
+        rows = profile.rows()
+        # rows must not move while they are being filled
+        self.table.setSortingEnabled(False)
+        self.table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            for j, (_, key, factor) in enumerate(PROFILE_COLUMNS):
+                value = row[key] if factor is None else round(factor * row[key], 4)
+                item = QtWidgets.QTableWidgetItem()
+                # values are stored as numbers so that columns sort numerically
+                item.setData(QtCore.Qt.DisplayRole, value)
+                self.table.setItem(i, j, item)
+        self.table.setSortingEnabled(True)
 
 # Camera control component
 class CubeTeaCameraDockWidget(QtWidgets.QDockWidget):
-    def __init__(self, objs, camera):
+    def __init__(self, scene):
         super().__init__()
         self.setWindowTitle("Camera Controls")
-        self.controls = CubeTeaCameraWidget(objs, camera)
+        self.controls = CubeTeaCameraWidget(scene)
         self.setWidget(self.controls)
         self.show()
 
@@ -670,15 +1378,30 @@ class CubeTeaCameraDockWidget(QtWidgets.QDockWidget):
     def toggle_raster(self, mode):
         return self.parentWidget().toggle_raster(mode)
 
+    def toggle_antialias(self, enabled):
+        return self.parentWidget().toggle_antialias(enabled)
+
+    def toggle_full_detail(self, enabled):
+        return self.parentWidget().toggle_full_detail(enabled)
+
     def reset_pivot(self):
         return self.controls.reset_pivot()
 
+    def add_view(self, view):
+        return self.parentWidget().add_view(view)
+
+    def remove_view(self):
+        return self.parentWidget().remove_view()
+
+    def show_viewport(self, viewport):
+        return self.controls.show_viewport(viewport)
+
 class CubeTeaCameraWidget(QtWidgets.QWidget):
-    def __init__(self, objs, camera):
+    def __init__(self, scene):
         super().__init__()
         gridLayout = QtWidgets.QGridLayout()
-        self.objs = objs
-        self.camera = camera
+        self.scene = scene
+        self.objs = scene.objs
         self.pivot = None
 
         self.upButton = QtWidgets.QPushButton("&Up", self)
@@ -752,10 +1475,26 @@ class CubeTeaCameraWidget(QtWidgets.QWidget):
         self.rasterModeBox = QtWidgets.QCheckBox("Use Raytracing", self)
         self.rasterModeBox.setCheckState(QtCore.Qt.Unchecked)
         self.rasterModeBox.stateChanged.connect(self.handle_camera_input("misc", "raster"))
+        self.antialiasBox = QtWidgets.QCheckBox("Anti-aliasing", self)
+        self.antialiasBox.setCheckState(QtCore.Qt.Unchecked)
+        self.antialiasBox.stateChanged.connect(self.handle_camera_input("misc", "antialias"))
+        self.fullDetailBox = QtWidgets.QCheckBox("Full Detail", self)
+        self.fullDetailBox.setCheckState(QtCore.Qt.Unchecked)
+        self.fullDetailBox.stateChanged.connect(self.handle_camera_input("misc", "detail"))
         self.pivotButton = QtWidgets.QPushButton("&Pivot", self)
         self.pivotButton.setFixedHeight(30)
         self.pivotButton.setContentsMargins(30, 5, 30, 5)
         self.pivotButton.clicked.connect(self.handle_camera_input("misc", "pivot"))
+        self.viewBox = QtWidgets.QComboBox(self)
+        self.viewBox.addItems(list(VIEW_ROTATIONS))
+        self.addViewButton = QtWidgets.QPushButton("&Add View", self)
+        self.addViewButton.setFixedHeight(30)
+        self.addViewButton.setContentsMargins(30, 5, 30, 5)
+        self.addViewButton.clicked.connect(self.handle_camera_input("misc", "addView"))
+        self.removeViewButton = QtWidgets.QPushButton("Remove View", self)
+        self.removeViewButton.setFixedHeight(30)
+        self.removeViewButton.setContentsMargins(30, 5, 30, 5)
+        self.removeViewButton.clicked.connect(self.handle_camera_input("misc", "removeView"))
 
         self.translationLabel = QtWidgets.QLabel(self.tr("Translation"))
         self.rotationLabel = QtWidgets.QLabel(self.tr("Rotation"))
@@ -786,65 +1525,112 @@ class CubeTeaCameraWidget(QtWidgets.QWidget):
         gridLayout.addWidget(self.miscLabel, 6, 1)
         gridLayout.addWidget(self.resetButton, 7, 0)
         gridLayout.addWidget(self.rasterModeBox, 7, 1)
+        gridLayout.addWidget(self.antialiasBox, 8, 1)
+        gridLayout.addWidget(self.fullDetailBox, 8, 0)
         gridLayout.addWidget(self.pivotButton, 7, 2)
+        gridLayout.addWidget(self.viewBox, 9, 0)
+        gridLayout.addWidget(self.addViewButton, 9, 1)
+        gridLayout.addWidget(self.removeViewButton, 9, 2)
 
         self.setLayout(gridLayout)
 
     def handle_camera_input(self, tag1, tag2):
         def inner_callback():
-            camera = self.camera
-            if tag1 == "translate":
-                delta = [0, 0, 0]
-                if tag2 == "up":
-                    delta[2] = -1
-                elif tag2 == "down":
-                    delta[2] = 1
-                elif tag2 == "forward":
-                    delta[1] = 1
-                elif tag2 == "backward":
-                    delta[1] = -1
-                elif tag2 == "right":
-                    delta[0] = 1
-                elif tag2 == "left":
-                    delta[0] = -1
-                camera.position = camera.position.copy() + TRANSLATION_STEP * (camera.basis().copy() @ np.array(delta))
-                self.parentWidget().update_render()
-            elif tag1 == "rotation":
-                delta = [0, 0, 0]
-                if tag2 == "rollR":
-                    delta[1] = 1
-                elif tag2 == "rollL":
-                    delta[1] = -1
-                elif tag2 == "pitchU":
-                    delta[0] = -1
-                elif tag2 == "pitchD":
-                    delta[0] = 1
-                elif tag2 == "yawR":
-                    delta[2] = -1
-                elif tag2 == "yawL":
-                    delta[2] = 1
-                pivotPos = self.pivot.position if self.pivot is not None else None
-                camera.rotate(rot_quat(np.array(delta), ROTATION_STEP), pivot=pivotPos)
-                self.parentWidget().update_render()
-            elif tag1 == "misc":
-                if tag2 == "reset":
-                    camera.position = np.array([0, -1, 0])
-                    camera.quaternion = np.array([0, 0, 1, 0])
-                    self.parentWidget().update_render()
-                elif tag2 == "raster":
-                    if self.rasterModeBox.isChecked():
-                        self.parentWidget().toggle_raster(RasterMode.RAYTRACE)
-                    else:
-                        self.parentWidget().toggle_raster(RasterMode.FRAME)
-                elif tag2 == "pivot":
-                    pivotIdx = self.parentWidget().get_pivot()
-                    self.pivot = self.objs[pivotIdx] if pivotIdx != -1 else None
-                    self.parentWidget().update_render(False)
+            with tracing.span("handle_camera_input", "input", action=tag2):
+                # the camera of the active viewport
+                camera = self.scene.camera
+                if tag1 == "translate":
+                    delta = [0, 0, 0]
+                    if tag2 == "up":
+                        delta[2] = -1
+                    elif tag2 == "down":
+                        delta[2] = 1
+                    elif tag2 == "forward":
+                        delta[1] = 1
+                    elif tag2 == "backward":
+                        delta[1] = -1
+                    elif tag2 == "right":
+                        delta[0] = 1
+                    elif tag2 == "left":
+                        delta[0] = -1
+                    # rows of the basis are the camera axes in world space
+                    #     steps of whole pixels let the viewport shift its last raytrace (see Camera.pan_offset)
+                    camera.position = camera.position.copy() + camera.basis().T @ (TRANSLATION_STEP * np.array(delta))
+                    self.scene.camera_changed(interactive=True)
+                elif tag1 == "rotation":
+                    delta = [0, 0, 0]
+                    if tag2 == "rollR":
+                        delta[1] = 1
+                    elif tag2 == "rollL":
+                        delta[1] = -1
+                    elif tag2 == "pitchU":
+                        delta[0] = -1
+                    elif tag2 == "pitchD":
+                        delta[0] = 1
+                    elif tag2 == "yawR":
+                        delta[2] = -1
+                    elif tag2 == "yawL":
+                        delta[2] = 1
+                    pivotPos = self.pivot.position if self.pivot is not None else None
+                    camera.rotate(rot_quat(np.array(delta), ROTATION_STEP), pivot=pivotPos)
+                    self.scene.camera_changed(interactive=True)
+                elif tag1 == "misc":
+                    if tag2 == "reset":
+                        camera.position = np.array([0, -1, 0])
+                        camera.quaternion = np.array([0, 0, 1, 0])
+                        self.scene.camera_changed()
+                    elif tag2 == "raster":
+                        if self.rasterModeBox.isChecked():
+                            self.parentWidget().toggle_raster(RasterMode.RAYTRACE)
+                        else:
+                            self.parentWidget().toggle_raster(RasterMode.FRAME)
+                    elif tag2 == "antialias":
+                        self.parentWidget().toggle_antialias(self.antialiasBox.isChecked())
+                    elif tag2 == "detail":
+                        self.parentWidget().toggle_full_detail(self.fullDetailBox.isChecked())
+                    elif tag2 == "pivot":
+                        pivotIdx = self.parentWidget().get_pivot()
+                        self.pivot = self.objs[pivotIdx] if pivotIdx != -1 else None
+                        self.parentWidget().update_render(False)
+                    elif tag2 == "addView":
+                        self.parentWidget().add_view(self.viewBox.currentText())
+                    elif tag2 == "removeView":
+                        self.parentWidget().remove_view()
         return inner_callback
 
     def reset_pivot(self):
         self.pivot = None
 
+    # Shows the render settings of a newly activated viewport without toggling them again
+    def show_viewport(self, viewport):
+        for box, checked in [(self.rasterModeBox, viewport.mode == RasterMode.RAYTRACE),
+                             (self.antialiasBox, viewport.antialias is not None),
+                             (self.fullDetailBox, viewport.fullDetail)]:
+            box.blockSignals(True)
+            box.setChecked(checked)
+            box.blockSignals(False)
+        self.removeViewButton.setEnabled(len(self.scene.cameras) > 1)
+
+# Reads and parses a saved scene off the GUI thread
+class CubeTeaSceneLoader(QtCore.QThread):
+    loaded = QtCore.Signal(object, object)
+    failed = QtCore.Signal()
+
+    def __init__(self, loc, parent=None):
+        super().__init__(parent)
+        self.loc = loc
+
+    def run(self):
+        try:
+            with open(self.loc, "r") as file_ptr:
+                saveState = json.loads(file_ptr.read())
+            cameras, objs = load_scene(saveState["objs"])
+        # malformed mesh files raise IndexError and others, any failure has to end the restore
+        except Exception:
+            self.failed.emit()
+            return
+        self.loaded.emit(cameras, objs)
+
 # File operation component
 class CubeTeaFileMenuDockWidget(QtWidgets.QDockWidget):
     def __init__(self):
@@ -896,42 +1682,90 @@ class CubeTeaFileMenuWidget(QtWidgets.QWidget):
 
 # Main application
 class CubeTeaWidget(QtWidgets.QMainWindow):
+    # emitted once the startup scene (auto-save or new scene) is in place
+    sceneReady = QtCore.Signal()
+
     def __init__(self, objs, camera=None):
         super().__init__()
 
         self.objs = objs
-        self.camera = Camera() if camera is None else camera
+        self.scene = CubeTeaSceneModel(self.objs, Camera() if camera is None else camera, self)
 
         self.setWindowTitle("CubeTea")
-        self.viewport = CubeTeaRasterWidget(self.objs, self.camera)
-        self.setCentralWidget(self.viewport)
+        # Viewports share finished frames, per scene data and the frame scheduler, so another
+        # viewport only adds its own raytraces
+        self.renderCache = RenderCache()
+        self.sceneCache = SceneCache()
+        self.viewports = []
+        self.viewport = None
+        self.scheduler = CubeTeaFrameScheduler(self.viewports, self.sceneCache, parent=self)
+        self.viewportGrid = QtWidgets.QGridLayout()
+        self.viewportGrid.setContentsMargins(0, 0, 0, 0)
+        self.viewportGrid.setSpacing(2)
+        viewportArea = QtWidgets.QWidget()
+        viewportArea.setLayout(self.viewportGrid)
+        self.setCentralWidget(viewportArea)
 
         # Add left dock widgets
         self.fileMenuDock = CubeTeaFileMenuDockWidget()
         self.addDockWidget(QtCore.Qt.LeftDockWidgetArea, self.fileMenuDock)
-        self.hierarchyMenuDock = CubeTeaHierarchyMenuDockWidget(objs=self.objs)
+        self.hierarchyMenuDock = CubeTeaHierarchyMenuDockWidget(self.scene)
         self.addDockWidget(QtCore.Qt.LeftDockWidgetArea, self.hierarchyMenuDock)
-        self.hierarchyDock = CubeTeaHierarchyDockWidget(objs=self.objs)
+        self.hierarchyDock = CubeTeaHierarchyDockWidget(self.scene)
         self.addDockWidget(QtCore.Qt.LeftDockWidgetArea, self.hierarchyDock)
 
         # Add right dock widgets
-        self.inspectorDock = CubeTeaInspectorDockWidget(objs=self.objs)
+        self.inspectorDock = CubeTeaInspectorDockWidget(self.scene)
         self.addDockWidget(QtCore.Qt.RightDockWidgetArea, self.inspectorDock)
-        self.cameraDock = CubeTeaCameraDockWidget(self.objs, self.camera)
+        self.cameraDock = CubeTeaCameraDockWidget(self.scene)
         self.addDockWidget(QtCore.Qt.RightDockWidgetArea, self.cameraDock)
+        # the group transform and render profile docks are added by init_deferred
+        self.groupDock = None
+        self.profileDock = None
 
         # Status Bar
         self.status = self.statusBar()
         self.status.showMessage("3D viewer initialized")
-
-        self.init_load()
+        # busy indicator shown while the auto-save is restored
+        self.loadIndicator = QtWidgets.QProgressBar()
+        self.loadIndicator.setRange(0, 0)
+        self.loadIndicator.setMaximumWidth(120)
+        self.loadIndicator.hide()
+        self.status.addPermanentWidget(self.loadIndicator)
+        self.restoring = False
+        self.sceneLoader = None
+
+        # One viewport per camera, render requests are coalesced into at most one render per display interval
+        for camera in self.scene.cameras:
+            self.add_viewport(camera)
+        self.activate_viewport(self.viewports[0])
+
+        # Bursts of edits are auto-saved once, after the scene has settled
+        self.autosaveTimer = QtCore.QTimer(self)
+        self.autosaveTimer.setSingleShot(True)
+        self.autosaveTimer.setInterval(AUTOSAVE_DELAY_MS)
+        self.autosaveTimer.timeout.connect(self.autosave)
+
+        self.scene.objectAdded.connect(self.on_object_added)
+        self.scene.objectRemoved.connect(self.on_object_removed)
+        self.scene.propertyChanged.connect(self.on_property_changed)
+        self.scene.propertiesChanged.connect(self.on_properties_changed)
+        self.scene.cameraChanged.connect(self.on_camera_changed)
+        self.scene.sceneReset.connect(self.on_scene_reset)
+        self.scene.cameraAdded.connect(self.on_camera_added)
+        self.scene.cameraRemoved.connect(self.on_camera_removed)
 
         self.show()
 
+        # The window comes up first, the scene and non-essential setup follow from the event loop
+        QtCore.QTimer.singleShot(0, self.init_load)
+        QtCore.QTimer.singleShot(0, self.init_deferred)
+
     # Signal chains
     def on_obj_entry_clicked(self, idx):
         self.cameraDock.reset_pivot()
-        self.viewport.reselect(idx, False)
+        for viewport in self.viewports:
+            viewport.reselect(idx, False)
         self.inspectorDock.on_obj_entry_clicked(idx)
         self.hierarchyMenuDock.on_obj_entry_clicked(idx)
         if idx == -1:
@@ -939,33 +1773,159 @@ class CubeTeaWidget(QtWidgets.QMainWindow):
         else:
             self.status.showMessage("Focused on object {0}".format(self.objs[idx].name))
 
-    def on_item_name_changed(self):
-        self.inspectorDock.on_item_name_changed()
-        self.autosave()
-
-    def on_item_name_changed_rev(self, idx):
-        self.hierarchyDock.on_item_name_changed_rev(idx)
-        self.autosave()
-
-    def update_render(self, repaint=True):
-        self.viewport.repaint = repaint
-        self.viewport.update()
-        self.autosave()
-
-    def on_new_object_added(self):
-        self.viewport.reselect(len(self.objs)-1)
-        self.inspectorDock.on_new_object_added(len(self.objs)-1)
-        self.hierarchyDock.on_new_object_added()
-        self.autosave()
-        self.status.showMessage("New object {0} added.".format(self.objs[len(self.objs)-1].name))
-
-    def on_current_object_deleted(self):
-        self.viewport.reselect(-1)
+    def on_selection_changed(self, idxs):
+        for viewport in self.viewports:
+            viewport.reselect_group(idxs)
+        if self.groupDock is not None:
+            self.groupDock.on_selection_changed(idxs)
+        if len(idxs) > 1:
+            self.status.showMessage("Selected {0} objects.".format(len(idxs)))
+
+    # Selects the objects under a rubber band dragged out in viewport, see SpatialIndex.query_view
+    def select_region(self, viewport, band):
+        lo = np.array([band.left(), band.top()]) / SCALE_FACTOR
+        hi = np.array([band.right() + 1, band.bottom() + 1]) / SCALE_FACTOR
+        with tracing.span("select_region", "input", objects=len(self.objs)) as span:
+            idxs = self.scene.spatial_index().query_view(viewport.camera, lo, hi).tolist()
+            span.set(selected=len(idxs))
+        self.hierarchyDock.select(idxs)
+        self.status.showMessage("Selected {0} objects.".format(len(idxs)))
+
+    # Requests a render, camera changes and repaints concern viewport, or every viewport when it is None
+    def update_render(self, repaint=False, scene=False, camera=False, interactive=False, viewport=None):
+        if interactive:
+            (self.viewport if viewport is None else viewport).begin_interaction()
+        self.scheduler.request(scene=scene, camera=camera, repaint=repaint, viewport=viewport)
+
+    # Adds a viewport rendering camera, it shares the caches and the scheduler of the other viewports
+    #     and starts out with the render settings and selection of the active viewport
+    def add_viewport(self, camera):
+        viewportClass = CubeTeaGLRasterWidget if USE_OPENGL_VIEWPORT else CubeTeaRasterWidget
+        viewport = viewportClass(self.objs, camera, self.renderCache, self.sceneCache, self.centralWidget())
+        viewport.sceneVersion = self.scheduler.sceneVersion
+        if self.viewport is not None:
+            viewport.mode, viewport.antialias = self.viewport.mode, self.viewport.antialias
+            viewport.fullDetail = self.viewport.fullDetail
+            viewport.selectIdx, viewport.selectIdxs = self.viewport.selectIdx, self.viewport.selectIdxs
+            viewport.pivotIdx = self.viewport.pivotIdx
+        self.viewports.append(viewport)
+        self.layout_viewports()
+        return viewport
+
+    def remove_viewport(self, viewport):
+        self.viewports.remove(viewport)
+        self.scheduler.forget(viewport)
+        self.viewportGrid.removeWidget(viewport)
+        viewport.deleteLater()
+        self.layout_viewports()
+
+    # Places viewports row by row in camera order and outlines the active one if there are several
+    def layout_viewports(self):
+        for viewport in self.viewports:
+            self.viewportGrid.removeWidget(viewport)
+        for n, viewport in enumerate(self.viewports):
+            self.viewportGrid.addWidget(viewport, n // VIEWPORT_COLUMNS, n % VIEWPORT_COLUMNS)
+            viewport.active = viewport is self.viewport and len(self.viewports) > 1
+            viewport.update()
+
+    # Hands the camera controls to viewport
+    def activate_viewport(self, viewport):
+        self.viewport = viewport
+        self.scene.camera = viewport.camera
+        self.cameraDock.show_viewport(viewport)
+        self.layout_viewports()
+
+    # Camera for a new viewport, either a copy of the active camera or a preset view (see VIEW_ROTATIONS)
+    # looking at the whole scene
+    def view_camera(self, view):
+        active = self.scene.camera
+        if VIEW_ROTATIONS[view] is None:
+            return active.copy()
+        camera = Camera(color=active.color.copy(), dims=active.dims.copy(), viewport_dims=active.vdims.copy())
+        axis, angle = VIEW_ROTATIONS[view]
+        camera.rotate(rot_quat(np.array(axis), angle))
+        center, extent = np.zeros(3), 1.0
+        if len(self.objs) > 0:
+            positions, radii = object_bounds(self.objs, self.sceneCache)
+            lo, hi = (positions - radii[:, None]).min(axis=0), (positions + radii[:, None]).max(axis=0)
+            center, extent = 0.5 * (lo + hi), 0.5 * np.linalg.norm(hi - lo)
+        ray = camera.basis()[1]
+        camera.position = center - (extent + 1) * ray / np.linalg.norm(ray)
+        camera.dims = np.array([2 * extent, 2 * extent])
+        return camera
+
+    def add_view(self, view):
+        self.scene.add_camera(self.view_camera(view))
+        self.autosaveTimer.start()
+        self.status.showMessage("Added {0} view.".format(view.lower()))
+
+    # Removes the active viewport along with its camera, the last viewport stays
+    def remove_view(self):
+        if len(self.viewports) > 1:
+            self.scene.remove_camera(self.viewports.index(self.viewport))
+            self.autosaveTimer.start()
+            self.status.showMessage("Removed view.")
+
+    # Scene model subscriptions
+    def on_object_added(self, idx):
+        for viewport in self.viewports:
+            viewport.reselect(idx)
+        self.inspectorDock.on_new_object_added(idx)
+        self.update_render(scene=True)
+        self.autosaveTimer.start()
+        self.status.showMessage("New object {0} added.".format(self.objs[idx].name))
+
+    def on_object_removed(self, idx):
+        for viewport in self.viewports:
+            viewport.reselect(-1)
         self.inspectorDock.on_current_object_deleted()
-        self.hierarchyDock.on_current_object_deleted()
-        self.autosave()
+        self.on_selection_changed([])
+        self.update_render(scene=True)
+        self.autosaveTimer.start()
         self.status.showMessage("")
 
+    def on_property_changed(self, idx, name):
+        # names are not drawn, so renaming only needs saving
+        if name != "name":
+            self.update_render(scene=True)
+        self.autosaveTimer.start()
+
+    def on_properties_changed(self, idxs, names):
+        self.update_render(scene=True)
+        self.autosaveTimer.start()
+
+    # Camera controls only move the camera of the active viewport
+    def on_camera_changed(self, interactive):
+        self.update_render(camera=True, interactive=interactive, viewport=self.viewport)
+        self.autosaveTimer.start()
+
+    def on_camera_added(self, idx):
+        self.activate_viewport(self.add_viewport(self.scene.cameras[idx]))
+        self.update_render()
+
+    def on_camera_removed(self, idx):
+        removed = self.viewports[idx]
+        self.remove_viewport(removed)
+        if removed is self.viewport:
+            self.activate_viewport(self.viewports[min(idx, len(self.viewports) - 1)])
+
+    # Resets UI components after the whole scene was replaced
+    def on_scene_reset(self):
+        # the new scene may come with more or fewer cameras than there are viewports
+        while len(self.viewports) > len(self.scene.cameras):
+            self.remove_viewport(self.viewports[-1])
+        for viewport, camera in zip(self.viewports, self.scene.cameras):
+            viewport.camera = camera
+        for camera in self.scene.cameras[len(self.viewports):]:
+            self.add_viewport(camera)
+        self.activate_viewport(self.viewport if self.viewport in self.viewports else self.viewports[0])
+        for viewport in self.viewports:
+            viewport.reselect(-1)
+        self.inspectorDock.on_current_object_deleted()
+        self.hierarchyMenuDock.on_obj_entry_clicked(-1)
+        self.on_selection_changed([])
+        self.update_render(scene=True)
+
     def toggle_raster(self, mode):
         if mode != self.viewport.mode:
             self.viewport.toggleRenderMode()
@@ -975,6 +1935,23 @@ class CubeTeaWidget(QtWidgets.QMainWindow):
             elif mode == RasterMode.RAYTRACE:
                 self.status.showMessage("Entered raytrace mode.")
 
+    def toggle_antialias(self, enabled):
+        self.viewport.antialias = "edge" if enabled else None
+        self.update_render(True, viewport=self.viewport)
+        self.status.showMessage("Anti-aliasing {0}.".format("enabled" if enabled else "disabled"))
+
+    def toggle_full_detail(self, enabled):
+        self.viewport.fullDetail = enabled
+        self.update_render(viewport=self.viewport)
+        self.status.showMessage("Full frame detail {0}.".format("enabled" if enabled else "disabled"))
+
+    # Raytraces the current view once with per-object instrumentation and shows what it cost
+    def profile_frame(self):
+        profile = RenderProfile()
+        self.scene.camera.raytrace(self.objs, antialias=self.viewport.antialias, profile=profile)
+        self.profileDock.show_profile(profile)
+        self.status.showMessage("Profiled a raytrace of {0} objects.".format(len(self.objs)))
+
     def on_file_operation(self, operation, loc):
         if operation == FileOperation.SAVE:
             self.save(loc)
@@ -986,17 +1963,22 @@ class CubeTeaWidget(QtWidgets.QMainWindow):
 
     def get_pivot(self):
         pivotIdx = self.inspectorDock.get_pivot();
-        self.viewport.pivotIdx = pivotIdx
+        for viewport in self.viewports:
+            viewport.pivotIdx = pivotIdx
         return pivotIdx
 
     # Automatically saves current editor state to a JSON file in local storage
     def autosave(self):
-        loc = QtCore.QStandardPaths.writableLocation(QtCore.QStandardPaths.TempLocation)
-        self.save(loc, "cubetea_AUTO.json", True)
+        with tracing.span("autosave", "io", objects=len(self.objs)):
+            # the scene on screen is not the user's until the auto-save has been restored
+            if self.restoring:
+                return
+            loc = QtCore.QStandardPaths.writableLocation(QtCore.QStandardPaths.TempLocation)
+            self.save(loc, "cubetea_AUTO.json", True)
 
     # Saves current editor state as a JSON file
     def save(self, loc, name=None, auto=False):
-        saveState = {"objs": [obj.dict() for obj in self.objs] + [camera.dict()]}
+        saveState = {"objs": [obj.dict() for obj in self.objs] + [camera.dict() for camera in self.scene.cameras]}
         saveData = json.dumps(saveState)
         file_ptr = open("{0}/{1}".format(loc, name) if name is not None else loc, "w+")
         file_ptr.truncate()
@@ -1006,63 +1988,103 @@ class CubeTeaWidget(QtWidgets.QMainWindow):
             self.status.showMessage("Saved file {0} successfully.".format(
                 ("{0}/{1}".format(loc, name) if name is not None else loc)))
 
-    # Looks for autosave and loads it
+    # Looks for autosave and restores it in the background
     def init_load(self):
         # look for autosave
         loc = QtCore.QStandardPaths.writableLocation(QtCore.QStandardPaths.TempLocation)
         autosave = "{0}/{1}".format(loc, "cubetea_AUTO.json")
         if (os.path.exists(autosave)):
-            self.load(autosave, True)
-            self.status.showMessage("Successfully loaded auto-save.")
+            self.restoring = True
+            self.set_editing_enabled(False)
+            self.loadIndicator.show()
+            self.status.showMessage("Restoring auto-save...")
+            self.sceneLoader = CubeTeaSceneLoader(autosave, self)
+            self.sceneLoader.loaded.connect(self.on_autosave_loaded)
+            self.sceneLoader.failed.connect(self.on_autosave_failed)
+            self.sceneLoader.start()
         else:
             self.new_file()
+            self.sceneReady.emit()
+
+    def on_autosave_loaded(self, new_cameras, objs):
+        self.end_restore()
+        self.set_scene(new_cameras, objs)
+        self.status.showMessage("Successfully loaded auto-save.")
+        self.sceneReady.emit()
+
+    def on_autosave_failed(self):
+        self.end_restore()
+        # e.g. an auto-save naming a mesh file that was moved, the user may still want it back
+        loc = QtCore.QStandardPaths.writableLocation(QtCore.QStandardPaths.TempLocation)
+        try:
+            shutil.copyfile("{0}/{1}".format(loc, "cubetea_AUTO.json"), "{0}/{1}".format(loc, FAILED_AUTOSAVE_NAME))
+            self.status.showMessage("Auto-save found is invalid! Kept it as {0}/{1}.".format(loc, FAILED_AUTOSAVE_NAME))
+        except OSError:
+            self.status.showMessage("Auto-save found is invalid!")
+        self.sceneReady.emit()
+
+    def end_restore(self):
+        self.restoring = False
+        self.set_editing_enabled(True)
+        self.loadIndicator.hide()
+        self.sceneLoader.wait()
+        self.sceneLoader = None
+
+    # Edits made while the auto-save is restored would be replaced by it, so the docks and viewport input
+    # that edit the scene or cameras stay disabled until the restore ends
+    def set_editing_enabled(self, enabled):
+        for widget in [self.fileMenuDock, self.hierarchyMenuDock, self.hierarchyDock, self.inspectorDock,
+                       self.cameraDock, self.groupDock, self.centralWidget()]:
+            if widget is not None:
+                widget.setEnabled(enabled)
+
+    # Setup that is not needed to show the first frame
+    #     the group transform dock only acts on group selections and the profile dock on its own button,
+    #     neither of which can happen before the event loop runs
+    def init_deferred(self):
+        self.groupDock = CubeTeaGroupDockWidget(self.scene)
+        self.addDockWidget(QtCore.Qt.RightDockWidgetArea, self.groupDock)
+        self.profileDock = CubeTeaProfileDockWidget()
+        self.addDockWidget(QtCore.Qt.RightDockWidgetArea, self.profileDock)
+        self.tabifyDockWidget(self.groupDock, self.profileDock)
+        # an auto-save restore may have started first
+        self.groupDock.setEnabled(not self.restoring)
+        # compile the raytrace kernels before raytrace mode is first used
+        if USE_KERNELS:
+            threading.Thread(target=kernels.available, daemon=True).start()
 
     # Loads a file at loc
     def load(self, loc, auto=False):
         try:
-            file_ptr = open(loc, "r")
-            saveState = json.loads(file_ptr.read())
-            try:
-                new_camera, objs = load_objs(saveState["objs"])
-            except KeyError:
-                raise TypeError
-            self.camera.position = new_camera.position
-            self.camera.dims = new_camera.dims
-            self.camera.vdims = new_camera.vdims
-            self.camera.quaternion = new_camera.quaternion
-            self.objs.clear()
-            for obj in objs:
-                self.objs.append(obj)
-            self.reset_UI()
-            if not auto:
-                self.autosave()
-        except TypeError:
+            with open(loc, "r") as file_ptr:
+                saveState = json.loads(file_ptr.read())
+            new_cameras, objs = load_scene(saveState["objs"])
+        # the scene on screen is kept when the file or a mesh it names is missing or malformed
+        except OSError as error:
+            self.status.showMessage("Could not load {0}: {1}".format(loc, error))
+            return
+        except (ValueError, KeyError, IndexError, TypeError):
             self.status.showMessage("JSON file found is invalid!")
+            return
+        self.set_scene(new_cameras, objs)
+        if not auto:
+            self.autosave()
+
+    # Replaces the scene with loaded cameras and objects
+    def set_scene(self, new_cameras, objs):
+        self.scene.reset(objs, new_cameras)
 
     # Creates a new, default scene
     def new_file(self):
         # Add primitives
-        self.camera.position = np.array([0, -1, 0])
-        self.camera.quaternion = np.array([0, 0, 1, 0])
-        self.camera.dims = np.array([10, 10])
-        self.camera.vdims = np.array([480, 480])
+        camera = Camera(position=np.array([0, -1, 0]), dims=np.array([10, 10]), viewport_dims=np.array([480, 480]))
         box1 = Box(np.array([0, 2, 0]), name="box1", dims=np.array([2, 1, 3]), color=np.array([0, 128, 0]))
         box1.rotate(rot_quat(axis=np.array([0, 1, 1]), ang=math.pi / 4))
         sphere1 = Sphere(np.array([1, 4, 1]), name="sphere1", radius=3, color=np.array([0, 40, 160]))
-        self.objs.clear()
-        self.objs.append(box1)
-        self.objs.append(sphere1)
-        self.reset_UI()
+        self.scene.reset([box1, sphere1], [camera])
         self.status.showMessage("New scene created.")
         self.autosave()
 
-    # Resets UI components
-    def reset_UI(self):
-        self.viewport.reselect(-1)
-        self.inspectorDock.on_current_object_deleted()
-        self.hierarchyDock.on_current_object_deleted()
-        self.hierarchyMenuDock.on_obj_entry_clicked(-1)
-
 if __name__ == "__main__":
     app = QtWidgets.QApplication([])
     app.setStyle('plastique')
@@ -0,0 +1,55 @@
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+# Compares n boxes stored as separate objects with the same boxes stored as one Instances object.
+# Reports for both layouts
+#     memory    peak traced bytes while building the scene
+#     json      size of the saved scene
+#     load      seconds to load the saved scene with load_objs
+# Usage: python benchmarks/instances.py [instances]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from objects import Box, Camera, instance_grid, load_objs
+
+# Boxes on a cube shaped grid with random colors
+def build_instances(n):
+    side = int(np.ceil(n ** (1 / 3)))
+    colors = np.random.default_rng(0).integers(0, 256, (side ** 3, 3))
+    instances = instance_grid(Box(dims=np.array([0.5, 0.5, 0.5])), (side, side, side), 1.0, colors=colors)
+    instances.world()
+    return instances
+
+def build_objects(n):
+    return build_instances(n).expand()
+
+def measure(build, n, camera):
+    tracemalloc.start()
+    start = time.perf_counter()
+    objs = build(n)
+    objs = objs if isinstance(objs, list) else [objs]
+    built = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    text = json.dumps({"objs": [obj.dict() for obj in objs] + [camera.dict()]})
+    start = time.perf_counter()
+    load_objs(json.loads(text)["objs"])
+    return {"build": built, "memory": peak, "json": len(text), "load": time.perf_counter() - start}
+
+def main(argv):
+    n = int(argv[1]) if len(argv) > 1 else 100000
+    camera = Camera(position=np.array([0, -1, 0]), dims=np.array([10, 10]), viewport_dims=np.array([480, 480]))
+    results = {"objects": measure(build_objects, n, camera), "instances": measure(build_instances, n, camera)}
+    print("{0:>10} {1:>10} {2:>12} {3:>12} {4:>10}".format("layout", "build", "memory", "json", "load"))
+    for layout, result in results.items():
+        print("{0:>10} {1:>9.3f}s {2:>10.1f}MB {3:>10.1f}MB {4:>9.3f}s".format(
+            layout, result["build"], result["memory"] / 1e6, result["json"] / 1e6, result["load"]))
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,92 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+# Times the spatial index (spatial.py) on n random boxes and spheres against scanning every object.
+# The scan runs the same exact tests through an index of one huge cell. Reports
+#     build     seconds to index the scene
+#     update    seconds per moved object, rehashed by SpatialIndex.update
+#     insert    seconds per added and removed object
+#     range     seconds per query_box of a region holding about 100 objects
+#     nearest   seconds per nearest query
+#     pairs     seconds for overlapping_pairs, the scan is extrapolated from all pairs of 2000 objects
+# Usage: python benchmarks/spatial.py [objects]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from objects import Box, Sphere, rot_quat
+from spatial import SpatialIndex
+
+# Queries timed per measurement
+QUERIES = 200
+# Objects whose pairs are all tested to extrapolate the pair scan
+PAIR_SCAN_OBJECTS = 2000
+
+# Half boxes at random rotations, half spheres, about one object per 16 cubic units
+def build_objects(n, rng):
+    side = (16 * n) ** (1 / 3)
+    objs = []
+    for k in range(n):
+        position = rng.uniform(0, side, 3)
+        if k % 2 == 0:
+            objs.append(Sphere(position, radius=rng.uniform(0.1, 0.8)))
+        else:
+            box = Box(position, dims=rng.uniform(0.2, 1.6, 3))
+            box.rotate(rot_quat(rng.normal(size=3), rng.uniform(0, np.pi)))
+            objs.append(box)
+    return objs, side
+
+def timed(run, count=1):
+    start = time.perf_counter()
+    for k in range(count):
+        run(k)
+    return (time.perf_counter() - start) / count
+
+def main(argv):
+    n = int(argv[1]) if len(argv) > 1 else 100000
+    rng = np.random.default_rng(0)
+    objs, side = build_objects(n, rng)
+    results = {}
+    index = None
+    def build(k):
+        nonlocal index
+        index = SpatialIndex(objs)
+    results["build"] = timed(build), None
+    moves = rng.integers(0, n, QUERIES)
+    def update(k):
+        objs[moves[k]].translate(rng.normal(size=3))
+        index.update(moves[k])
+    results["update"] = timed(update, QUERIES), None
+    def insert(k):
+        objs.insert(moves[k], Sphere(rng.uniform(0, side, 3), radius=0.5))
+        index.add(moves[k])
+        del objs[moves[k]]
+        index.remove(moves[k])
+    results["insert"] = timed(insert, QUERIES), None
+    scan = SpatialIndex(objs, cell_size=1e9)
+    # regions of about 100 objects
+    corners = rng.uniform(0, side - 11, (QUERIES, 3))
+    points = rng.uniform(0, side, (QUERIES, 3))
+    found = []
+    results["range"] = (timed(lambda k: found.append(len(index.query_box(corners[k], corners[k] + 11))), QUERIES),
+                        timed(lambda k: scan.query_box(corners[k], corners[k] + 11), QUERIES))
+    results["nearest"] = timed(lambda k: index.nearest(points[k]), QUERIES), timed(lambda k: scan.nearest(points[k]),
+                                                                                     QUERIES)
+    pairs = []
+    a, b = np.triu_indices(PAIR_SCAN_OBJECTS, 1)
+    scale = (n * (n - 1)) / (PAIR_SCAN_OBJECTS * (PAIR_SCAN_OBJECTS - 1))
+    pair_scan = timed(lambda k: scan.pairs_overlap(a, b)) * scale
+    results["pairs"] = timed(lambda k: pairs.append(index.overlapping_pairs())), pair_scan
+    print("{0} objects, {1} per range query, {2} overlapping pairs, {3}".format(n, int(np.mean(found)), len(pairs[0]),
+                                                                               index.stats()))
+    print("{0:>10} {1:>12} {2:>12} {3:>10}".format("operation", "index", "scan", "speedup"))
+    for operation, (indexed, scanned) in results.items():
+        print("{0:>10} {1:>11.6f}s {2:>12} {3:>10}".format(
+            operation, indexed, "-" if scanned is None else "{0:.6f}s".format(scanned),
+            "-" if scanned is None else "{0:.0f}x".format(scanned / indexed)))
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,110 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+# Measures cold start of the app under the offscreen Qt platform.
+# Every run is a fresh interpreter, so imports are cold, and reports (in seconds since process start)
+#     imported     PySide2, NumPy and app.py are imported
+#     shown        the main window has been constructed and shown
+#     firstFrame   the viewport has painted its first frame
+#     sceneReady   an auto-save with the given number of objects has been restored
+#     deferred     CubeTeaWidget.init_deferred has finished
+#     window       seconds spent constructing and showing the window, shown - imported
+# for the app as is and with init_deferred run before the window is shown ("eager"), which is where
+# its setup happened before it was deferred
+# Usage: python benchmarks/startup.py [objects] [runs]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Script run in each child interpreter
+CHILD = """
+import time
+start = time.perf_counter()
+import sys
+sys.path.insert(0, {root!r})
+from PySide2 import QtCore, QtWidgets
+import numpy as np
+import app
+from objects import Camera
+imported = time.perf_counter()
+qapp = QtWidgets.QApplication([])
+camera = Camera(position=np.array([0, -1, 0]), dims=np.array([10, 10]), viewport_dims=np.array([480, 480]))
+times = {{"imported": imported - start}}
+init_deferred = app.CubeTeaWidget.init_deferred
+def timed_init_deferred(self):
+    if "deferred" not in times:
+        init_deferred(self)
+        times["deferred"] = time.perf_counter() - start
+app.CubeTeaWidget.init_deferred = timed_init_deferred
+if {eager!r}:
+    show = app.CubeTeaWidget.show
+    def eager_show(self):
+        self.init_deferred()
+        show(self)
+    app.CubeTeaWidget.show = eager_show
+widget = app.CubeTeaWidget(objs=[], camera=camera)
+times["shown"] = time.perf_counter() - start
+# the offscreen screen is too small for the docks, which would leave no room for the viewport
+widget.resize(1600, 1000)
+class PaintWatcher(QtCore.QObject):
+    def eventFilter(self, obj, event):
+        if event.type() == QtCore.QEvent.Paint:
+            times.setdefault("firstFrame", time.perf_counter() - start)
+        return False
+watcher = PaintWatcher()
+widget.viewport.installEventFilter(watcher)
+def on_ready():
+    times["sceneReady"] = time.perf_counter() - start
+    QtCore.QTimer.singleShot(0, qapp.quit)
+widget.sceneReady.connect(on_ready)
+qapp.exec_()
+times["objects"] = len(widget.objs)
+print(json.dumps(times), flush=True)
+# teardown is not part of startup
+os._exit(0)
+"""
+
+# Writes an auto-save with n boxes and spheres into directory
+def write_autosave(directory, n):
+    sys.path.insert(0, ROOT)
+    from objects import Box, Sphere, Camera
+    rng = np.random.default_rng(0)
+    objs = [Box(rng.uniform(-50, 50, 3), name="box{0}".format(i)) if i % 2 == 0 else
+            Sphere(rng.uniform(-50, 50, 3), name="sphere{0}".format(i)) for i in range(n)]
+    camera = Camera(position=np.array([0, -1, 0]), dims=np.array([10, 10]), viewport_dims=np.array([480, 480]))
+    with open(os.path.join(directory, "cubetea_AUTO.json"), "w") as file_ptr:
+        json.dump({"objs": [obj.dict() for obj in objs] + [camera.dict()]}, file_ptr)
+
+def run(n, directory, eager=False):
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen", TMPDIR=directory)
+    child = "import json, os\n" + CHILD.format(root=ROOT, eager=eager)
+    output = subprocess.run([sys.executable, "-c", child], env=env, check=True, stdout=subprocess.PIPE).stdout
+    times = json.loads(output.decode().strip().splitlines()[-1])
+    times["window"] = times["shown"] - times["imported"]
+    return times
+
+def main(argv):
+    n = int(argv[1]) if len(argv) > 1 else 10000
+    runs = int(argv[2]) if len(argv) > 2 else 3
+    with tempfile.TemporaryDirectory() as directory:
+        write_autosave(directory, n)
+        # alternate the modes so that both see the same disk cache and machine load
+        results = {"deferred": [], "eager": []}
+        for _ in range(runs):
+            for mode in results:
+                results[mode].append(run(n, directory, mode == "eager"))
+    print("{0:>12}  {1:>24}  {2:>24}".format("", "deferred (median, min)", "eager (median, min)"))
+    for key in ["imported", "shown", "firstFrame", "sceneReady", "deferred", "window"]:
+        cells = []
+        for mode in ["deferred", "eager"]:
+            values = [result[key] for result in results[mode] if key in result]
+            cells.append("{0:.3f}s {1:.3f}s".format(np.median(values), np.min(values)) if len(values) > 0 else "-")
+        print("{0:>12}: {1:>24}  {2:>24}".format(key, *cells))
+    print("{0:>12}: {1}".format("objects", results["deferred"][0]["objects"]))
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,119 @@
+import os
+
+import dask
+import dask.array as da
+import numpy as np
+
+from objects import Mesh, load_objs
+
+# Render backend that expresses frames as dask graphs of raytraced tiles.
+# Graphs run on the local threaded/multiprocess schedulers, or on a dask.distributed
+# cluster (a LocalCluster or remote workers) when one is configured. Meshes travel with their
+# triangle arrays rather than their file paths, which remote workers could not open.
+
+# Width and height (in pixels) of each tile task
+TILE_SIZE = 128
+# Address of a dask.distributed scheduler to render on, e.g. "tcp://render-node:8786"
+DASK_SCHEDULER_ADDRESS = os.environ.get("CUBETEA_DASK_SCHEDULER")
+
+# Clients of configured schedulers by address, connected by the first raytrace and reused by later ones
+_clients = {}
+
+# Rebuilds a scene on a worker from its JSON form and the MeshData of its meshes by position in data
+def _load_scene(data, meshes):
+    camera, objs = load_objs([entry for k, entry in enumerate(data) if k not in meshes])
+    for k in sorted(meshes):
+        entry = data[k]
+        objs.insert(k, Mesh(entry["path"], position=np.array(entry["position"]), name=entry["name"],
+                            quaternion=np.array(entry["quaternion"]), color=np.array(entry["color"]),
+                            data=meshes[k]))
+    return camera, objs
+
+# Raytraces one tile of a scene
+def _render_tile(scene, tile, simple, level, antialias):
+    camera, objs = scene
+    return camera.raytrace(objs, simple, level, antialias, tile)
+
+# Builds a lazy (I, J, 3) dask array of a raytrace, one task per tile
+#     the scene is serialized once and shared by every tile task of the frame
+def render_frame(camera, objs, simple=False, level=1, antialias=None, tile_size=TILE_SIZE):
+    data = [obj.dict() for obj in objs] + [camera.dict()]
+    meshes = {k: obj.data for k, obj in enumerate(objs) if isinstance(obj, Mesh)}
+    scene = dask.delayed(_load_scene, pure=True)(data, meshes)
+    I, J = camera.trace_dims(level)
+    blocks = []
+    for i0 in range(0, I, tile_size):
+        i1 = min(i0 + tile_size, I)
+        row = []
+        for j0 in range(0, J, tile_size):
+            j1 = min(j0 + tile_size, J)
+            tile = dask.delayed(_render_tile, pure=True)(scene, (i0, i1, j0, j1), simple, level, antialias)
+            row.append(da.from_delayed(tile, shape=(i1 - i0, j1 - j0, 3), dtype=float))
+        blocks.append(da.concatenate(row, axis=1))
+    return da.concatenate(blocks, axis=0)
+
+# Builds lazy frames for a batch of (camera, objs) scenes
+def render_frames(scenes, simple=False, level=1, antialias=None, tile_size=TILE_SIZE):
+    return [render_frame(camera, objs, simple, level, antialias, tile_size) for camera, objs in scenes]
+
+# Connects to the configured dask.distributed scheduler, or returns None if there is none
+def connect(address=DASK_SCHEDULER_ADDRESS):
+    if address is None:
+        return None
+    from dask.distributed import Client
+    return Client(address)
+
+# Client of the configured scheduler shared by every raytrace call, or None if there is none
+def shared_client(address=DASK_SCHEDULER_ADDRESS):
+    if address is None:
+        return None
+    if address not in _clients or _clients[address].status == "closed":
+        _clients[address] = connect(address)
+    return _clients[address]
+
+# Starts a dask.distributed LocalCluster and returns a client connected to it
+def local_cluster(n_workers=2, threads_per_worker=1):
+    from dask.distributed import Client, LocalCluster
+    cluster = LocalCluster(n_workers=n_workers, threads_per_worker=threads_per_worker)
+    return Client(cluster)
+
+# Computes lazy frames into NumPy framebuffers
+#     scheduler may be "threads", "processes", "sync" or a dask.distributed client
+def compute(frames, scheduler="threads"):
+    if hasattr(scheduler, "compute"):
+        return [np.asarray(frame) for frame in scheduler.gather(scheduler.compute(frames))]
+    return list(dask.compute(*frames, scheduler=scheduler))
+
+# Raytraces a single frame with dask, using the configured cluster when there is one
+def raytrace(camera, objs, simple=False, level=1, antialias=None, scheduler=None):
+    scheduler = scheduler if scheduler is not None else (shared_client() or "threads")
+    return compute([render_frame(camera, objs, simple, level, antialias)], scheduler)[0]
+
+def test_dask_render():
+    import json
+    import tempfile
+    with open("example.json") as file_ptr:
+        camera, objs = load_objs(json.load(file_ptr)["objs"])
+    camera.vdims = np.array([150, 100])
+    # workers must not need the mesh file, so it is gone before the frame is computed
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "quad.obj")
+        with open(path, "w") as file_ptr:
+            file_ptr.write("v 0 -1 -1\nv 0 1 -1\nv 0 1 1\nv 0 -1 1\nf 1 2 3 4\n")
+        objs.append(Mesh(path, position=np.array([-1.2, 2, 3])))
+    expected = camera.raytrace(objs)
+    frame = render_frame(camera, objs, tile_size=64)
+    for scheduler in ["sync", "threads", "processes"]:
+        assert np.array_equal(compute([frame], scheduler)[0], expected)
+    client = local_cluster()
+    try:
+        assert np.array_equal(compute([frame], client)[0], expected)
+        # raytrace connects to a configured scheduler once
+        shared = shared_client(client.scheduler.address)
+        assert shared_client(client.scheduler.address) is shared
+        assert np.array_equal(raytrace(camera, objs, scheduler=shared), expected)
+        shared.close()
+    finally:
+        client.close()
+        client.cluster.close()
+    print("dask tile renders match Camera.raytrace")
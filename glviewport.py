@@ -0,0 +1,211 @@
+import math
+
+from PySide2 import QtGui
+from OpenGL import GL
+import numpy as np
+
+from objects import Box, Sphere, Instances, Mesh, shade_colors, MESH_FRAME_TRIANGLES
+
+# OpenGL renderer for frame mode.
+# Box edges and sphere outlines are uploaded once as a vertex buffer and only rebuilt when
+# geometry changes; camera moves just update the view matrix uniform and issue one draw call.
+# Runs under Mesa's software rasterizer (llvmpipe), e.g. with QT_QPA_PLATFORM=offscreen
+# and LIBGL_ALWAYS_SOFTWARE=1, see render_offscreen.
+
+# Number of line segments used to outline a sphere
+CIRCLE_SEGMENTS = 48
+# Width (in pixels) of frame lines
+LINE_WIDTH = 5.0
+# Largest depth in front of the camera that is still drawn
+FAR_PLANE = 1000.0
+# Floats per vertex: position (3), outline offset (2), color (3)
+VERTEX_SIZE = 8
+
+VERTEX_SHADER = """
+#version 120
+attribute vec3 position;
+attribute vec2 offset;
+attribute vec3 color;
+uniform mat4 view;
+uniform vec3 axisX;
+uniform vec3 axisZ;
+varying vec3 fragColor;
+void main() {
+    // sphere outlines are offset within the camera plane so they always face the camera
+    gl_Position = view * vec4(position + offset.x * axisX + offset.y * axisZ, 1.0);
+    fragColor = color;
+}
+"""
+
+FRAGMENT_SHADER = """
+#version 120
+varying vec3 fragColor;
+void main() {
+    gl_FragColor = vec4(fragColor, 1.0);
+}
+"""
+
+# Index pairs of box corners making up its 12 edges
+BOX_EDGES = [(0, 4), (1, 5), (2, 6), (3, 7),
+             (0, 2), (1, 3), (4, 6), (5, 7),
+             (0, 1), (2, 3), (4, 5), (6, 7)]
+
+# Builds the (V, VERTEX_SIZE) float32 line vertex array for a scene of objects
+#     vertices are in world space, so they stay valid for any camera pose
+def build_vertices(objs):
+    chunks = []
+    angles = 2 * math.pi * np.arange(CIRCLE_SEGMENTS + 1) / CIRCLE_SEGMENTS
+    circle = np.stack([np.cos(angles), np.sin(angles)], axis=1)
+    for obj in objs:
+        if isinstance(obj, Box):
+            I, J, K = 0.5 * obj.dims
+            corners = np.array([[i, j, k] for i in [-I, I] for j in [-J, J] for k in [-K, K]])
+            corners = corners @ np.linalg.inv(obj.basis()).T + obj.position
+            edges = corners[np.array(BOX_EDGES).ravel()]
+            chunk = np.zeros((len(edges), VERTEX_SIZE))
+            chunk[:, 0:3] = edges
+            chunk[:, 5:8] = obj.midColor / 255
+        elif isinstance(obj, Sphere):
+            # consecutive circle points form GL_LINES segments
+            offsets = obj.radius * np.repeat(circle, 2, axis=0)[1:-1]
+            chunk = np.zeros((len(offsets), VERTEX_SIZE))
+            chunk[:, 0:3] = obj.position
+            chunk[:, 3:5] = offsets
+            chunk[:, 5:8] = obj.color / 255
+        elif isinstance(obj, Instances):
+            chunk = instance_vertices(obj, circle)
+        elif isinstance(obj, Mesh):
+            # bases are rotations, so their transposes take mesh space to world space
+            edges = obj.data.wire_edges(MESH_FRAME_TRIANGLES).reshape((-1, 3))
+            chunk = np.zeros((len(edges), VERTEX_SIZE))
+            chunk[:, 0:3] = edges @ obj.basis() + obj.position
+            chunk[:, 5:8] = obj.midColor / 255
+        else:
+            continue
+        chunks.append(chunk)
+    if len(chunks) == 0:
+        return np.zeros((0, VERTEX_SIZE), dtype=np.float32)
+    return np.concatenate(chunks).astype(np.float32)
+
+# Line vertices of every instance of an Instances object, built for all instances at once
+def instance_vertices(obj, circle):
+    positions, _, bases = obj.world()
+    if obj.colors is None:
+        colors = np.tile(obj.midColor if isinstance(obj.prototype, Box) else obj.color, (obj.count, 1))
+    elif isinstance(obj.prototype, Box):
+        colors = shade_colors(obj.colors.astype(float))[1]
+    else:
+        colors = obj.colors.astype(float)
+    if isinstance(obj.prototype, Box):
+        I, J, K = 0.5 * obj.prototype.dims
+        corners = np.array([[i, j, k] for i in [-I, I] for j in [-J, J] for k in [-K, K]])
+        edges = corners[np.array(BOX_EDGES).ravel()]
+        # bases are rotations, so their transposes take box space to world space
+        points = np.einsum("nji,kj->nki", bases, edges) + positions[:, np.newaxis]
+        chunk = np.zeros((obj.count, len(edges), VERTEX_SIZE))
+        chunk[:, :, 0:3] = points
+    else:
+        offsets = obj.prototype.radius * np.repeat(circle, 2, axis=0)[1:-1]
+        chunk = np.zeros((obj.count, len(offsets), VERTEX_SIZE))
+        chunk[:, :, 0:3] = positions[:, np.newaxis]
+        chunk[:, :, 3:5] = offsets
+    chunk[:, :, 5:8] = colors[:, np.newaxis] / 255
+    return chunk.reshape((-1, VERTEX_SIZE))
+
+# Row-major matrix mapping world space to clip space for an orthographic camera
+#     matches the pixel layout of Camera.frame_rasterize, with depth 0 at the camera plane
+def camera_matrix(camera):
+    defX, defY, defZ = camera.basis()
+    rows = [2 / camera.dims[0] * defX, -2 / camera.dims[1] * defZ, 2 / FAR_PLANE * defY]
+    matrix = np.eye(4)
+    for i, row in enumerate(rows):
+        matrix[i, 0:3] = row
+        matrix[i, 3] = -np.dot(row, camera.position)
+    matrix[2, 3] -= 1
+    return matrix
+
+class GLFrameRenderer:
+    def __init__(self):
+        self.program = None
+        self.buffer = None
+        self.count = 0
+
+    # Compiles shaders and creates the vertex buffer, requires a current OpenGL context
+    def initialize(self):
+        self.program = QtGui.QOpenGLShaderProgram()
+        self.program.addShaderFromSourceCode(QtGui.QOpenGLShader.Vertex, VERTEX_SHADER)
+        self.program.addShaderFromSourceCode(QtGui.QOpenGLShader.Fragment, FRAGMENT_SHADER)
+        self.program.link()
+        self.buffer = QtGui.QOpenGLBuffer(QtGui.QOpenGLBuffer.VertexBuffer)
+        self.buffer.create()
+        self.buffer.setUsagePattern(QtGui.QOpenGLBuffer.StaticDraw)
+
+    # Rebuilds the vertex buffer, only needed when scene geometry changes
+    #     vertices may be the build_vertices output of objs, e.g. when several viewports share it
+    def upload(self, objs, vertices=None):
+        if vertices is None:
+            vertices = build_vertices(objs)
+        self.buffer.bind()
+        self.buffer.allocate(vertices.tobytes(), vertices.nbytes)
+        self.buffer.release()
+        self.count = len(vertices)
+
+    # Draws the uploaded geometry from the camera's point of view with a single draw call
+    def draw(self, camera):
+        GL.glClearColor(*(np.array(camera.color) / 255), 1.0)
+        GL.glClear(GL.GL_COLOR_BUFFER_BIT | GL.GL_DEPTH_BUFFER_BIT)
+        if self.count == 0:
+            return
+        GL.glEnable(GL.GL_DEPTH_TEST)
+        GL.glDepthFunc(GL.GL_LESS)
+        GL.glLineWidth(LINE_WIDTH)
+        defX, _, defZ = camera.basis()
+        self.program.bind()
+        self.program.setUniformValue("view", QtGui.QMatrix4x4(*camera_matrix(camera).ravel()))
+        self.program.setUniformValue("axisX", QtGui.QVector3D(*defX))
+        self.program.setUniformValue("axisZ", QtGui.QVector3D(*defZ))
+        self.buffer.bind()
+        stride = 4 * VERTEX_SIZE
+        for name, offset, size in [("position", 0, 3), ("offset", 3, 2), ("color", 5, 3)]:
+            location = self.program.attributeLocation(name)
+            self.program.enableAttributeArray(location)
+            self.program.setAttributeBuffer(location, GL.GL_FLOAT, 4 * offset, size, stride)
+        GL.glDrawArrays(GL.GL_LINES, 0, self.count)
+        self.buffer.release()
+        self.program.release()
+        GL.glDisable(GL.GL_DEPTH_TEST)
+
+# Renders a frame into an offscreen framebuffer and returns it as a QImage
+#     requires a QGuiApplication, works on the offscreen platform with llvmpipe
+def render_offscreen(objs, camera):
+    width, height = int(camera.vdims[0]), int(camera.vdims[1])
+    surface = QtGui.QOffscreenSurface()
+    surface.create()
+    context = QtGui.QOpenGLContext()
+    if not context.create() or not context.makeCurrent(surface):
+        raise RuntimeError("Could not create an OpenGL context for offscreen rendering.")
+    fbo = QtGui.QOpenGLFramebufferObject(width, height, QtGui.QOpenGLFramebufferObject.Depth)
+    fbo.bind()
+    GL.glViewport(0, 0, width, height)
+    renderer = GLFrameRenderer()
+    renderer.initialize()
+    renderer.upload(objs)
+    renderer.draw(camera)
+    image = fbo.toImage()
+    fbo.release()
+    context.doneCurrent()
+    return image
+
+def test_offscreen_frame():
+    import json
+    from objects import load_objs
+    app = QtGui.QGuiApplication.instance() or QtGui.QGuiApplication([])
+    with open("example.json") as file_ptr:
+        camera, objs = load_objs(json.load(file_ptr)["objs"])
+    camera.vdims = np.array([120, 120])
+    image = render_offscreen(objs, camera)
+    background = QtGui.QColor(image.pixel(0, 0))
+    assert [background.red(), background.green(), background.blue()] == list(camera.color)
+    drawn = sum(image.pixel(i, j) != image.pixel(0, 0) for i in range(120) for j in range(120))
+    assert drawn > 0, "no frame lines were drawn"
+    print("offscreen frame rendered {0} line pixels".format(drawn))
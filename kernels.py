@@ -0,0 +1,227 @@
+import numpy as np
+import math
+import threading
+
+# Optional compiled kernels for Camera.trace
+# Numba is an optional extra: when it cannot be imported, Camera.trace silently falls back
+# to its NumPy implementation. The arithmetic below mirrors the NumPy code in objects.py
+# operation for operation so that both backends produce bit-identical results.
+
+# Object kinds understood by the kernels
+KIND_BOX = 0
+KIND_SPHERE = 1
+
+# Compiled trace kernel, None until compiled and False if Numba is unavailable
+_trace_kernel = None
+# The kernel is already parallel, and Numba's default workqueue threading layer aborts when
+# parallel kernels are launched from several threads at once, so launches are serialized
+_kernel_lock = threading.Lock()
+# Compilation may be started from a background thread while a raytrace asks for the kernel
+_compile_lock = threading.Lock()
+
+# Compiles the kernels on first use so that importing this module stays cheap
+def _compile():
+    if _trace_kernel is not None:
+        return _trace_kernel
+    with _compile_lock:
+        return _compile_locked()
+
+def _compile_locked():
+    global _trace_kernel
+    if _trace_kernel is not None:
+        return _trace_kernel
+    try:
+        import numba
+    except ImportError:
+        _trace_kernel = False
+        return _trace_kernel
+
+    # Traces every origin against every packed object and shades the closest hit
+    #     the loops over rays and objects are fused, so no per-object temporaries are made
+    #     compiled kernels are cached on disk, so only the first run after an edit pays for compilation
+    #     objects are packed front to back, so a ray stops as soon as its closest hit is nearer
+    #     than the minimum depth of the next object; labels holds the original object indices
+    #     every entry of colors, ids and dists is written, colors rounded like the NumPy trace,
+    #     so they may be uninitialized and colors may be a strided uint8 view of an image
+    @numba.njit(parallel=True, cache=True)
+    def trace_kernel(origins, kinds, bases, positions, sizes, rays, units, norms, quads,
+                     lows, mids, highs, simples, labels, min_depths, simple, background, colors, ids, dists):
+        for n in numba.prange(origins.shape[0]):
+            best, best_k, best_axis, best_t = math.inf, -1, 0, 0.0
+            for k in range(kinds.shape[0]):
+                if best < min_depths[k]:
+                    break
+                o0 = origins[n, 0] - positions[k, 0]
+                o1 = origins[n, 1] - positions[k, 1]
+                o2 = origins[n, 2] - positions[k, 2]
+                if kinds[k] == KIND_BOX:
+                    # slab test in box space
+                    inside = True
+                    tmin, axis, tmax = -math.inf, 0, math.inf
+                    for i in range(3):
+                        no = o0 * bases[k, i, 0] + o1 * bases[k, i, 1] + o2 * bases[k, i, 2]
+                        if rays[k, i] != 0:
+                            t0 = (-sizes[k, i] - no) / rays[k, i]
+                            t1 = (sizes[k, i] - no) / rays[k, i]
+                            lo, hi = min(t0, t1), max(t0, t1)
+                            if lo > tmin:
+                                tmin, axis = lo, i
+                            tmax = min(tmax, hi)
+                        elif no < -sizes[k, i] or no > sizes[k, i]:
+                            inside = False
+                    if not inside or tmin > tmax or tmin < 0:
+                        continue
+                    t = tmin
+                else:
+                    # quadratic for the sphere
+                    a = quads[k]
+                    b = 2 * (o0 * rays[k, 0] + o1 * rays[k, 1] + o2 * rays[k, 2])
+                    c = (o0 * o0 + o1 * o1 + o2 * o2) - sizes[k, 0]
+                    discrim = b * b - 4 * a * c
+                    if discrim < 0:
+                        continue
+                    root = math.sqrt(discrim)
+                    t0, t1 = (-b - root) / (2 * a), (-b + root) / (2 * a)
+                    if t0 >= 0:
+                        t = t0
+                    elif t1 >= 0:
+                        t = t1
+                    else:
+                        continue
+                    axis = 0
+                dist = t * norms[k]
+                if dist < best or (dist == best and labels[k] < labels[best_k]):
+                    best, best_k, best_axis, best_t = dist, k, axis, t
+            dists[n] = best
+            ids[n] = labels[best_k] if best_k != -1 else -1
+            if best_k == -1:
+                for i in range(3):
+                    colors[n, i] = background[i]
+                continue
+            k = best_k
+            if simple:
+                for i in range(3):
+                    colors[n, i] = np.rint(simples[k, best_axis, i])
+                continue
+            if kinds[k] == KIND_BOX:
+                render = abs(units[k, best_axis])
+            else:
+                nx = origins[n, 0] + best_t * rays[k, 0] - positions[k, 0]
+                ny = origins[n, 1] + best_t * rays[k, 1] - positions[k, 1]
+                nz = origins[n, 2] + best_t * rays[k, 2] - positions[k, 2]
+                length = math.sqrt(nx * nx + ny * ny + nz * nz)
+                render = abs(nx / length * units[k, 0] + ny / length * units[k, 1] + nz / length * units[k, 2])
+            for i in range(3):
+                if render < 0.5:
+                    colors[n, i] = np.rint(2 * render * mids[k, i] + (1 - 2 * render) * lows[k, i])
+                else:
+                    colors[n, i] = np.rint(2 * (render - 0.5) * highs[k, i] + (1 - 2 * (render - 0.5)) * mids[k, i])
+
+    _trace_kernel = trace_kernel
+    return _trace_kernel
+
+# Whether compiled kernels can be used in this environment
+def available():
+    return _compile() is not False
+
+# Starts Numba's worker threads from the calling thread
+#     parallel kernels launched from other threads need this to have happened on the main thread,
+#     the TBB threading layer otherwise keeps interpreter exit waiting for the threads it started
+def start_threads():
+    try:
+        import numba
+    except ImportError:
+        return
+    numba.get_num_threads()
+
+# Packs the ray independent arrays of objects in scene order, or returns None if an object is unsupported
+#     viewports of one scene share this pack, see render_cache.SceneCache
+def pack_scene(objs):
+    K = len(objs)
+    kinds = np.zeros(K, dtype=np.int64)
+    bases, positions, sizes = np.zeros((K, 3, 3)), np.zeros((K, 3)), np.zeros((K, 3))
+    lows, mids, highs, colors = np.zeros((K, 3)), np.zeros((K, 3)), np.zeros((K, 3)), np.zeros((K, 3))
+    for k, obj in enumerate(objs):
+        kind = getattr(obj, "KERNEL_KIND", None)
+        if kind is None:
+            return None
+        kinds[k] = kind
+        positions[k] = obj.position
+        lows[k], mids[k], highs[k], colors[k] = obj.lowColor, obj.midColor, obj.highColor, obj.color
+        if kind == KIND_BOX:
+            bases[k] = obj.basis()
+            sizes[k] = 0.5 * obj.dims
+        else:
+            sizes[k, 0] = obj.radius ** 2
+    return kinds, bases, positions, sizes, lows, mids, highs, colors
+
+# Packs objects into flat arrays for the kernels, or returns None if an object is unsupported
+#     scene may be the pack_scene arrays of objs, objects are packed in the given order
+#     the ray dependent arrays use matmul, which rounds like the np.dot and np.linalg.norm
+#     calls of the NumPy trace
+def pack(objs, ray, scene=None, order=None):
+    if scene is None:
+        scene = pack_scene(objs)
+    if scene is None:
+        return None
+    order = np.arange(len(objs)) if order is None else np.asarray(order, dtype=np.int64)
+    kinds, bases, positions, sizes, lows, mids, highs, colors = (array[order] for array in scene)
+    boxes = kinds == KIND_BOX
+    rays = np.where(boxes[:, None], bases @ ray, ray)
+    norms = np.sqrt((rays[:, None, :] @ rays[:, :, None])[:, 0, 0])
+    norms[~boxes] = np.linalg.norm(ray)
+    units = rays / norms[:, None]
+    units[~boxes] = ray / np.linalg.norm(ray)
+    quads = np.where(boxes, 0.0, np.dot(ray.T, ray))
+    # box faces are shaded by how squarely their axis faces the ray, spheres are flat in simple mode
+    rows = np.arange(len(order))[:, None]
+    ranks = np.empty((len(order), 3), dtype=int)
+    ranks[rows, np.argsort(np.abs(units), axis=1)] = np.arange(3)
+    simples = np.stack([lows, mids, highs], axis=1)[rows, ranks]
+    simples[~boxes] = colors[~boxes, None, :]
+    return kinds, bases, positions, sizes, rays, units, norms, quads, lows, mids, highs, simples
+
+# Compiled counterpart of Camera.trace, returns None when the kernels cannot be used
+#     order and min_depths come from Camera.depth_order, objects are traced in their given order
+#     without early termination when they are omitted
+#     scene may be the pack_scene arrays of objs
+#     colors, hit ids and distances are written straight into out, ids and dists when they are given
+def trace(objs, origins, ray, background, simple=False, out=None, order=None, min_depths=None, scene=None,
+          ids=None, dists=None):
+    kernel = _compile()
+    if kernel is False:
+        return None
+    if order is None:
+        order, min_depths = np.arange(len(objs)), np.full(len(objs), -np.inf)
+    packed = pack(objs, ray, scene, order)
+    if packed is None:
+        return None
+    n = len(origins)
+    colors = np.empty((n, 3)) if out is None else out
+    ids = np.empty(n, dtype=np.int64) if ids is None else ids
+    dists = np.empty(n) if dists is None else dists
+    with _kernel_lock:
+        kernel(np.ascontiguousarray(origins, dtype=float), *packed, np.asarray(order, dtype=np.int64),
+               np.asarray(min_depths, dtype=float), simple, np.asarray(background, dtype=float), colors, ids, dists)
+    return colors, ids, dists
+
+def test_kernel_equivalence():
+    import json
+    from objects import Camera, load_objs
+    if not available():
+        print("Numba is not installed, skipping kernel equivalence check")
+        return
+    with open("example.json") as file_ptr:
+        camera, objs = load_objs(json.load(file_ptr)["objs"])
+    camera.vdims = np.array([96, 96])
+    I, J = camera.vdims
+    u, v = np.meshgrid(np.arange(I), np.arange(J), indexing="ij")
+    origins = camera.pixel_origins(u.ravel(), v.ravel(), I, J)
+    for simple in [False, True]:
+        expected = camera.trace(objs, origins, simple, use_kernels=False)
+        result = trace(objs, origins, camera.basis()[1], camera.color, simple)
+        shared = trace(objs, origins, camera.basis()[1], camera.color, simple, scene=pack_scene(objs))
+        for a, b, c in zip(expected, result, shared):
+            assert np.array_equal(a, b), "compiled kernels differ from the NumPy trace"
+            assert np.array_equal(a, c), "compiled kernels differ when the scene is packed once"
+    print("compiled kernels are bit-equivalent to the NumPy trace")
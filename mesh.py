@@ -0,0 +1,361 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+# Triangle meshes for objects.Mesh: import, on-disk cache and BVH ray intersection.
+# Sources are Wavefront OBJ files, PLY files (ascii or binary) or a directory holding a binary
+# vertex/index dump as vertices.npy (V, 3) and faces.npy (F, 3). The first import of a source
+# writes a cache directory next to it (or into the temp directory when that is not writable)
+# with the vertices, the faces in BVH order and the BVH node bounds as .npy files; later imports
+# memory-map the cache, so only the pages a trace touches are read from disk.
+# The BVH is a complete binary tree over runs of BVH_LEAF_SIZE triangles sorted by the Morton
+# code of their centroids, stored implicitly (children of node i are 2i + 1 and 2i + 2).
+
+# Triangles per BVH leaf
+BVH_LEAF_SIZE = 8
+# Rays walked through the BVH at once, bounds the memory of the traversal
+BVH_RAY_CHUNK = 16384
+# (ray, triangle) pairs tested at once, pairs are visited nearest leaf first between batches
+BVH_PAIR_BATCH = 1 << 18
+# Relative padding of BVH node bounds, covers rounding in the slab tests
+BVH_BOUNDS_SLACK = 1e-9
+# Bits per axis of the Morton codes that order triangles
+MORTON_BITS = 10
+# Suffix of the cache directory written next to a mesh source
+MESH_CACHE_SUFFIX = ".cubetea"
+# Bumped whenever the cache layout changes, older caches are rebuilt
+MESH_CACHE_VERSION = 1
+
+# Splits polygons with more than three corners into triangle fans
+def triangulate(polygons):
+    triangles = []
+    for polygon in polygons:
+        for k in range(1, len(polygon) - 1):
+            triangles.append((polygon[0], polygon[k], polygon[k + 1]))
+    return np.array(triangles, dtype=np.int64).reshape((-1, 3))
+
+# Reads vertices and triangles of a Wavefront OBJ file, ignoring texture coordinates and normals
+#     negative (relative) indices are resolved against all vertices of the file
+def read_obj(path):
+    with open(path, "rb") as file_ptr:
+        lines = file_ptr.read().splitlines()
+    vertex_lines = [line[2:] for line in lines if line.startswith(b"v ")]
+    vertices = np.array(b" ".join(vertex_lines).split(), dtype=float).reshape((len(vertex_lines), -1))[:, :3]
+    polygons = []
+    for line in lines:
+        if line.startswith(b"f "):
+            polygons.append([int(token.split(b"/")[0]) for token in line.split()[1:]])
+    faces = triangulate(polygons)
+    faces = np.where(faces < 0, faces + len(vertices), faces - 1)
+    return vertices, faces
+
+# Maps PLY property types to NumPy types
+PLY_TYPES = {
+    "char": "i1", "int8": "i1", "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2", "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4", "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4", "double": "f8", "float64": "f8"
+}
+
+# Reads vertices and triangles of a PLY file in ascii or binary format
+#     only the vertex and face elements are used, other elements must come after them
+def read_ply(path):
+    with open(path, "rb") as file_ptr:
+        if file_ptr.readline().strip() != b"ply":
+            raise ValueError("{0} is not a PLY file".format(path))
+        form, elements = None, []
+        while True:
+            words = file_ptr.readline().decode("ascii").split()
+            if len(words) == 0 or words[0] in ["comment", "obj_info"]:
+                continue
+            if words[0] == "end_header":
+                break
+            if words[0] == "format":
+                form = words[1]
+            elif words[0] == "element":
+                elements.append((words[1], int(words[2]), []))
+            elif words[0] == "property":
+                elements[-1][2].append(words[1:])
+        body = file_ptr.read()
+    if form == "ascii":
+        return read_ply_ascii(body, elements)
+    order = "<" if form == "binary_little_endian" else ">"
+    return read_ply_binary(body, elements, order)
+
+def read_ply_ascii(body, elements):
+    lines = body.split(b"\n")
+    start, vertices, faces = 0, None, None
+    for name, count, properties in elements:
+        rows = lines[start:start + count]
+        start += count
+        if name == "vertex":
+            names = [prop[-1] for prop in properties]
+            table = np.array(b" ".join(rows).split(), dtype=float).reshape((count, len(names)))
+            vertices = table[:, [names.index(axis) for axis in ["x", "y", "z"]]]
+        elif name == "face":
+            faces = triangulate([[int(word) for word in row.split()[1:]] for row in rows])
+    return vertices, faces
+
+def read_ply_binary(body, elements, order):
+    offset, vertices, faces = 0, None, None
+    for name, count, properties in elements:
+        if name == "vertex":
+            dtype = np.dtype([(prop[-1], order + PLY_TYPES[prop[0]]) for prop in properties])
+            table = np.frombuffer(body, dtype=dtype, count=count, offset=offset)
+            vertices = np.stack([table["x"], table["y"], table["z"]], axis=1).astype(float)
+            offset += count * dtype.itemsize
+        elif name == "face":
+            _, count_type, index_type, _ = properties[0]
+            count_type, index_type = np.dtype(order + PLY_TYPES[count_type]), np.dtype(order + PLY_TYPES[index_type])
+            # all-triangle meshes are read in one go, anything else polygon by polygon
+            dtype = np.dtype([("n", count_type), ("idx", index_type, 3)])
+            table = np.frombuffer(body, dtype=dtype, count=count, offset=offset) \
+                if len(body) - offset >= count * dtype.itemsize else None
+            if table is not None and np.all(table["n"] == 3):
+                faces = table["idx"].astype(np.int64)
+                offset += count * dtype.itemsize
+            else:
+                polygons = []
+                for _ in range(count):
+                    n = int(np.frombuffer(body, dtype=count_type, count=1, offset=offset)[0])
+                    offset += count_type.itemsize
+                    polygons.append(np.frombuffer(body, dtype=index_type, count=n, offset=offset))
+                    offset += n * index_type.itemsize
+                faces = triangulate(polygons)
+        else:
+            break
+    return vertices, faces
+
+# Reads vertices and triangles of a binary dump directory (vertices.npy and faces.npy)
+def read_dump(path):
+    vertices = np.load(os.path.join(path, "vertices.npy")).astype(float)
+    faces = np.load(os.path.join(path, "faces.npy")).astype(np.int64)
+    return vertices.reshape((-1, 3)), faces.reshape((-1, 3))
+
+# Reads a mesh source by its file type
+def read_mesh(path):
+    if os.path.isdir(path):
+        return read_dump(path)
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".obj":
+        return read_obj(path)
+    elif extension == ".ply":
+        return read_ply(path)
+    raise ValueError("Unsupported mesh file {0}".format(path))
+
+# Spreads the low MORTON_BITS bits of integers two bits apart
+def spread_bits(x):
+    x = x.astype(np.uint64)
+    x = (x | (x << np.uint64(16))) & np.uint64(0x030000FF)
+    x = (x | (x << np.uint64(8))) & np.uint64(0x0300F00F)
+    x = (x | (x << np.uint64(4))) & np.uint64(0x030C30C3)
+    x = (x | (x << np.uint64(2))) & np.uint64(0x09249249)
+    return x
+
+# Sorts triangles along a Morton curve and builds the bounds of the implicit BVH nodes
+#     returns the sorted faces and (nodes, 3) node minimum and maximum corners
+def build_bvh(vertices, faces, leaf_size=BVH_LEAF_SIZE):
+    corners = vertices[faces]
+    lo, hi = corners.min(axis=1), corners.max(axis=1)
+    centroids = 0.5 * (lo + hi)
+    cells = np.zeros((len(faces), 3), dtype=np.int64)
+    if len(faces) > 0:
+        low = centroids.min(axis=0)
+        extent = np.maximum(centroids.max(axis=0) - low, 1e-300)
+        cells = np.floor((centroids - low) / extent * ((1 << MORTON_BITS) - 1)).astype(np.int64)
+    codes = spread_bits(cells[:, 0]) | (spread_bits(cells[:, 1]) << np.uint64(1)) | (spread_bits(cells[:, 2]) << np.uint64(2))
+    order = np.argsort(codes, kind="stable")
+    faces, lo, hi = faces[order], lo[order], hi[order]
+    leaves = max(1, -(-len(faces) // leaf_size))
+    width = 1 << int(np.ceil(np.log2(leaves)))
+    nodes_min, nodes_max = np.full((2 * width - 1, 3), np.inf), np.full((2 * width - 1, 3), -np.inf)
+    if len(faces) > 0:
+        starts = np.arange(0, len(faces), leaf_size)
+        nodes_min[width - 1:width - 1 + leaves] = np.minimum.reduceat(lo, starts, axis=0)
+        nodes_max[width - 1:width - 1 + leaves] = np.maximum.reduceat(hi, starts, axis=0)
+    # parents of each level from the bottom up
+    level = width // 2
+    while level >= 1:
+        parents = np.arange(level - 1, 2 * level - 1)
+        nodes_min[parents] = np.minimum(nodes_min[2 * parents + 1], nodes_min[2 * parents + 2])
+        nodes_max[parents] = np.maximum(nodes_max[2 * parents + 1], nodes_max[2 * parents + 2])
+        level //= 2
+    # empty nodes keep their inverted infinite bounds
+    pad = np.where(np.isfinite(nodes_min), BVH_BOUNDS_SLACK * (1 + np.abs(nodes_min) + np.abs(nodes_max)), 0)
+    return faces, nodes_min - pad, nodes_max + pad
+
+# Cache directory of a mesh source, next to it when possible
+def cache_path(path):
+    path = os.path.abspath(path).rstrip(os.sep)
+    beside = path + MESH_CACHE_SUFFIX
+    if os.access(os.path.dirname(path), os.W_OK) or os.path.isdir(beside):
+        return beside
+    name = hashlib.sha1(path.encode()).hexdigest() + MESH_CACHE_SUFFIX
+    return os.path.join(tempfile.gettempdir(), "cubetea_meshes", name)
+
+# Modification time and size identifying the contents of a mesh source
+def source_stamp(path):
+    if os.path.isdir(path):
+        stats = [os.stat(os.path.join(path, name)) for name in ["vertices.npy", "faces.npy"]]
+    else:
+        stats = [os.stat(path)]
+    return [[stat.st_mtime_ns, stat.st_size] for stat in stats]
+
+# Triangles of a mesh with their BVH, arrays may be memory-mapped read-only cache files
+class MeshData:
+    def __init__(self, vertices, faces, nodes_min, nodes_max, leaf_size=BVH_LEAF_SIZE, stamp=None):
+        # plain array views of memory maps index without the np.memmap subclass overhead
+        self.vertices = np.asarray(vertices)
+        self.faces = np.asarray(faces)
+        self.nodes_min = np.asarray(nodes_min)
+        self.nodes_max = np.asarray(nodes_max)
+        self.leaf_size = leaf_size
+        # identifies the cache contents for render keys
+        self.stamp = stamp
+        # radius of a sphere around the mesh origin that encloses the mesh
+        corners = np.abs(np.stack([nodes_min[0], nodes_max[0]])) if len(faces) > 0 else np.zeros((1, 3))
+        self.radius = float(np.linalg.norm(corners.max(axis=0)))
+
+    # Nearest triangle hit along ray from each origin, in mesh space
+    #     returns ray parameters t (inf for misses) and triangle indices (-1 for misses),
+    #     lower triangle indices win ties
+    def intersect(self, origins, ray):
+        n = len(origins)
+        ts, tris = np.full(n, np.inf, dtype=origins.dtype), np.full(n, -1)
+        if len(self.faces) == 0:
+            return ts, tris
+        for start in range(0, n, BVH_RAY_CHUNK):
+            rays, leaves, near = self.leaf_pairs(origins[start:start + BVH_RAY_CHUNK], ray)
+            self.intersect_leaves(origins, ray, rays + start, leaves, near, ts, tris)
+        return ts, tris
+
+    # Node bounds as ray parameters along ray, shared by every origin since all rays are parallel
+    #     returns the scaled lower and upper bounds and the axes the ray moves along
+    def scaled_bounds(self, ray, dtype):
+        moving = np.flatnonzero(ray != 0)
+        lo, hi = self.nodes_min[:, moving] / ray[moving], self.nodes_max[:, moving] / ray[moving]
+        return np.minimum(lo, hi).astype(dtype), np.maximum(lo, hi).astype(dtype), moving
+
+    # Walks origins down the BVH one level at a time, returning the (ray, leaf) pairs that reach
+    # leaves with the ray parameters where the rays enter them
+    def leaf_pairs(self, origins, ray):
+        first_leaf = (len(self.nodes_min) - 1) // 2
+        lower, upper, moving = self.scaled_bounds(ray, origins.dtype)
+        still = np.flatnonzero(ray == 0)
+        scaled = origins[:, moving] / ray[moving].astype(origins.dtype)
+        rays, nodes = np.arange(len(origins)), np.zeros(len(origins), dtype=np.int64)
+        while True:
+            # slab test, axes the ray does not move along only need the origin inside the node
+            offsets = scaled[rays]
+            near = np.max(lower[nodes] - offsets, axis=1, initial=-np.inf)
+            far = np.min(upper[nodes] - offsets, axis=1, initial=np.inf)
+            hit = (near <= far) & (far >= 0)
+            for i in still:
+                hit &= (origins[rays, i] >= self.nodes_min[nodes, i]) & (origins[rays, i] <= self.nodes_max[nodes, i])
+            rays, nodes, near = rays[hit], nodes[hit], near[hit]
+            if len(nodes) == 0 or nodes[0] >= first_leaf:
+                return rays, nodes - first_leaf, near
+            rays = np.repeat(rays, 2)
+            nodes = np.stack([2 * nodes + 1, 2 * nodes + 2], axis=1).ravel()
+
+    # Moller-Trumbore tests of the triangles of the (ray, leaf) pairs, updating ts and tris in place
+    #     pairs are visited nearest leaf first, so leaves behind a ray's hit are mostly skipped
+    def intersect_leaves(self, origins, ray, rays, leaves, near, ts, tris):
+        order = np.argsort(near, kind="stable")
+        rays, leaves, near = rays[order], leaves[order], near[order]
+        size = self.leaf_size
+        step = max(1, BVH_PAIR_BATCH // size)
+        for start in range(0, len(rays), step):
+            batch_rays, batch_leaves = rays[start:start + step], leaves[start:start + step]
+            keep = near[start:start + step] <= ts[batch_rays]
+            batch_rays, batch_leaves = batch_rays[keep], batch_leaves[keep]
+            pair_rays = np.repeat(batch_rays, size)
+            pair_tris = (batch_leaves[:, np.newaxis] * size + np.arange(size)).ravel()
+            valid = pair_tris < len(self.faces)
+            pair_rays, pair_tris = pair_rays[valid], pair_tris[valid]
+            t = self.triangle_hits(origins[pair_rays], ray, pair_tris)
+            closer = (t < ts[pair_rays]) | ((t == ts[pair_rays]) & (pair_tris < tris[pair_rays]))
+            closer &= t < np.inf
+            if not np.any(closer):
+                continue
+            pair_rays, pair_tris, t = pair_rays[closer], pair_tris[closer], t[closer]
+            # nearest pair per ray within the batch
+            best = np.lexsort((pair_tris, t, pair_rays))
+            first = np.ones(len(best), dtype=bool)
+            first[1:] = pair_rays[best[1:]] != pair_rays[best[:-1]]
+            best = best[first]
+            ts[pair_rays[best]] = t[best]
+            tris[pair_rays[best]] = pair_tris[best]
+
+    # Ray parameters of ray hits from origins with triangles tris, inf for misses
+    def triangle_hits(self, origins, ray, tris):
+        dtype = origins.dtype
+        corners = self.vertices[self.faces[tris]].astype(dtype, copy=False)
+        v0 = corners[:, 0]
+        e1, e2 = corners[:, 1] - v0, corners[:, 2] - v0
+        p = np.cross(ray, e2)
+        det = np.sum(e1 * p, axis=1)
+        s = origins - v0
+        q = np.cross(s, e1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inverse = 1 / det
+            u = np.sum(s * p, axis=1) * inverse
+            v = (q @ ray) * inverse
+            t = np.sum(e2 * q, axis=1) * inverse
+            hit = (det != 0) & (u >= 0) & (v >= 0) & (u + v <= 1) & (t >= 0)
+        return np.where(hit, t, np.inf).astype(dtype, copy=False)
+
+    # Unit normals of triangles tris
+    def normals(self, tris):
+        corners = self.vertices[self.faces[tris]]
+        normal = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        length = np.linalg.norm(normal, axis=1)[:, np.newaxis]
+        return normal / np.where(length > 0, length, 1)
+
+    # Edges of at most limit triangles spread evenly over the mesh, as (E, 2, 3) mesh space points
+    def wire_edges(self, limit):
+        tris = np.arange(0, len(self.faces), max(1, -(-len(self.faces) // limit)))
+        corners = self.vertices[self.faces[tris]]
+        return np.stack([corners, np.roll(corners, -1, axis=1)], axis=2).reshape((-1, 2, 3))
+
+# Imports a mesh source, reusing its cache when the source has not changed since it was written
+def load_mesh(path):
+    directory = cache_path(path)
+    stamp = source_stamp(path)
+    meta_path = os.path.join(directory, "mesh.json")
+    if os.path.exists(meta_path):
+        with open(meta_path) as file_ptr:
+            meta = json.load(file_ptr)
+        if meta.get("version") == MESH_CACHE_VERSION and meta.get("source") == stamp:
+            arrays = [np.load(os.path.join(directory, name + ".npy"), mmap_mode="r")
+                      for name in ["vertices", "faces", "nodes_min", "nodes_max"]]
+            return MeshData(*arrays, leaf_size=meta["leafSize"], stamp=meta["built"])
+    vertices, faces = read_mesh(path)
+    faces, nodes_min, nodes_max = build_bvh(vertices, faces)
+    built = hashlib.sha1(json.dumps([os.path.abspath(path), stamp]).encode()).hexdigest()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        for name, array in [("vertices", vertices), ("faces", faces), ("nodes_min", nodes_min), ("nodes_max", nodes_max)]:
+            np.save(os.path.join(directory, name + ".npy"), array)
+        # written last, so an interrupted import leaves no valid cache behind
+        with open(meta_path, "w") as file_ptr:
+            json.dump({"version": MESH_CACHE_VERSION, "source": stamp, "leafSize": BVH_LEAF_SIZE,
+                       "built": built, "triangles": len(faces)}, file_ptr)
+    except OSError:
+        pass
+    return MeshData(vertices, faces, nodes_min, nodes_max, stamp=built)
+
+def test_mesh():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "quad.obj")
+        with open(path, "w") as file_ptr:
+            file_ptr.write("v -1 0 -1\nv 1 0 -1\nv 1 0 1\nv -1 0 1\nf 1/1 2/2 3/3 4/4\n")
+        data = load_mesh(path)
+        assert len(data.faces) == 2 and isinstance(load_mesh(path).vertices.base, np.memmap)
+        origins = np.array([[0.5, -2, 0.2], [2, -2, 0], [-0.5, -2, -0.5]])
+        ts, tris = data.intersect(origins, np.array([0.0, 1.0, 0.0]))
+        assert np.allclose(ts, [2, np.inf, 2]) and tris[1] == -1
+        print("mesh cache", cache_path(path), "hits", ts, tris)
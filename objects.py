@@ -1,5 +1,12 @@
 import numpy as np
+import base64
+import hashlib
 import math
+import os
+import time
+import kernels
+import mesh
+import quaternions
 
 # Default camera plane x vector
 DEFAULT_X = np.array([1, 0, 0])
@@ -13,6 +20,8 @@ BACKGROUND_DEFAULT_COLOR = np.array([20, 20, 20])
 OBJECT_DEFAULT_COLOR = np.array([128, 128, 128])
 # Default quaternion
 DEFAULT_QUATERNION = np.array([0, 0, 1, 0])
+# Quaternion of no rotation
+IDENTITY_QUATERNION = np.array([1, 0, 0, 0])
 # How much color varies by camera angle with object normals
 COLOR_VARIANCE_FACTOR = 0.4
 # How much should white contribute to color based on camera angle with object normals
@@ -21,58 +30,152 @@ SPECULAR_FACTOR = 0.4
 DPR = 180 / math.pi
 # Small constant to prevent quaternions from zeroing out during object editing
 EPSILON = 1e-5
+# Sub-pixel sample offsets used when supersampling a pixel (4x ordered grid)
+SUPERSAMPLE_OFFSETS = [(-0.25, -0.25), (-0.25, 0.25), (0.25, -0.25), (0.25, 0.25)]
+# Largest per-channel color difference between neighboring pixels that is not treated as an edge
+EDGE_COLOR_THRESHOLD = 24
+# Use compiled kernels (see kernels.py) for raytraces whenever Numba is installed
+USE_KERNELS = True
+# Extra pixels around the viewport kept by frame culling and clipping, covers the frame pen width
+FRAME_CULL_MARGIN = 5
+# Objects whose projected bounding diameter (in pixels) is below this are framed as a single point
+FRAME_POINT_SIZE = 8
+# Objects whose projected bounding diameter (in pixels) is below this are not framed at all
+FRAME_SKIP_SIZE = 1
+# Number of entries in the uint8 shading lookup tables used by float32 precision traces
+SHADE_LUT_SIZE = 1024
+# Relative slack subtracted from minimum object depths so that rounding never skips a real hit
+DEPTH_ORDER_SLACK = 1e-9
+# Largest number of (ray, instance) pairs intersected at once by Instances.ortho_dists
+INSTANCE_PAIR_CHUNK = 1 << 20
+# Relative slack added to instance bounding radii when binning instances by ray, covers rounding
+INSTANCE_BIN_SLACK = 1e-6
+# Instance binnings kept per Instances object, one per ray direction, so that viewports do not evict each other's
+INSTANCE_BIN_CACHE_SIZE = 8
+# Largest number of triangles drawn as the wireframe of a mesh in frame mode
+MESH_FRAME_TRIANGLES = 2000
+# Largest distance (in pixels) from a whole pixel shift for which a camera move still counts as a pan
+PAN_PIXEL_TOLERANCE = 1e-6
 
 min_raytrace_dist = 0
 
-# Utility equations
-diag = lambda q, a, b: 1 - 2 * (q[a] ** 2 + q[b] ** 2)
-odiag_pos = lambda q, a, b, c, d: 2 * (q[a] * q[b] + q[c] * q[d])
-odiag_neg = lambda q, a, b, c, d: 2 * (q[a] * q[b] - q[c] * q[d])
-trig = lambda n, a: math.sin(n) if a else math.cos(n)
-trig_3 = lambda v, a, b, c: trig(v[0], a) * trig(v[1], b) * trig(v[2], c)
-
 # Converts a rotation quaternion into its corresponding conjugation matrix
 def rot_quat_to_matrix(q):
     # assume unit quaternion
-    matrix = [[diag(q, 2, 3), odiag_neg(q, 1, 2, 3, 0), odiag_pos(q, 1, 3, 2, 0)],
-              [odiag_pos(q, 1, 2, 3, 0), diag(q, 1, 3), odiag_neg(q, 2, 3, 1, 0)],
-              [odiag_neg(q, 1, 3, 2, 0), odiag_pos(q, 2, 3, 1, 0), diag(q, 1, 2)]]
-    return np.array(matrix)
+    return quaternions.to_matrix(q)[0]
 
 def rot_quat(axis, ang):
-    unit_axis = axis / np.linalg.norm(axis)
-    return np.concatenate((np.array([math.cos(ang/2)]), math.sin(ang/2)*unit_axis))
+    return quaternions.from_axis_angle(axis, ang)[0]
 
-# Loads objects from JSON data
-def load_objs(data):
-    camera, results = None, []
+# High, mid and low shading colors of (..., 3) base colors
+def shade_colors(color):
+    v = COLOR_VARIANCE_FACTOR / 2
+    high = np.clip((1 + v) * color + SPECULAR_FACTOR * 255 * np.ones(3), 0, 255)
+    mid = np.clip(color + 0.5 * SPECULAR_FACTOR * 255 * np.ones(3), 0, 255)
+    low = np.clip((1 - v) * color, 0, 255)
+    return high, mid, low
+
+# Blends shading colors by render values (see BaseObject.render), one color per render value
+#     the shading colors may be single colors or one row per render value
+def blend_shades(renders, high, mid, low):
+    renders = renders[:, np.newaxis]
+    dark = 2 * renders * mid + (1 - 2 * renders) * low
+    light = 2 * (renders - 0.5) * high + (1 - 2 * (renders - 0.5)) * mid
+    return np.where(renders < 0, 0, np.where(renders < 0.5, dark, light))
+
+# Translates the objects at idxs by delta with one array operation
+def translate_group(objs, idxs, delta):
+    positions = np.array([objs[idx].position for idx in idxs], dtype=float) + delta
+    for idx, position in zip(idxs, positions):
+        objs[idx].position = position
+
+# Rotates the objects at idxs by an offset quaternion around a shared pivot with one array operation
+def rotate_group(objs, idxs, quaternion, pivot):
+    positions = np.array([objs[idx].position for idx in idxs], dtype=float)
+    rotations = np.array([objs[idx].quaternion for idx in idxs], dtype=float)
+    rotations = quaternions.multiply(rotations, quaternion)
+    # displacements from the pivot rotate the opposite way to object bases, see BaseObject.rotate
+    inverse = quaternions.to_matrix(quaternions.conjugate(quaternions.normalize(quaternion)))[0]
+    positions = pivot + (positions - pivot) @ inverse.T
+    for idx, position, rotation in zip(idxs, positions, rotations):
+        objs[idx].position = position
+        objs[idx].quaternion = rotation
+
+
+# Bounding sphere centers and radii of objects as (N, 3) and N arrays
+#     scene may be a render_cache.SceneCache, which keeps them for every camera of the scene version
+def object_bounds(objs, scene=None):
+    if scene is not None:
+        return scene.get("bounds", lambda: object_bounds(objs))
+    positions = np.array([obj.position for obj in objs], dtype=float).reshape((-1, 3))
+    return positions, np.array([obj.bounding_radius() for obj in objs], dtype=float)
+
+# Encodes an array for JSON storage as its dtype, shape and base64 encoded bytes
+def encode_array(array):
+    return {
+        "dtype": array.dtype.str,
+        "shape": list(array.shape),
+        "data": base64.b64encode(np.ascontiguousarray(array).tobytes()).decode("ascii")
+    }
+
+# Decodes an array stored by encode_array, the result is read-only
+def decode_array(data):
+    return np.frombuffer(base64.b64decode(data["data"]), dtype=np.dtype(data["dtype"])).reshape(data["shape"])
+
+# Loads a box or sphere primitive from JSON data
+def load_primitive(loaded_data):
+    if loaded_data["type"] == "Box":
+        return Box(position=np.array(loaded_data["position"]),
+                   name=loaded_data["name"],
+                   quaternion=np.array(loaded_data["quaternion"]),
+                   color=np.array(loaded_data["color"]),
+                   dims=np.array(loaded_data["dims"]))
+    elif loaded_data["type"] == "Sphere":
+        return Sphere(position=np.array(loaded_data["position"]),
+                      name=loaded_data["name"],
+                      quaternion=np.array(loaded_data["quaternion"]),
+                      color=np.array(loaded_data["color"]),
+                      radius=loaded_data["radius"])
+    raise TypeError("Invalid type of primitive found in JSON files!")
+
+# Loads the cameras and objects of a saved scene from JSON data, cameras keep their saved order
+def load_scene(data):
+    cameras, results = [], []
     for loaded_data in data:
-        if loaded_data["type"] == "Box":
-            results.append(Box(position=np.array(loaded_data["position"]),
-                              name=loaded_data["name"],
-                              quaternion=np.array(loaded_data["quaternion"]),
-                              color=np.array(loaded_data["color"]),
-                              dims=np.array(loaded_data["dims"])))
-        elif loaded_data["type"] == "Sphere":
-            results.append(Sphere(position=np.array(loaded_data["position"]),
-                               name=loaded_data["name"],
-                               quaternion=np.array(loaded_data["quaternion"]),
-                               color=np.array(loaded_data["color"]),
-                               radius=loaded_data["radius"]))
+        if loaded_data["type"] in ["Box", "Sphere"]:
+            results.append(load_primitive(loaded_data))
+        elif loaded_data["type"] == "Instances":
+            optional = lambda key: None if loaded_data[key] is None else decode_array(loaded_data[key])
+            results.append(Instances(prototype=load_primitive(loaded_data["prototype"]),
+                                     offsets=decode_array(loaded_data["offsets"]),
+                                     rotations=optional("rotations"),
+                                     colors=optional("colors"),
+                                     position=np.array(loaded_data["position"]),
+                                     name=loaded_data["name"],
+                                     quaternion=np.array(loaded_data["quaternion"]),
+                                     color=np.array(loaded_data["color"])))
+        elif loaded_data["type"] == "Mesh":
+            results.append(Mesh(path=loaded_data["path"],
+                                position=np.array(loaded_data["position"]),
+                                name=loaded_data["name"],
+                                quaternion=np.array(loaded_data["quaternion"]),
+                                color=np.array(loaded_data["color"])))
         elif loaded_data["type"] == "Camera":
-            if camera is None:
-                camera = Camera(position=np.array(loaded_data["position"]),
+            cameras.append(Camera(position=np.array(loaded_data["position"]),
                                   quaternion=np.array(loaded_data["quaternion"]),
                                   color=np.array(loaded_data["color"]),
                                   dims=np.array(loaded_data["dims"]),
-                                  viewport_dims = np.array(loaded_data["vdims"]))
-            else:
-                raise TypeError("Cannot have more than one camera present in the scene.")
+                                  viewport_dims = np.array(loaded_data["vdims"])))
         else:
             raise TypeError("Invalid type of object found in JSON files!")
-    if camera is None:
+    if len(cameras) == 0:
         raise TypeError("Camera is missing from the scene!")
-    return camera, results
+    return cameras, results
+
+# Loads a saved scene, returning its first camera and its objects
+def load_objs(data):
+    cameras, results = load_scene(data)
+    return cameras[0], results
 
 # An object with 3D space coordinates
 class BaseObject:
@@ -85,10 +188,8 @@ class BaseObject:
         self.position = position
         self.quaternion = quaternion
         self.color = color
-        v = COLOR_VARIANCE_FACTOR / 2
-        self.highColor = np.clip((1 + v) * self.color + SPECULAR_FACTOR * 255 * np.ones(3), 0, 255)
-        self.midColor = np.clip(self.color + 0.5 * SPECULAR_FACTOR * 255 * np.ones(3), 0, 255)
-        self.lowColor = np.clip((1 - v) * self.color, 0, 255)
+        self.highColor, self.midColor, self.lowColor = shade_colors(self.color)
+        self.shadeLut = None
 
     # Translates object by an offset of delta
     def translate(self, delta=np.zeros(3)):
@@ -99,33 +200,19 @@ class BaseObject:
         pivot = pivot if pivot is not None else self.position
         delta = self.position - pivot
         # multiply rotation quaternions
-        s, v = self.quaternion[0], self.quaternion[1:4]
-        t, w = quaternion[0], quaternion[1:4]
-        ang = s * t - np.dot(v.T, w)
-        ax = s * w + t * v + np.cross(v, w)
-        self.quaternion = np.concatenate((np.array([ang]), ax))
+        self.quaternion = quaternions.multiply(self.quaternion, quaternion)[0]
         # compute displacement from pivot
         if np.linalg.norm(delta) != 0:
-            theta = 2 * math.acos(quaternion[0])
-            axis = 2 * quaternion[1:4] / math.sin(theta)
-            self.position = pivot + np.dot(rot_quat_to_matrix(rot_quat(axis, -theta)), delta)
+            inverse = quaternions.conjugate(quaternions.normalize(quaternion))
+            self.position = pivot + quaternions.rotate_vectors(inverse, delta)[0]
 
     # Obtains the XYZ Euler angles from the object's quaternion
     def get_euler(self):
-        q = self.quaternion
-        rx = DPR * math.atan2(odiag_pos(q, 0, 1, 2, 3), diag(q, 1, 2))
-        ry = DPR * math.asin(odiag_neg(q, 0, 2, 3, 1))
-        rz = DPR * math.atan2(odiag_pos(q, 0, 3, 1, 2), diag(q, 2, 3))
-        return np.array([(rx + 180) % 360, ry, (rz + 180) % 360])
+        return quaternions.to_euler(self.quaternion)[0]
 
     # Sets the object's quaternion according to input Euler angles
     def set_euler(self, euler=np.zeros(3)):
-        self.quaternion = self.quaternion + EPSILON * np.ones(4)
-        e = 0.5 * (euler + np.array([180, 0, 180])) / DPR
-        self.quaternion[0] = trig_3(e, 0, 0, 0) + trig_3(e, 1, 1, 1)
-        self.quaternion[1] = trig_3(e, 1, 0, 0) - trig_3(e, 0, 1, 1)
-        self.quaternion[2] = trig_3(e, 0, 1, 0) + trig_3(e, 1, 0, 1)
-        self.quaternion[3] = trig_3(e, 0, 0, 1) - trig_3(e, 1, 1, 0)
+        self.quaternion = quaternions.from_euler(euler)[0]
 
     # Orthographic distance based on position point of object
     # The second result is additional context that may be used later
@@ -140,6 +227,15 @@ class BaseObject:
     def get_frame(self, camera):
         return []
 
+    # Radius of a sphere around position that encloses the object, used for view culling
+    def bounding_radius(self):
+        return 0
+
+    # Pixels covered by the object on an I x J grid for Camera.rasterize
+    #     returns pixel coordinates u, v with the depth and color of the object at each of them
+    def coverage(self, camera, I, J, simple=False):
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0), np.zeros((0, 3))
+
     # BaseObjects have no tangible form and so do not show up on renders
     #     -1: object does not appear in path of ray
     #     0: object surface is parallel to ray
@@ -147,6 +243,15 @@ class BaseObject:
     def render(self, context):
         return -1
 
+    # Vectorized ortho_dist for many ray origins sharing the same ray direction
+    #     returns one distance per origin and a context that may be passed to renders
+    def ortho_dists(self, origins, ray):
+        return np.full(len(origins), float("inf")), {"origin": origins}
+
+    # Vectorized render, returning one render value per origin of the context
+    def renders(self, context):
+        return -np.ones(len(context["origin"]))
+
     # Obtains a color based on result of calling render
     def get_color_at(self, render):
         if (render < 0): # invalid call
@@ -157,16 +262,47 @@ class BaseObject:
             render -= 0.5
             return 2 * render * self.highColor + (1 - 2 * render) * self.midColor
 
+    # Vectorized get_color_at for an array of render results
+    def get_colors_at(self, renders):
+        return blend_shades(renders, self.highColor, self.midColor, self.lowColor)
+
+    # Lookup table of get_colors_at over evenly spaced render values in [0, 1], as uint8 colors
+    def shade_lut(self):
+        return np.round(self.get_colors_at(np.linspace(0, 1, SHADE_LUT_SIZE))).astype(np.uint8)
+
+    # Shades render values through shade_lut instead of evaluating get_colors_at per ray
+    #     the table is built on the first float32 trace and kept until the colors change, so objects
+    #     only ever raytraced in float64 do not carry one
+    def lut_colors_at(self, renders):
+        if self.shadeLut is None:
+            self.shadeLut = self.shade_lut()
+        return self.shadeLut[np.rint(np.clip(renders, 0, 1) * (SHADE_LUT_SIZE - 1)).astype(np.intp)]
+
+    # Colors of the rays of a context won by the object, used by Camera.trace
+    #     simple skips shading, single shades through uint8 lookup tables (see Camera.trace precision)
+    def shade(self, context, simple=False, single=False):
+        if simple:
+            return np.round(self.simple_colors(context))
+        elif single:
+            return self.lut_colors_at(self.renders(context))
+        return np.round(self.get_colors_at(self.renders(context)))
+
     def update_colors(self):
-        v = COLOR_VARIANCE_FACTOR / 2
-        self.highColor = np.clip((1 + v) * self.color + SPECULAR_FACTOR * 255 * np.ones(3), 0, 255)
-        self.midColor = np.clip(self.color + 0.5 * SPECULAR_FACTOR * 255 * np.ones(3), 0, 255)
-        self.lowColor = np.clip((1 - v) * self.color, 0, 255)
+        self.highColor, self.midColor, self.lowColor = shade_colors(self.color)
+        self.shadeLut = None
 
     # Simple color fetch that bypasses rendering step
     def simple_color(self, context):
         return self.color
 
+    # Vectorized simple_color for every origin of the context
+    def simple_colors(self, context):
+        return np.tile(self.color, (len(context["origin"]), 1))
+
+    # Content that identifies the object's pixels, hashed by render_cache.render_key
+    def key(self):
+        return self.dict()
+
     # Returns the object as a JSON string for storage purposes
     def dict(self):
         return {
@@ -184,6 +320,8 @@ BOX_CORNER_PAIR_IDXS = [(0, 4), (1, 5), (2, 6), (3, 7),
 
 # A box primitive 3D object
 class Box(BaseObject):
+    KERNEL_KIND = kernels.KIND_BOX
+
     def __init__(self,
                  position=np.zeros(3),
                  name="box",
@@ -216,6 +354,53 @@ class Box(BaseObject):
         return [(corners[a][[0, 2]], corners[b][[0, 2]], get_color(corners[a][1], corners[b][1]), "Line", (corners[a][1] + corners[b][1]) / 2)
                 for a, b in BOX_CORNER_PAIR_IDXS]
 
+    # Half of the box diagonal
+    def bounding_radius(self):
+        return 0.5 * np.linalg.norm(self.dims)
+
+    # Scan-converts the (at most three) faces turned towards the camera
+    #     each face is a parallelogram in the camera plane with a planar depth
+    def coverage(self, camera, I, J, simple=False):
+        to_camera, basis = camera.basis(), self.basis()
+        ray = np.dot(basis, to_camera[1])
+        unit = ray / np.linalg.norm(ray)
+        center = to_camera @ (self.position - camera.position)
+        # rows are the box axes in camera space
+        axes = basis @ to_camera.T
+        half = 0.5 * self.dims
+        ranks = np.empty(3, dtype=int)
+        ranks[np.argsort(np.abs(unit))] = np.arange(3)
+        shades = np.array([self.lowColor, self.midColor, self.highColor])
+        us, vs, depths, colors = [], [], [], []
+        for i in range(3):
+            if ray[i] == 0:
+                continue
+            j, k = (i + 1) % 3, (i + 2) % 3
+            face = center - np.sign(ray[i]) * half[i] * axes[i]
+            ej, ek = half[j] * axes[j], half[k] * axes[k]
+            det = ej[0] * ek[2] - ek[0] * ej[2]
+            # faces seen edge-on cover no pixel samples
+            if abs(det) < 1e-12:
+                continue
+            extent = np.abs(ej[[0, 2]]) + np.abs(ek[[0, 2]])
+            u, v, x, z = camera.plane_pixels(face[[0, 2]] - extent, face[[0, 2]] + extent, I, J)
+            px, pz = x - face[0], z - face[2]
+            a = (px * ek[2] - ek[0] * pz) / det
+            b = (ej[0] * pz - px * ej[2]) / det
+            depth = face[1] + a * ej[1] + b * ek[1]
+            hit = (np.abs(a) <= 1) & (np.abs(b) <= 1) & (depth >= 0)
+            n = np.count_nonzero(hit)
+            us.append(u[hit])
+            vs.append(v[hit])
+            depths.append(depth[hit])
+            if simple:
+                colors.append(np.round(np.tile(shades[ranks[i]], (n, 1))))
+            else:
+                colors.append(np.round(self.get_colors_at(np.full(n, abs(unit[i])))))
+        if len(us) == 0:
+            return super().coverage(camera, I, J, simple)
+        return np.concatenate(us), np.concatenate(vs), np.concatenate(depths), np.concatenate(colors)
+
     # Orthographic distance for a box
     def ortho_dist(self, origin, ray):
         # get box space coordinates of origin
@@ -250,6 +435,41 @@ class Box(BaseObject):
             "argmax": argmax_t
         }
 
+    # Vectorized orthographic distance for a box
+    #     computes in the precision of origins, so float32 origins give float32 results
+    def ortho_dists(self, origins, ray):
+        # get box space coordinates of origins
+        dtype = origins.dtype
+        basis = self.basis().astype(dtype, copy=False)
+        offsets = origins - self.position.astype(dtype, copy=False)
+        # written out per component so that compiled kernels can reproduce it bit for bit
+        new_origins = offsets[:, 0:1] * basis[:, 0] + offsets[:, 1:2] * basis[:, 1] + offsets[:, 2:3] * basis[:, 2]
+        ray = np.dot(basis, ray.astype(dtype, copy=False))
+        # obtain extent of box in box space
+        pmin, pmax = (-0.5 * self.dims).astype(dtype), (0.5 * self.dims).astype(dtype)
+        # bounding box check, axes parallel to the ray never constrain t
+        n = len(origins)
+        tmins, tmaxs = np.full((n, 3), float("-inf"), dtype=dtype), np.full((n, 3), float("inf"), dtype=dtype)
+        inside = np.ones(n, dtype=bool)
+        for i in range(3):
+            if (ray[i] != 0):
+                t0 = (pmin[i] - new_origins[:, i]) / ray[i]
+                t1 = (pmax[i] - new_origins[:, i]) / ray[i]
+                tmins[:, i] = np.minimum(t0, t1)
+                tmaxs[:, i] = np.maximum(t0, t1)
+            else:
+                inside &= (new_origins[:, i] >= pmin[i]) & (new_origins[:, i] <= pmax[i])
+        # obtain time of first collision
+        argmax = np.argmax(tmins, axis=1)
+        t = tmins[np.arange(n), argmax]
+        hit = inside & (t <= np.min(tmaxs, axis=1)) & (t >= 0)
+        dists = np.where(hit, t * np.linalg.norm(ray), float("inf"))
+        return dists, {
+            "origin": origins,
+            "ray": ray / np.linalg.norm(ray),
+            "argmax": argmax
+        }
+
     # Simple color fetch that bypasses rendering step
     def simple_color(self, context):
         idxs = np.argsort(np.abs(context["ray"]))
@@ -260,12 +480,22 @@ class Box(BaseObject):
             return self.midColor
         return self.lowColor
 
+    # Vectorized simple_color for every origin of the context
+    def simple_colors(self, context):
+        ranks = np.empty(3, dtype=int)
+        ranks[np.argsort(np.abs(context["ray"]))] = np.arange(3)
+        return np.array([self.lowColor, self.midColor, self.highColor])[ranks[context["argmax"]]]
+
     # Compute dot product between normal and ray
     #     based on what face the ray hit the box at
     # Because we are in object space, this is very simple
     def render(self, context):
         return abs(context["ray"][context["argmax"]])
 
+    # Vectorized render for every origin of the context
+    def renders(self, context):
+        return np.abs(context["ray"][context["argmax"]])
+
     # Returns the box as a JSON string for storage purposes
     def dict(self):
         return {
@@ -279,6 +509,8 @@ class Box(BaseObject):
 
 # A sphere primitive 3D object
 class Sphere(BaseObject):
+    KERNEL_KIND = kernels.KIND_SPHERE
+
     def __init__(self,
                  position=np.zeros(3),
                  name="sphere",
@@ -298,6 +530,27 @@ class Sphere(BaseObject):
         center = np.array([vp_ratio * (center[0] + camera.dims[0] / 2), center[1], vp_ratio * (center[2] + camera.dims[1] / 2)])
         return [(center[[0, 2]], vp_ratio * self.radius, self.color, "Circle", center[1])]
 
+    def bounding_radius(self):
+        return self.radius
+
+    # Scan-converts the disk covered by the sphere, with closed-form depth and normal
+    def coverage(self, camera, I, J, simple=False):
+        center = camera.basis() @ (self.position - camera.position)
+        r = self.radius
+        u, v, x, z = camera.plane_pixels(center[[0, 2]] - r, center[[0, 2]] + r, I, J)
+        dx, dz = x - center[0], z - center[2]
+        h2 = r * r - dx * dx - dz * dz
+        inside = h2 >= 0
+        u, v, h = u[inside], v[inside], np.sqrt(h2[inside])
+        # the far side is seen when the camera plane cuts through the sphere
+        depth = np.where(center[1] - h >= 0, center[1] - h, center[1] + h)
+        hit = depth >= 0
+        u, v, h, depth = u[hit], v[hit], h[hit], depth[hit]
+        if simple:
+            return u, v, depth, np.round(np.tile(self.color, (len(u), 1)))
+        # the surface normal along the ray is h / r
+        return u, v, depth, np.round(self.get_colors_at(h / r))
+
     # Orthographic distance for a sphere
     def ortho_dist(self, origin, ray):
         # solve quadratic problem
@@ -333,6 +586,28 @@ class Sphere(BaseObject):
                 "dist": float("inf")
             }
 
+    # Vectorized orthographic distance for a sphere
+    #     computes in the precision of origins, so float32 origins give float32 results
+    def ortho_dists(self, origins, ray):
+        # solve quadratic problem for every origin at once
+        ray = ray.astype(origins.dtype, copy=False)
+        offsets = origins - self.position.astype(origins.dtype, copy=False)
+        ox, oy, oz = offsets[:, 0], offsets[:, 1], offsets[:, 2]
+        a = np.dot(ray.T, ray)
+        b = 2 * (ox * ray[0] + oy * ray[1] + oz * ray[2])
+        c = (ox * ox + oy * oy + oz * oz) - self.radius ** 2
+        discrim = b * b - 4 * a * c
+        root = np.sqrt(np.maximum(discrim, 0))
+        t0, t1 = (-b - root) / (2*a), (-b + root) / (2*a)
+        # discard negative t values and rays that miss the sphere
+        t = np.where(t0 >= 0, t0, np.where(t1 >= 0, t1, float("inf")))
+        t[discrim < 0] = float("inf")
+        return t * np.linalg.norm(ray), {
+            "ray": ray,
+            "origin": origins,
+            "dist": t
+        }
+
     # Compute dot product between incident ray and sphere surface normal
     def render(self, context):
         contact = context["origin"] + context["dist"] * context["ray"]
@@ -341,6 +616,15 @@ class Sphere(BaseObject):
         unit_ray = context["ray"] / np.linalg.norm(context["ray"])
         return abs(np.dot(unit_normal.T, unit_ray))
 
+    # Vectorized render for every origin of the context
+    def renders(self, context):
+        contact = context["origin"] + context["dist"][:, np.newaxis] * context["ray"]
+        normal = contact - self.position.astype(contact.dtype, copy=False)
+        nx, ny, nz = normal[:, 0], normal[:, 1], normal[:, 2]
+        length = np.sqrt(nx * nx + ny * ny + nz * nz)
+        unit_ray = context["ray"] / np.linalg.norm(context["ray"])
+        return np.abs(nx / length * unit_ray[0] + ny / length * unit_ray[1] + nz / length * unit_ray[2])
+
     # Returns the box as a JSON string for storage purposes
     def dict(self):
         return {
@@ -352,6 +636,446 @@ class Sphere(BaseObject):
             "radius": self.radius
         }
 
+# Many copies of one box or sphere prototype, stored as arrays instead of one object per copy
+#     instances are placed by (N, 3) offsets and optional (N, 4) rotations relative to the group
+#     position and quaternion, so moving or rotating the group moves every instance like one object
+#     colors may give every instance its own (N, 3) uint8 color, otherwise instances take the group color
+#     only the shape (dims or radius) and default color of the prototype are used
+#     offsets, rotations and colors are treated as immutable once created
+#     rays are intersected with NumPy only, scenes holding instances skip the compiled kernels
+class Instances(BaseObject):
+    def __init__(self,
+                 prototype,
+                 offsets,
+                 rotations=None,
+                 colors=None,
+                 position=np.zeros(3),
+                 name="instances",
+                 quaternion=IDENTITY_QUATERNION,
+                 color=None):
+        super().__init__(position, name, quaternion, prototype.color if color is None else color)
+        self.prototype = prototype
+        self.offsets = np.asarray(offsets, dtype=float).reshape((-1, 3))
+        # None rotates every instance by DEFAULT_QUATERNION like a fresh primitive
+        self.rotations = None if rotations is None else np.asarray(rotations, dtype=float).reshape((-1, 4))
+        self.colors = None if colors is None else np.asarray(colors, dtype=np.uint8).reshape((-1, 3))
+        self.count = len(self.offsets)
+        spread = np.sqrt(np.max(np.sum(self.offsets ** 2, axis=1))) if self.count > 0 else 0
+        self.radius = spread + prototype.bounding_radius()
+        # world transforms, instance bins and encoded arrays are rebuilt lazily
+        #     viewports may trace at once, so the caches are replaced whole and never updated in place
+        self.world_cache = None
+        self.bin_cache = {}
+        self.encoded = None
+        self.digest = None
+
+    # World positions, quaternions and (N, 3, 3) basis matrices of the instances
+    #     cached until the group position or quaternion changes, which may happen in place
+    def world(self):
+        return self.world_entry()[1:]
+
+    # world results preceded by the group pose they were computed for
+    def world_entry(self):
+        position, quaternion = np.asarray(self.position, dtype=float), np.asarray(self.quaternion, dtype=float)
+        key = (position.tobytes(), quaternion.tobytes())
+        entry = self.world_cache
+        if entry is None or entry[0] != key:
+            rotations = self.rotations if self.rotations is not None else DEFAULT_QUATERNION
+            quats = quaternions.multiply(rotations, quaternion)
+            if len(quats) != self.count:
+                quats = np.tile(quats, (self.count, 1))
+            # offsets rotate the opposite way to instance bases, see BaseObject.rotate
+            inverse = quaternions.to_matrix(quaternions.conjugate(quaternions.normalize(quaternion)))[0]
+            positions = position + self.offsets @ inverse.T
+            entry = (key, positions, quats, quaternions.to_matrix(quats))
+            self.world_cache = entry
+        return entry
+
+    # Standalone primitive for instance k
+    def instance(self, k):
+        positions, quats, _ = self.world()
+        color = self.color.copy() if self.colors is None else self.colors[k].astype(float)
+        name = "{0}[{1}]".format(self.name, k)
+        if isinstance(self.prototype, Sphere):
+            return Sphere(positions[k].copy(), name, quats[k].copy(), color, self.prototype.radius)
+        return Box(positions[k].copy(), name, quats[k].copy(), color, self.prototype.dims.copy())
+
+    # Every instance as a standalone primitive
+    def expand(self):
+        return [self.instance(k) for k in range(self.count)]
+
+    def bounding_radius(self):
+        return self.radius
+
+    # Frame items of the visible instances, following the point and skip sizes of Camera.frame_rasterize
+    def frame_items(self, camera, point_size=FRAME_POINT_SIZE, skip_size=FRAME_SKIP_SIZE, full_detail=False):
+        positions = self.world()[0]
+        radii = np.full(self.count, self.prototype.bounding_radius(), dtype=float)
+        keep, centers, sizes = camera.cull_spheres(positions, radii)
+        items = []
+        detailed = np.ones(len(keep), dtype=bool) if full_detail else sizes >= point_size
+        for k in keep[detailed]:
+            items.extend(self.instance(k).get_frame(camera))
+        points = ~detailed & (sizes >= skip_size)
+        for k, center, size in zip(keep[points], centers[points], sizes[points]):
+            color = self.color if self.colors is None else self.colors[k].astype(float)
+            items.append((center[[0, 2]], size, color, "Point", center[1]))
+        return items
+
+    def get_frame(self, camera):
+        return self.frame_items(camera, full_detail=True)
+
+    # Coverage of the visible instances, see Camera.rasterize
+    def coverage(self, camera, I, J, simple=False):
+        radii = np.full(self.count, self.prototype.bounding_radius(), dtype=float)
+        keep, _, _ = camera.cull_spheres(self.world()[0], radii)
+        parts = [self.instance(k).coverage(camera, I, J, simple) for k in keep]
+        parts = [part for part in parts if len(part[0]) > 0]
+        if len(parts) == 0:
+            return super().coverage(camera, I, J, simple)
+        return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+
+    # Instances sorted into square cells of the plane perpendicular to ray
+    #     every instance is listed in the (at most four) cells its bounding circle overlaps,
+    #     so a ray can only hit instances listed in the cell of its origin
+    #     binnings are cached by group pose and ray, up to INSTANCE_BIN_CACHE_SIZE of them
+    def bins(self, ray):
+        pose, positions = self.world_entry()[:2]
+        key = pose + (np.asarray(ray, dtype=float).tobytes(),)
+        cached = self.bin_cache.get(key)
+        if cached is not None:
+            return cached
+        unit = np.asarray(ray, dtype=float) / np.linalg.norm(ray)
+        axis = np.cross(unit, np.eye(3)[np.argmin(np.abs(unit))])
+        axis /= np.linalg.norm(axis)
+        plane = np.stack([axis, np.cross(unit, axis)], axis=1)
+        radius = self.prototype.bounding_radius() * (1 + INSTANCE_BIN_SLACK) + INSTANCE_BIN_SLACK
+        size = 2 * radius
+        projected = positions @ plane
+        lo = np.floor((projected - radius) / size).astype(np.int64)
+        hi = np.floor((projected + radius) / size).astype(np.int64)
+        low = lo.min(axis=0)
+        width, height = hi[:, 0].max() - low[0] + 1, hi[:, 1].max() - low[1] + 1
+        cells, ids = [], []
+        for du, dv in [(0, 0), (1, 0), (0, 1), (1, 1)]:
+            covered = np.flatnonzero((lo[:, 0] + du <= hi[:, 0]) & (lo[:, 1] + dv <= hi[:, 1]))
+            cells.append((lo[covered, 0] + du - low[0]) * height + (lo[covered, 1] + dv - low[1]))
+            ids.append(covered)
+        cells, ids = np.concatenate(cells), np.concatenate(ids)
+        order = np.argsort(cells, kind="stable")
+        result = (plane, size, low, width, height, cells[order], ids[order])
+        # binnings of other group poses are stale, the oldest ones beyond the limit are dropped
+        bins = {other: value for other, value in self.bin_cache.items() if other[:2] == pose}
+        bins[key] = result
+        while len(bins) > INSTANCE_BIN_CACHE_SIZE:
+            del bins[next(iter(bins))]
+        self.bin_cache = bins
+        return result
+
+    # Pairs of ray (index into origins) and candidate instance, in chunks of whole rays
+    def candidate_pairs(self, origins, ray):
+        if self.count == 0 or len(origins) == 0:
+            return
+        plane, size, low, width, height, cells, ids = self.bins(ray)
+        spots = np.floor((origins.astype(float) @ plane) / size).astype(np.int64) - low
+        valid = (spots[:, 0] >= 0) & (spots[:, 0] < width) & (spots[:, 1] >= 0) & (spots[:, 1] < height)
+        rays = np.flatnonzero(valid)
+        keys = spots[rays, 0] * height + spots[rays, 1]
+        starts = np.searchsorted(cells, keys, side="left")
+        counts = np.searchsorted(cells, keys, side="right") - starts
+        some = counts > 0
+        rays, starts, counts = rays[some], starts[some], counts[some]
+        ends = np.cumsum(counts)
+        begin = 0
+        while begin < len(rays):
+            base = ends[begin] - counts[begin]
+            end = max(int(np.searchsorted(ends, base + INSTANCE_PAIR_CHUNK, side="right")), begin + 1)
+            chunk = counts[begin:end]
+            total = int(chunk.sum())
+            local = np.arange(total) - np.repeat(np.cumsum(chunk) - chunk, chunk)
+            yield np.repeat(rays[begin:end], chunk), ids[np.repeat(starts[begin:end], chunk) + local]
+            begin = end
+
+    # Orthographic distances of (origin, instance) pairs, mirroring Box and Sphere ortho_dists
+    #     returns distances, ray parameters t and for boxes the box axis of the hit face
+    def pair_dists(self, origins, ray, instances):
+        positions, _, bases = self.world()
+        dtype = origins.dtype
+        ray = ray.astype(dtype, copy=False)
+        offsets = origins - positions[instances].astype(dtype, copy=False)
+        if isinstance(self.prototype, Sphere):
+            ox, oy, oz = offsets[:, 0], offsets[:, 1], offsets[:, 2]
+            a = np.dot(ray.T, ray)
+            b = 2 * (ox * ray[0] + oy * ray[1] + oz * ray[2])
+            c = (ox * ox + oy * oy + oz * oz) - self.prototype.radius ** 2
+            discrim = b * b - 4 * a * c
+            root = np.sqrt(np.maximum(discrim, 0))
+            t0, t1 = (-b - root) / (2*a), (-b + root) / (2*a)
+            t = np.where(t0 >= 0, t0, np.where(t1 >= 0, t1, float("inf")))
+            t[discrim < 0] = float("inf")
+            return t * np.linalg.norm(ray), t, None
+        basis = bases[instances].astype(dtype, copy=False)
+        new_origins = offsets[:, 0:1] * basis[:, :, 0] + offsets[:, 1:2] * basis[:, :, 1] + offsets[:, 2:3] * basis[:, :, 2]
+        local_rays = basis[:, :, 0] * ray[0] + basis[:, :, 1] * ray[1] + basis[:, :, 2] * ray[2]
+        pmin, pmax = (-0.5 * self.prototype.dims).astype(dtype), (0.5 * self.prototype.dims).astype(dtype)
+        n = len(origins)
+        tmins, tmaxs = np.full((n, 3), float("-inf"), dtype=dtype), np.full((n, 3), float("inf"), dtype=dtype)
+        inside = np.ones(n, dtype=bool)
+        # instances differ in which of their axes are parallel to the ray
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for i in range(3):
+                moving = local_rays[:, i] != 0
+                t0 = (pmin[i] - new_origins[:, i]) / local_rays[:, i]
+                t1 = (pmax[i] - new_origins[:, i]) / local_rays[:, i]
+                tmins[moving, i] = np.minimum(t0, t1)[moving]
+                tmaxs[moving, i] = np.maximum(t0, t1)[moving]
+                inside &= moving | ((new_origins[:, i] >= pmin[i]) & (new_origins[:, i] <= pmax[i]))
+        argmax = np.argmax(tmins, axis=1)
+        t = tmins[np.arange(n), argmax]
+        hit = inside & (t <= np.min(tmaxs, axis=1)) & (t >= 0)
+        lengths = np.sqrt(np.sum(local_rays * local_rays, axis=1))
+        return np.where(hit, t * lengths, float("inf")), t, argmax
+
+    # Vectorized orthographic distance to the nearest instance along each ray
+    #     the context holds the instance hit by each ray (-1 for none), earlier instances win ties
+    def ortho_dists(self, origins, ray):
+        n = len(origins)
+        dists = np.full(n, float("inf"), dtype=origins.dtype)
+        hits, ts, argmaxes = np.full(n, -1), np.zeros(n, dtype=origins.dtype), np.zeros(n, dtype=int)
+        for rays, instances in self.candidate_pairs(origins, ray):
+            pair_dists, t, argmax = self.pair_dists(origins[rays], ray, instances)
+            found = np.flatnonzero(pair_dists < float("inf"))
+            if len(found) == 0:
+                continue
+            # nearest pair per ray, chunks never split the pairs of a ray
+            order = found[np.lexsort((instances[found], pair_dists[found], rays[found]))]
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = rays[order[1:]] != rays[order[:-1]]
+            best = order[first]
+            dists[rays[best]] = pair_dists[best]
+            hits[rays[best]] = instances[best]
+            ts[rays[best]] = t[best]
+            if argmax is not None:
+                argmaxes[rays[best]] = argmax[best]
+        return dists, {
+            "origin": origins,
+            "ray": ray.astype(origins.dtype, copy=False),
+            "instance": hits,
+            "dist": ts,
+            "argmax": argmaxes
+        }
+
+    # Ray directions in the box space of the instances hit, as unit vectors
+    def local_rays(self, context):
+        basis = self.world()[2][np.maximum(context["instance"], 0)]
+        ray = context["ray"]
+        local_rays = basis[:, :, 0] * ray[0] + basis[:, :, 1] * ray[1] + basis[:, :, 2] * ray[2]
+        return local_rays / np.sqrt(np.sum(local_rays * local_rays, axis=1))[:, np.newaxis]
+
+    # Shading colors of the instances hit, one row per ray
+    def instance_shades(self, context):
+        if self.colors is None:
+            return self.color, self.highColor, self.midColor, self.lowColor
+        colors = self.colors[np.maximum(context["instance"], 0)].astype(float)
+        return (colors,) + shade_colors(colors)
+
+    # Vectorized render for every origin of the context, see Box.renders and Sphere.renders
+    def renders(self, context):
+        hits = context["instance"]
+        if isinstance(self.prototype, Sphere):
+            centers = self.world()[0][np.maximum(hits, 0)]
+            contact = context["origin"] + context["dist"][:, np.newaxis] * context["ray"]
+            normal = contact - centers.astype(contact.dtype, copy=False)
+            nx, ny, nz = normal[:, 0], normal[:, 1], normal[:, 2]
+            length = np.sqrt(nx * nx + ny * ny + nz * nz)
+            unit_ray = context["ray"] / np.linalg.norm(context["ray"])
+            results = np.abs(nx / length * unit_ray[0] + ny / length * unit_ray[1] + nz / length * unit_ray[2])
+        else:
+            results = np.abs(self.local_rays(context)[np.arange(len(hits)), context["argmax"]])
+        return np.where(hits >= 0, results, -1)
+
+    # Vectorized simple_color for every origin of the context, see Box.simple_colors
+    def simple_colors(self, context):
+        color, high, mid, low = self.instance_shades(context)
+        n = len(context["origin"])
+        if isinstance(self.prototype, Sphere):
+            return np.broadcast_to(color, (n, 3)).copy()
+        # rank of the hit face axis among the axes of each instance, by alignment with the ray
+        order = np.argsort(np.abs(self.local_rays(context)), axis=1)
+        ranks = np.argmax(order == context["argmax"][:, np.newaxis], axis=1)[:, np.newaxis]
+        return np.where(ranks == 2, high, np.where(ranks == 1, mid, low))
+
+    # Shades per instance colors directly, lookup tables would be needed per color
+    def shade(self, context, simple=False, single=False):
+        if simple:
+            return np.round(self.simple_colors(context))
+        _, high, mid, low = self.instance_shades(context)
+        colors = np.round(blend_shades(self.renders(context), high, mid, low))
+        return colors.astype(np.uint8) if single else colors
+
+    # Fields shared by dict and key
+    def header(self):
+        return {
+            "type": "Instances",
+            "name": self.name,
+            "position": self.position.tolist(),
+            "quaternion": self.quaternion.tolist(),
+            "color": self.color.tolist(),
+            "prototype": self.prototype.dict(),
+            "count": self.count
+        }
+
+    # Like dict, with the instance arrays replaced by a digest of their bytes
+    def key(self):
+        if self.digest is None:
+            digest = hashlib.sha1()
+            for array in [self.offsets, self.rotations, self.colors]:
+                digest.update(b"none" if array is None else np.ascontiguousarray(array).tobytes())
+            self.digest = digest.hexdigest()
+        return dict(self.header(), digest=self.digest)
+
+    # Returns the instances as a JSON string for storage purposes
+    #     instance arrays are stored as base64 encoded bytes, see encode_array
+    def dict(self):
+        if self.encoded is None:
+            optional = lambda array: None if array is None else encode_array(array)
+            self.encoded = {
+                "offsets": encode_array(self.offsets),
+                "rotations": optional(self.rotations),
+                "colors": optional(self.colors)
+            }
+        return dict(self.header(), **self.encoded)
+
+# Instances of prototype on a regular grid of shape (nx, ny, nz) with spacing between instance centers
+#     the grid is centered on position
+def instance_grid(prototype, shape, spacing, position=np.zeros(3), colors=None, name="instances"):
+    axes = [(np.arange(n) - (n - 1) / 2) * spacing for n in shape]
+    offsets = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape((-1, 3))
+    return Instances(prototype, offsets, colors=colors, position=np.array(position, dtype=float), name=name)
+
+# Instances replacing a list of boxes (or spheres) of equal size, placed around their mean position
+def instances_from_objects(objs, name="instances"):
+    positions = np.array([obj.position for obj in objs], dtype=float)
+    colors = np.array([obj.color for obj in objs])
+    center = np.mean(positions, axis=0)
+    same_color = np.all(colors == colors[0])
+    return Instances(objs[0], positions - center,
+                     rotations=np.array([obj.quaternion for obj in objs], dtype=float),
+                     colors=None if same_color else np.round(colors),
+                     position=center, name=name, color=colors[0].astype(float))
+
+# A triangle mesh imported from an OBJ or PLY file or a binary vertex/index dump, see mesh.py
+#     triangles are memory-mapped from the mesh cache and intersected through the mesh's BVH
+#     saves refer to the source file, which is imported again (from its cache) on load
+#     rays are intersected with NumPy only, scenes holding meshes skip the compiled kernels
+class Mesh(BaseObject):
+    def __init__(self,
+                 path,
+                 position=np.zeros(3),
+                 name="mesh",
+                 quaternion=DEFAULT_QUATERNION,
+                 color=OBJECT_DEFAULT_COLOR,
+                 data=None):
+        super().__init__(position, name, quaternion, color)
+        self.path = os.path.abspath(path)
+        self.data = mesh.load_mesh(self.path) if data is None else data
+
+    # Mesh space origins and ray, computed like Box.ortho_dists
+    def to_mesh(self, origins, ray):
+        dtype = origins.dtype
+        basis = self.basis().astype(dtype, copy=False)
+        offsets = origins - self.position.astype(dtype, copy=False)
+        new_origins = offsets[:, 0:1] * basis[:, 0] + offsets[:, 1:2] * basis[:, 1] + offsets[:, 2:3] * basis[:, 2]
+        return new_origins, np.dot(basis, ray.astype(dtype, copy=False))
+
+    # Returns mesh space wireframe lines of up to MESH_FRAME_TRIANGLES triangles for rasterization
+    def get_frame(self, camera):
+        edges = self.data.wire_edges(MESH_FRAME_TRIANGLES)
+        if len(edges) == 0:
+            return []
+        # bases are rotations, so their transposes take mesh space to world space
+        points = edges.reshape((-1, 3)) @ self.basis() + self.position - camera.position
+        points = (points @ camera.basis().T).reshape((-1, 2, 3))
+        vp_ratio = camera.vdims[0] / camera.dims[0]
+        pixels = np.stack([vp_ratio * (points[:, :, 0] + camera.dims[0] / 2),
+                           vp_ratio * (points[:, :, 2] + camera.dims[1] / 2)], axis=2)
+        depths = points[:, :, 1].mean(axis=1)
+        low, diff = depths.min(), depths.max() - depths.min()
+        return [(a, b, self.get_color_at(1 - (depth - low) / max(1, diff)), "Line", depth)
+                for (a, b), depth in zip(pixels, depths)]
+
+    def bounding_radius(self):
+        return self.data.radius
+
+    # Traces the pixels under the mesh's bounding circle, meshes have no closed-form coverage
+    def coverage(self, camera, I, J, simple=False):
+        center = camera.basis() @ (self.position - camera.position)
+        r = self.bounding_radius()
+        u, v, _, _ = camera.plane_pixels(center[[0, 2]] - r, center[[0, 2]] + r, I, J)
+        dists, context = self.ortho_dists(camera.pixel_origins(u, v, I, J), camera.basis()[1])
+        hit = dists < float("inf")
+        if simple:
+            return u[hit], v[hit], dists[hit], np.round(np.tile(self.color, (np.count_nonzero(hit), 1)))
+        return u[hit], v[hit], dists[hit], np.round(self.get_colors_at(self.renders(context)[hit]))
+
+    # Orthographic distance for a mesh, see ortho_dists
+    def ortho_dist(self, origin, ray):
+        dists, context = self.ortho_dists(np.atleast_2d(np.asarray(origin, dtype=float)), np.asarray(ray, dtype=float))
+        return dists[0], context
+
+    # Vectorized orthographic distance for a mesh
+    #     computes in the precision of origins, so float32 origins give float32 results
+    def ortho_dists(self, origins, ray):
+        new_origins, ray = self.to_mesh(origins, ray)
+        t, triangles = self.data.intersect(new_origins, ray)
+        return t * np.linalg.norm(ray), {
+            "origin": origins,
+            "ray": ray,
+            "triangle": triangles
+        }
+
+    # Compute dot product between incident ray and the normal of the triangle hit
+    def render(self, context):
+        return self.renders(context)[0]
+
+    # Vectorized render for every origin of the context
+    def renders(self, context):
+        triangles = context["triangle"]
+        normals = self.data.normals(np.maximum(triangles, 0))
+        unit_ray = context["ray"] / np.linalg.norm(context["ray"])
+        return np.where(triangles >= 0, np.abs(normals @ unit_ray), -1)
+
+    # Like dict, with the cache the triangles were read from
+    def key(self):
+        return dict(self.dict(), stamp=self.data.stamp)
+
+    # Returns the mesh as a JSON string for storage purposes
+    def dict(self):
+        return {
+            "type": "Mesh",
+            "name": self.name,
+            "position": self.position.tolist(),
+            "quaternion": self.quaternion.tolist(),
+            "color": self.color.tolist(),
+            "path": self.path
+        }
+
+# Pixel coordinates of an I x J trace grid in image row order, with scratch arrays for the ray origins
+# and hit indices of every pixel, so that a viewport's raytraces of one size do not rebuild them per frame
+class PixelGrid:
+    def __init__(self, I, J):
+        v, u = np.mgrid[0:J, 0:I]
+        self.u, self.v = u.ravel(), v.ravel()
+        self.ids = np.empty(I * J, dtype=np.int64)
+        self.originBuffers = {}
+
+    # Scratch (I * J, 3) ray origin array of dtype
+    def origins(self, dtype):
+        dtype = np.dtype(dtype)
+        if dtype not in self.originBuffers:
+            self.originBuffers[dtype] = np.empty((len(self.u), 3), dtype=dtype)
+        return self.originBuffers[dtype]
+
 # A camera, represented as an object
 class Camera(BaseObject):
     def __init__(self,
@@ -365,62 +1089,360 @@ class Camera(BaseObject):
         self.vdims = viewport_dims
 
     # Generates the ingredients for an orthographic frame raster from a scene of objects
-    def frame_rasterize(self, objs):
+    #     objects outside the view box are culled before any frame geometry is built
+    #     and lines are clipped to the viewport
+    #     objects smaller than point_size pixels become (center, size, color, "Point", depth) items
+    #     and objects smaller than skip_size pixels are dropped, unless full_detail is set
+    #     scene may be a render_cache.SceneCache of objs
+    def frame_rasterize(self, objs, point_size=FRAME_POINT_SIZE, skip_size=FRAME_SKIP_SIZE, full_detail=False,
+                        scene=None):
         frame_items = []
-        for obj in objs:
-            frame_items.extend(obj.get_frame(self))
+        visible, centers, sizes = self.cull(objs, scene)
+        for obj, center, size in zip(visible, centers, sizes):
+            if isinstance(obj, Instances):
+                frame_items.extend(obj.frame_items(self, point_size, skip_size, full_detail))
+            elif full_detail or size >= point_size:
+                frame_items.extend(obj.get_frame(self))
+            elif size >= skip_size:
+                frame_items.append((center[[0, 2]], size, obj.color, "Point", center[1]))
+        frame_items = [itm for itm in frame_items if itm[4] >= 0]
         sort_fn = lambda itm: -itm[4]
         frame_items.sort(key=sort_fn)
-        return [itm for itm in frame_items if itm[4] >= 0]
+        results = []
+        for itm in frame_items:
+            if itm[3] == "Line":
+                clipped = self.clip_line(itm[0], itm[1])
+                if clipped is None:
+                    continue
+                itm = clipped + itm[2:]
+            results.append(itm)
+        return results
 
-    # Generates an orthographic raytrace from a scene of objects
-    def raytrace(self, objs, simple=False):
-        I, J = self.vdims
-        sheet = np.zeros((I, J, 3))
+    # Keeps the objects whose bounding spheres intersect the orthographic view box
+    #     the box spans the viewport (plus FRAME_CULL_MARGIN pixels) and everything in front of the camera
+    #     returns the visible objects with their pixel space centers and projected diameters
+    def cull(self, objs, scene=None):
+        if len(objs) == 0:
+            return [], np.zeros((0, 3)), np.zeros(0)
+        positions, radii = object_bounds(objs, scene)
+        keep, pixel_centers, sizes = self.cull_spheres(positions, radii)
+        return [objs[k] for k in keep], pixel_centers, sizes
+
+    # Vectorized cull of bounding spheres given as (N, 3) positions and N radii
+    #     returns the indices of the visible spheres with their pixel space centers and projected diameters
+    def cull_spheres(self, positions, radii):
+        centers = (positions - self.position) @ self.basis().T
+        # same camera to pixel mapping as get_frame
+        vp_ratio = self.vdims[0] / self.dims[0]
+        u = vp_ratio * (centers[:, 0] + self.dims[0] / 2)
+        v = vp_ratio * (centers[:, 2] + self.dims[1] / 2)
+        r = vp_ratio * radii + FRAME_CULL_MARGIN
+        visible = ((centers[:, 1] + radii >= 0) &
+                   (u + r >= 0) & (u - r <= self.vdims[0]) &
+                   (v + r >= 0) & (v - r <= self.vdims[1]))
+        keep = np.flatnonzero(visible)
+        pixel_centers = np.stack([u, centers[:, 1], v], axis=1)
+        return keep, pixel_centers[keep], 2 * vp_ratio * radii[keep]
+
+    # Clips the pixel space line a-b to the viewport (Liang-Barsky), returns None if nothing is left
+    def clip_line(self, a, b):
+        lo, hi = -FRAME_CULL_MARGIN, np.asarray(self.vdims, dtype=float) + FRAME_CULL_MARGIN
+        delta = b - a
+        t0, t1 = 0.0, 1.0
+        for i in range(2):
+            for p, q in [(-delta[i], a[i] - lo), (delta[i], hi[i] - a[i])]:
+                if p == 0:
+                    if q < 0:
+                        return None
+                    continue
+                t = q / p
+                if p < 0:
+                    t0 = max(t0, t)
+                else:
+                    t1 = min(t1, t)
+                if t0 > t1:
+                    return None
+        if t0 == 0 and t1 == 1:
+            return (a, b)
+        return (a + t0 * delta, a + t1 * delta)
+
+    # Copy of the camera's pose, size and background color
+    def copy(self):
+        return Camera(self.position.copy(), self.quaternion.copy(), self.color.copy(), self.dims.copy(),
+                      self.vdims.copy())
+
+    # Whole pixel shift of the trace grid at level since the camera pose previous
+    #     returns (du, dv, dy) when only the position changed, laterally by whole pixels:
+    #     pixel (u, v) now shows what pixel (u + du, v + dv) showed, seen from dy further along the ray
+    #     returns None for any other change
+    def pan_offset(self, previous, level=1):
+        same = [(self.quaternion, previous.quaternion), (self.dims, previous.dims),
+                (self.vdims, previous.vdims), (self.color, previous.color)]
+        if not all(np.array_equal(a, b) for a, b in same):
+            return None
+        I, J = self.trace_dims(level)
         defX, ray, defZ = self.basis()
-        offX = - self.dims[0] * 0.5 * defX
-        if simple:
-            for i in range(I):
-                offZ = -self.dims[0] * 0.5 * defZ
-                for j in range(J):
-                    origin = self.position + offX + offZ
-                    # Compute orthographic dists for each object in scene
-                    ortho_dists, contexts = [], []
-                    for obj in objs:
-                        dist, context = obj.ortho_dist(origin, ray)
-                        if (dist != float("inf")):
-                            ortho_dists.append((obj, dist))
-                            contexts.append(context)
-                    if len(ortho_dists) > 0:
-                        idx = np.argmin(np.array([r[1] for r in ortho_dists]))
-                        obj = ortho_dists[idx][0]
-                        sheet[i, j] = np.round(obj.simple_color(contexts[idx]))
-                    else:
-                        sheet[i, j] = self.color
-                    offZ += self.dims[0] / (J - 1) * defZ
-                offX += self.dims[0] / (I - 1) * defX
-        else:
-            for i in range(I):
-                offZ = -self.dims[0] * 0.5 * defZ
-                for j in range(J):
-                    origin = self.position + offX + offZ
-                    # Compute orthographic dists for each object in scene
-                    ortho_dists, contexts = [], []
-                    for obj in objs:
-                        dist, context = obj.ortho_dist(origin, ray)
-                        if (dist != float("inf")):
-                            ortho_dists.append((obj, dist))
-                            contexts.append(context)
-                    if len(ortho_dists) > 0:
-                        idx = np.argmin(np.array([r[1] for r in ortho_dists]))
-                        obj = ortho_dists[idx][0]
-                        sheet[i, j] = np.round(obj.get_color_at(obj.render(contexts[idx])))
-                    else:
-                        sheet[i, j] = self.color
-                    offZ += self.dims[0] / (J - 1) * defZ
-                offX += self.dims[0] / (I - 1) * defX
+        delta = np.asarray(self.position, dtype=float) - previous.position
+        u, v = np.dot(delta, defX) / (self.dims[0] / (I - 1)), np.dot(delta, defZ) / (self.dims[0] / (J - 1))
+        du, dv = int(round(u)), int(round(v))
+        if abs(u - du) > PAN_PIXEL_TOLERANCE or abs(v - dv) > PAN_PIXEL_TOLERANCE:
+            return None
+        return du, dv, np.dot(delta, ray) / np.linalg.norm(ray)
+
+    # Brings a (J, I, channels) raytrace image and its (J, I) depth buffer, both traced at level from
+    # camera pose previous, up to date after a pan by moving the pixels that stay in view
+    #     only pixels that scrolled into view and pixels whose hit may have crossed the camera plane
+    #     are traced, which are the pixels whose hits were nearer than a forward move, or the pixels
+    #     under objects reaching behind the previous camera plane after a backward move
+    #     returns the number of traced pixels, or None when the camera did not pan (see pan_offset)
+    #     scene may be a render_cache.SceneCache of objs, see trace
+    def pan_into(self, image, depth, previous, objs, simple=False, level=1, precision="float64", scene=None):
+        offset = self.pan_offset(previous, level)
+        if offset is None:
+            return None
+        du, dv, dy = offset
+        I, J = self.trace_dims(level)
+        stale = np.ones((J, I), dtype=bool)
+        if abs(du) < I and abs(dv) < J:
+            moved = (slice(max(-dv, 0), J - max(dv, 0)), slice(max(-du, 0), I - max(du, 0)))
+            kept = (slice(max(dv, 0), J + min(dv, 0)), slice(max(du, 0), I + min(du, 0)))
+            image[moved] = image[kept].copy()
+            depth[moved] = depth[kept] - dy
+            stale[moved] = False
+        stale |= depth < DEPTH_ORDER_SLACK * (1 + abs(dy))
+        if dy < 0 and len(objs) > 0:
+            positions, radii = object_bounds(objs, scene)
+            centers = (positions - self.position) @ self.basis().T
+            behind = (centers[:, 1] - radii < -dy * (1 + DEPTH_ORDER_SLACK) + DEPTH_ORDER_SLACK) & \
+                     (centers[:, 1] + radii >= 0)
+            for center, radius in zip(centers[behind], radii[behind]):
+                u, v, _, _ = self.plane_pixels(center[[0, 2]] - radius, center[[0, 2]] + radius, I, J)
+                stale[v, u] = True
+        v, u = np.nonzero(stale)
+        if len(u) > 0:
+            colors, _, dists = self.trace(objs, self.pixel_origins(u, v, I, J, precision), simple,
+                                          precision=precision, scene=scene)
+            image[v, u, :3] = colors
+            depth[v, u] = dists
+        return len(u)
+
+    # Number of pixels traced along each viewport axis at a given resolution level
+    #     level 1 is full resolution, level n traces one ray per n x n block of pixels
+    def trace_dims(self, level=1):
+        return [max(2, int(math.ceil(d / level))) for d in self.vdims]
+
+    # Ray origins on the camera plane for (possibly fractional) pixel coordinates u, v
+    #     on an I x J pixel grid, computed in dtype ("float32" for float32 precision traces)
+    #     and written into out when it is given
+    def pixel_origins(self, u, v, I, J, dtype=float, out=None):
+        defX, _, defZ = self.basis().astype(dtype)
+        width = np.asarray(self.dims[0], dtype=dtype)
+        offX = -width * 0.5 + np.asarray(u, dtype=dtype) * (width / (I - 1))
+        offZ = -width * 0.5 + np.asarray(v, dtype=dtype) * (width / (J - 1))
+        if out is None:
+            return self.position.astype(dtype) + offX[:, np.newaxis] * defX + offZ[:, np.newaxis] * defZ
+        # same operation order as above, so both give identical origins
+        np.multiply(offX[:, np.newaxis], defX, out=out)
+        out += self.position.astype(dtype)
+        out += offZ[:, np.newaxis] * defZ
+        return out
+
+    # Orders objects front to back along the camera direction
+    #     returns the order and the smallest depth any part of each object can have,
+    #     which is the center depth minus the bounding radius (and a small slack for rounding)
+    def depth_order(self, objs, scene=None):
+        if len(objs) == 0:
+            return np.zeros(0, dtype=int), np.zeros(0)
+        ray = self.basis()[1]
+        positions, radii = object_bounds(objs, scene)
+        depths = (positions - self.position) @ (ray / np.linalg.norm(ray)) - radii
+        min_depths = depths - DEPTH_ORDER_SLACK * (1 + np.abs(depths))
+        order = np.argsort(min_depths, kind="stable")
+        return order, min_depths[order]
+
+    # Pixel samples of an I x J grid inside the camera plane rectangle lo to hi
+    #     returns pixel coordinates u, v and the camera plane offsets used by pixel_origins
+    def plane_pixels(self, lo, hi, I, J):
+        su, sv = self.dims[0] / (I - 1), self.dims[0] / (J - 1)
+        u0 = max(int(math.floor((lo[0] + self.dims[0] * 0.5) / su)), 0)
+        u1 = min(int(math.ceil((hi[0] + self.dims[0] * 0.5) / su)), I - 1)
+        v0 = max(int(math.floor((lo[1] + self.dims[0] * 0.5) / sv)), 0)
+        v1 = min(int(math.ceil((hi[1] + self.dims[0] * 0.5) / sv)), J - 1)
+        if u0 > u1 or v0 > v1:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0), np.zeros(0)
+        u, v = np.meshgrid(np.arange(u0, u1 + 1), np.arange(v0, v1 + 1), indexing="ij")
+        u, v = u.ravel(), v.ravel()
+        return u, v, -self.dims[0] * 0.5 + u * su, -self.dims[0] * 0.5 + v * sv
+
+    # Renders objects without casting rays by scan-converting their coverage into a depth buffer
+    #     cost scales with the pixels each object covers rather than pixels x objects
+    #     shading follows the same render / get_color_at rules, so the (I, J, 3) sheet matches
+    #     raytrace(objs, simple, level) except for pixels whose sample lies within rounding error
+    #     of a silhouette, box edge or intersection (see test_rasterize_matches_raytrace)
+    def rasterize(self, objs, simple=False, level=1):
+        I, J = self.trace_dims(level)
+        depth = np.full((I, J), float("inf"))
+        sheet = np.tile(self.color.astype(float), (I, J, 1))
+        for obj in objs:
+            u, v, d, colors = obj.coverage(self, I, J, simple)
+            if len(u) == 0:
+                continue
+            # keep the nearest sample per pixel, box faces share their edges
+            flat = u * J + v
+            order = np.lexsort((d, flat))
+            _, first = np.unique(flat[order], return_index=True)
+            keep = order[first]
+            u, v, d, colors = u[keep], v[keep], d[keep], colors[keep]
+            # earlier objects win ties like in trace
+            closer = d < depth[u, v]
+            depth[u[closer], v[closer]] = d[closer]
+            sheet[u[closer], v[closer]] = colors[closer]
         return sheet
 
+    # Traces rays starting at origins along the camera direction
+    #     returns colors, the index of the object hit by each ray (-1 for background)
+    #     and the orthographic distance of each hit
+    #     colors are written into out instead of a new array when it is given, likewise hit indices
+    #     and distances into ids and dists
+    #     precision "float32" intersects in single precision and shades through uint8 lookup
+    #     tables, returning uint8 colors; it is meant for previews (see compare_precision)
+    #     profile may be a RenderProfile (see render_profile.py) to record per-object costs,
+    #     profiled traces always take the NumPy path
+    #     scene may be a render_cache.SceneCache of objs, so that cameras of the same scene version
+    #     share the object bounds and packed kernel geometry instead of rebuilding them per trace
+    def trace(self, objs, origins, simple=False, use_kernels=USE_KERNELS, out=None, precision="float64",
+              profile=None, scene=None, ids=None, dists=None):
+        ray = self.basis()[1]
+        order, min_depths = self.depth_order(objs, scene)
+        single = precision == "float32"
+        if profile is not None:
+            traceStart = time.perf_counter()
+        if use_kernels and not single and profile is None:
+            packed = scene.get("pack", lambda: kernels.pack_scene(objs)) if scene is not None else None
+            result = kernels.trace(objs, origins, ray, self.color, simple, out, order, min_depths, packed, ids, dists)
+            if result is not None:
+                return result
+        n = len(origins)
+        if single:
+            origins, ray = origins.astype(np.float32, copy=False), ray.astype(np.float32)
+        dists = np.empty(n, dtype=origins.dtype) if dists is None else dists
+        ids = np.empty(n, dtype=np.int64) if ids is None else ids
+        dists.fill(float("inf"))
+        ids.fill(-1)
+        # Walk objects front to back, only testing rays whose closest hit so far is not nearer
+        # than the object's minimum depth, and stop once no ray can be improved.
+        # Earlier objects still win ties like np.argmin did.
+        active = np.arange(n)
+        for k, min_depth in zip(order, min_depths):
+            active = active[dists[active] >= min_depth]
+            if len(active) == 0:
+                break
+            if profile is not None:
+                start = time.perf_counter()
+            obj_dists, _ = objs[k].ortho_dists(origins[active], ray)
+            if profile is not None:
+                profile.record_tests(k, objs[k], len(active), time.perf_counter() - start)
+            closer = (obj_dists < dists[active]) | ((obj_dists == dists[active]) & (k < ids[active]))
+            dists[active[closer]] = obj_dists[closer]
+            ids[active[closer]] = k
+        # Shade each object's winning rays, recomputing contexts only for those rays
+        colors = out if out is not None else np.zeros((n, 3), dtype=np.uint8 if single else float)
+        colors[:] = self.color
+        order = np.argsort(ids, kind="stable")
+        hit_ids, starts = np.unique(ids[order], return_index=True)
+        bounds = list(starts[1:]) + [n]
+        for k, start, end in zip(hit_ids, starts, bounds):
+            if k == -1:
+                continue
+            sel = order[start:end]
+            obj = objs[k]
+            if profile is not None:
+                shadeStart = time.perf_counter()
+            _, context = obj.ortho_dists(origins[sel], ray)
+            colors[sel] = obj.shade(context, simple, single)
+            if profile is not None:
+                profile.record_hits(k, obj, len(sel), time.perf_counter() - shadeStart)
+        if profile is not None:
+            profile.record_trace(ids, time.perf_counter() - traceStart)
+        return colors, ids, dists
+
+    # Averages SUPERSAMPLE_OFFSETS sub-pixel samples for pixels (u, v) on an I x J grid
+    def supersample(self, objs, u, v, I, J, simple=False, precision="float64", profile=None, scene=None):
+        total = np.zeros((len(u), 3), dtype=precision)
+        for du, dv in SUPERSAMPLE_OFFSETS:
+            colors, _, _ = self.trace(objs, self.pixel_origins(u + du, v + dv, I, J, precision), simple,
+                                      precision=precision, profile=profile, scene=scene)
+            total += colors
+        return np.round(total / len(SUPERSAMPLE_OFFSETS))
+
+    # Finds pixels whose 8 neighbors differ in hit object or noticeably in shading
+    def find_edges(self, sheet, ids):
+        I, J = ids.shape
+        edges = np.zeros((I, J), dtype=bool)
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                if di == 0 and dj == 0:
+                    continue
+                a = (slice(max(di, 0), I + min(di, 0)), slice(max(dj, 0), J + min(dj, 0)))
+                b = (slice(max(-di, 0), I + min(-di, 0)), slice(max(-dj, 0), J + min(-dj, 0)))
+                diff = (ids[a] != ids[b]) | \
+                       (np.max(np.abs(sheet[a].astype(int) - sheet[b]), axis=2) > EDGE_COLOR_THRESHOLD)
+                edges[a] |= diff
+        return edges
+
+    # Generates an orthographic raytrace from a scene of objects
+    #     antialias may be None, "edge" to supersample only pixels on object edges,
+    #     or "ssaa" to supersample every pixel
+    #     tile may be a pixel range (i0, i1, j0, j1) to only trace part of the frame
+    #     precision "float32" returns a uint8 sheet, see trace
+    #     profile may be a RenderProfile that collects per-object costs of every traced ray, see trace
+    def raytrace(self, objs, simple=False, level=1, antialias=None, tile=None, precision="float64", profile=None):
+        I, J = self.trace_dims(level)
+        i0, i1, j0, j1 = tile if tile is not None else (0, I, 0, J)
+        # edge detection needs one pixel of context around the tile
+        margin = 1 if antialias == "edge" else 0
+        a0, a1, b0, b1 = max(i0 - margin, 0), min(i1 + margin, I), max(j0 - margin, 0), min(j1 + margin, J)
+        u, v = np.meshgrid(np.arange(a0, a1), np.arange(b0, b1), indexing="ij")
+        u, v = u.ravel(), v.ravel()
+        if antialias == "ssaa":
+            colors = self.supersample(objs, u, v, I, J, simple, precision, profile)
+            return colors.astype(np.uint8 if precision == "float32" else float).reshape((a1 - a0, b1 - b0, 3))
+        colors, ids, _ = self.trace(objs, self.pixel_origins(u, v, I, J, precision), simple, precision=precision,
+                                    profile=profile)
+        sheet, ids = colors.reshape((a1 - a0, b1 - b0, 3)), ids.reshape((a1 - a0, b1 - b0))
+        if antialias == "edge":
+            eu, ev = np.nonzero(self.find_edges(sheet, ids))
+            sheet[eu, ev] = self.supersample(objs, eu + a0, ev + b0, I, J, simple, precision, profile)
+        return sheet[i0 - a0:i1 - a0, j0 - b0:j1 - b0]
+
+    # Raytraces straight into a (J, I, channels) uint8 image laid out in QImage row order
+    #     skips the float sheet, transpose and copies that raytrace output needs before display
+    #     depth may be a (J, I) array that receives the distance of every pixel's hit (see pan_into),
+    #     it is left untouched by "ssaa" anti-aliasing
+    #     scene may be a render_cache.SceneCache of objs, see trace
+    #     grid may be the PixelGrid of the traced resolution, reused between frames of one viewport
+    def raytrace_into(self, image, objs, simple=False, level=1, antialias=None, precision="float64", profile=None,
+                      depth=None, scene=None, grid=None):
+        I, J = self.trace_dims(level)
+        grid = PixelGrid(I, J) if grid is None else grid
+        u, v = grid.u, grid.v
+        # rows of the image are evenly strided, so this is a view into the image
+        pixels = image[:, :, :3].reshape((I * J, 3))
+        if antialias == "ssaa":
+            pixels[:] = self.supersample(objs, u, v, I, J, simple, precision, profile, scene)
+            return image
+        origins = self.pixel_origins(u, v, I, J, precision, grid.origins(precision))
+        # distances go straight into a contiguous depth buffer
+        into = depth.reshape(I * J) if depth is not None and depth.flags.c_contiguous else None
+        _, ids, dists = self.trace(objs, origins, simple, out=pixels, precision=precision, profile=profile,
+                                   scene=scene, ids=grid.ids, dists=into)
+        if depth is not None and into is None:
+            depth[:] = dists.reshape((J, I))
+        if antialias == "edge":
+            ev, eu = np.nonzero(self.find_edges(image[:, :, :3], ids.reshape((J, I))))
+            image[ev, eu, :3] = self.supersample(objs, eu, ev, I, J, simple, precision, profile, scene)
+        return image
+
     # Returns the camera as a JSON string for storage purposes
     def dict(self):
         return {
@@ -464,4 +1486,119 @@ def test_camera_runtime():
     box2 = Box(np.array([0, 2, 0]), name="box2", dims=np.array([1, 2, 3]))
     print(camera.rasterize([box1, box2, sphere])[:, :, 0])
 
-# test_camera_runtime()
\ No newline at end of file
+# test_camera_runtime()
+
+def test_rasterize_matches_raytrace():
+    import json
+    with open("example.json") as file_ptr:
+        camera, objs = load_objs(json.load(file_ptr)["objs"])
+    camera.vdims = np.array([160, 160])
+    for simple in [False, True]:
+        traced, rastered = camera.raytrace(objs, simple), camera.rasterize(objs, simple)
+        diff = np.max(np.abs(traced - rastered), axis=2)
+        # colors may be one step apart from rounding, other differences only on edge pixels
+        edges = np.count_nonzero(diff > 1)
+        assert edges <= 0.005 * diff.size, "analytic rasterizer differs from raytrace"
+        print("simple" if simple else "shaded", "max diff", np.max(diff), "edge pixels differing", edges)
+
+# Compares a float32 precision raytrace against the float64 one
+#     returns the largest per-channel pixel error, the mean error and the fraction of pixels that differ
+#     along with the peak memory of both color sheets in bytes
+def compare_precision(camera, objs, simple=False, level=1, antialias=None):
+    reference = camera.raytrace(objs, simple, level, antialias)
+    reduced = camera.raytrace(objs, simple, level, antialias, precision="float32")
+    error = np.abs(reference - reduced)
+    return {
+        "maxError": float(np.max(error)) if error.size > 0 else 0.0,
+        "meanError": float(np.mean(error)) if error.size > 0 else 0.0,
+        "differing": float(np.mean(np.any(error > 0, axis=2))) if error.size > 0 else 0.0,
+        "bytes": (reference.nbytes, reduced.nbytes)
+    }
+
+def test_precision():
+    import json
+    with open("example.json") as file_ptr:
+        camera, objs = load_objs(json.load(file_ptr)["objs"])
+    camera.vdims = np.array([160, 160])
+    for simple in [False, True]:
+        result = compare_precision(camera, objs, simple)
+        # lookup table shading rounds to within a color step of get_colors_at
+        assert result["maxError"] <= 1, "float32 precision raytrace differs from float64"
+        print("simple" if simple else "shaded", result)
+
+def test_instances():
+    import json
+    camera = Camera(position=np.array([0, -20, 0]), dims=np.array([12, 12]), viewport_dims=np.array([96, 96]))
+    rng = np.random.default_rng(0)
+    for prototype in [Box(dims=np.array([0.8, 0.5, 1.2])), Sphere(radius=0.6)]:
+        instances = Instances(prototype, rng.uniform(-5, 5, (200, 3)),
+                              rotations=quaternions.normalize(rng.normal(size=(200, 4))),
+                              colors=rng.integers(0, 256, (200, 3)),
+                              quaternion=quaternions.normalize(np.array([0.7, 0.2, -0.3, 0.1]))[0])
+        expanded = instances.expand()
+        for simple in [False, True]:
+            assert np.array_equal(camera.raytrace([instances], simple), camera.raytrace(expanded, simple)), \
+                "instanced raytrace differs from separate objects"
+        _, loaded = load_objs(json.loads(json.dumps([instances.dict(), camera.dict()])))
+        assert np.array_equal(loaded[0].world()[0], instances.world()[0])
+        # moving the group in place moves every instance
+        before = instances.world()[0].copy()
+        instances.position += 1
+        assert np.allclose(instances.world()[0], before + 1)
+        # viewports with different rays keep their own binnings
+        front, side = camera.basis()[1], np.array([1.0, 1.0, 0.3])
+        binnings = instances.bins(front), instances.bins(side)
+        assert instances.bins(front) is binnings[0] and instances.bins(side) is binnings[1]
+        print(type(prototype).__name__, "instances", instances.count, "frame items", len(camera.frame_rasterize([instances])))
+
+def test_mesh():
+    import json
+    import tempfile
+    corners = np.array([[x, y, z] for x in (-1, 1) for y in (-0.5, 0.5) for z in (-1.5, 1.5)])
+    quads = [(0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1), (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "box.obj")
+        with open(path, "w") as file_ptr:
+            file_ptr.writelines("v {0} {1} {2}\n".format(*corner) for corner in corners)
+            file_ptr.writelines("f {0} {1} {2} {3}\n".format(*[k + 1 for k in quad]) for quad in quads)
+        camera = Camera(position=np.array([0, -6, 0]), dims=np.array([6, 6]), viewport_dims=np.array([96, 96]))
+        quaternion = quaternions.normalize(np.array([0.8, 0.3, -0.2, 0.4]))[0]
+        box_mesh = Mesh(path, position=np.array([0.3, 0, 0.1]), quaternion=quaternion)
+        box = Box(np.array([0.3, 0, 0.1]), quaternion=quaternion, dims=np.array([2, 1, 3]))
+        # a triangulated box shades like the box, up to rounding on its edges
+        diff = np.max(np.abs(camera.raytrace([box_mesh]) - camera.raytrace([box])), axis=2)
+        assert np.count_nonzero(diff > 1) <= 0.005 * diff.size, "mesh raytrace differs from box"
+        _, loaded = load_objs(json.loads(json.dumps([box_mesh.dict(), camera.dict()])))
+        assert np.array_equal(camera.raytrace(loaded), camera.raytrace([box_mesh]))
+        print("mesh triangles", len(box_mesh.data.faces), "max diff", np.max(diff), "frame items",
+              len(camera.frame_rasterize([box_mesh])))
+
+def test_pan_into():
+    import json
+    with open("example.json") as file_ptr:
+        camera, objs = load_objs(json.load(file_ptr)["objs"])
+    camera.vdims = np.array([120, 100])
+    camera.rotate(rot_quat(np.array([0, 0, 1]), 0.3))
+    I, J = camera.trace_dims()
+    image, depth = np.zeros((J, I, 4), dtype=np.uint8), np.zeros((J, I))
+    camera.raytrace_into(image, objs, depth=depth)
+    # camera plane pixel spacing, lateral moves are rounded to whole pixels
+    pitch = np.array([camera.dims[0] / (I - 1), 1, camera.dims[0] / (J - 1)])
+    lateral = np.array([True, False, True])
+    # lateral, forward, backward and combined moves, the last one leaves nothing in view
+    for step in [[0.1, 0, 0], [0, 0, -0.3], [0, 0.5, 0], [0, -2.5, 0], [0.5, -1, 0.2], [40, 0, 0]]:
+        previous = camera.copy()
+        step = np.where(lateral, np.round(np.array(step) / pitch) * pitch, step)
+        camera.position = camera.position + camera.basis().T @ step
+        traced = camera.pan_into(image, depth, previous, objs)
+        reference = np.zeros_like(image)
+        camera.raytrace_into(reference, objs)
+        assert np.array_equal(image, reference), "panned raytrace differs from a full raytrace"
+        print("pan", step, "traced", traced, "of", I * J, "pixels")
+    # moves of a fraction of a pixel are retraced
+    previous = camera.copy()
+    camera.position = camera.position + camera.basis().T @ (pitch * [0.5, 0, 0])
+    assert camera.pan_into(image, depth, previous, objs) is None
+    previous = camera.copy()
+    camera.rotate(rot_quat(np.array([1, 0, 0]), 0.1))
+    assert camera.pan_into(image, depth, previous, objs) is None
@@ -0,0 +1,149 @@
+import numpy as np
+
+# Batched quaternion math over (N, 4) arrays of [w, x, y, z] quaternions.
+# Conventions follow objects.py: to_matrix is the rotation matrix used by BaseObject.basis,
+# and to_euler/from_euler use the XYZ Euler angles (in degrees) shown in the inspector.
+
+# Degrees per radian
+DPR = 180 / np.pi
+
+def _batch(q):
+    return np.atleast_2d(np.asarray(q, dtype=float))
+
+# Scales quaternions to unit length
+def normalize(q):
+    q = _batch(q)
+    return q / np.linalg.norm(q, axis=1)[:, np.newaxis]
+
+# Conjugates quaternions, which inverts unit rotations
+def conjugate(q):
+    q = _batch(q)
+    return q * np.array([1, -1, -1, -1])
+
+# Hamilton product a * b, broadcasting single quaternions against batches
+def multiply(a, b):
+    a, b = _batch(a), _batch(b)
+    s, v = a[:, 0], a[:, 1:4]
+    t, w = b[:, 0], b[:, 1:4]
+    ang = s * t - np.sum(v * w, axis=1)
+    ax = s[:, np.newaxis] * w + t[:, np.newaxis] * v + np.cross(v, w)
+    return np.concatenate((ang[:, np.newaxis], ax), axis=1)
+
+# Unit quaternions rotating by angles ang (radians) around axes
+def from_axis_angle(axis, ang):
+    axis = np.atleast_2d(np.asarray(axis, dtype=float))
+    ang = np.atleast_1d(np.asarray(ang, dtype=float))
+    unit_axis = axis / np.linalg.norm(axis, axis=1)[:, np.newaxis]
+    return np.concatenate((np.cos(ang / 2)[:, np.newaxis], np.sin(ang / 2)[:, np.newaxis] * unit_axis), axis=1)
+
+# Converts quaternions into (N, 3, 3) rotation matrices
+def to_matrix(q):
+    q = _batch(q)
+    w, x, y, z = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    matrix = np.empty((len(q), 3, 3))
+    matrix[:, 0, 0] = 1 - 2 * (y ** 2 + z ** 2)
+    matrix[:, 0, 1] = 2 * (x * y - z * w)
+    matrix[:, 0, 2] = 2 * (x * z + y * w)
+    matrix[:, 1, 0] = 2 * (x * y + z * w)
+    matrix[:, 1, 1] = 1 - 2 * (x ** 2 + z ** 2)
+    matrix[:, 1, 2] = 2 * (y * z - x * w)
+    matrix[:, 2, 0] = 2 * (x * z - y * w)
+    matrix[:, 2, 1] = 2 * (y * z + x * w)
+    matrix[:, 2, 2] = 1 - 2 * (x ** 2 + y ** 2)
+    return matrix
+
+# Converts (N, 3, 3) rotation matrices into unit quaternions with non-negative w
+def from_matrix(m):
+    m = np.asarray(m, dtype=float).reshape((-1, 3, 3))
+    trace = m[:, 0, 0] + m[:, 1, 1] + m[:, 2, 2]
+    # each row picks the numerically safest of the four standard formulas
+    candidates = np.stack([
+        [1 + trace, m[:, 2, 1] - m[:, 1, 2], m[:, 0, 2] - m[:, 2, 0], m[:, 1, 0] - m[:, 0, 1]],
+        [m[:, 2, 1] - m[:, 1, 2], 1 + m[:, 0, 0] - m[:, 1, 1] - m[:, 2, 2], m[:, 0, 1] + m[:, 1, 0], m[:, 0, 2] + m[:, 2, 0]],
+        [m[:, 0, 2] - m[:, 2, 0], m[:, 0, 1] + m[:, 1, 0], 1 - m[:, 0, 0] + m[:, 1, 1] - m[:, 2, 2], m[:, 1, 2] + m[:, 2, 1]],
+        [m[:, 1, 0] - m[:, 0, 1], m[:, 0, 2] + m[:, 2, 0], m[:, 1, 2] + m[:, 2, 1], 1 - m[:, 0, 0] - m[:, 1, 1] + m[:, 2, 2]]
+    ]).transpose(2, 0, 1)
+    best = np.argmax(np.stack([trace, m[:, 0, 0], m[:, 1, 1], m[:, 2, 2]], axis=1), axis=1)
+    q = normalize(candidates[np.arange(len(m)), best])
+    return q * np.where(q[:, 0] < 0, -1, 1)[:, np.newaxis]
+
+# Obtains inspector XYZ Euler angles (degrees) from quaternions
+def to_euler(q):
+    q = _batch(q)
+    w, x, y, z = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    rx = DPR * np.arctan2(2 * (w * x + y * z), 1 - 2 * (x ** 2 + y ** 2))
+    ry = DPR * np.arcsin(np.clip(2 * (w * y - z * x), -1, 1))
+    rz = DPR * np.arctan2(2 * (w * z + x * y), 1 - 2 * (y ** 2 + z ** 2))
+    return np.stack([(rx + 180) % 360, ry, (rz + 180) % 360], axis=1)
+
+# Builds quaternions from inspector XYZ Euler angles (degrees)
+def from_euler(euler):
+    e = 0.5 * (_batch(euler) + np.array([180, 0, 180])) / DPR
+    c, s = np.cos(e), np.sin(e)
+    return np.stack([c[:, 0] * c[:, 1] * c[:, 2] + s[:, 0] * s[:, 1] * s[:, 2],
+                     s[:, 0] * c[:, 1] * c[:, 2] - c[:, 0] * s[:, 1] * s[:, 2],
+                     c[:, 0] * s[:, 1] * c[:, 2] + s[:, 0] * c[:, 1] * s[:, 2],
+                     c[:, 0] * c[:, 1] * s[:, 2] - s[:, 0] * s[:, 1] * c[:, 2]], axis=1)
+
+# Rotates (N, 3) vectors by the rotation matrices of quaternions
+def rotate_vectors(q, v):
+    return np.einsum("nij,nj->ni", to_matrix(q), np.atleast_2d(v))
+
+# Spherical linear interpolation between quaternions a and b at fractions t
+def slerp(a, b, t):
+    a, b = normalize(a), normalize(b)
+    t = np.atleast_1d(np.asarray(t, dtype=float))[:, np.newaxis]
+    dot = np.sum(a * b, axis=1)
+    # take the shorter arc
+    b = b * np.where(dot < 0, -1, 1)[:, np.newaxis]
+    dot = np.abs(dot)[:, np.newaxis]
+    theta = np.arccos(np.clip(dot, -1, 1))
+    sin_theta = np.sin(theta)
+    close = sin_theta < 1e-6
+    safe = np.where(close, 1, sin_theta)
+    wa = np.where(close, 1 - t, np.sin((1 - t) * theta) / safe)
+    wb = np.where(close, t, np.sin(t * theta) / safe)
+    return normalize(wa * a + wb * b)
+
+def test_quaternions():
+    import math
+    from objects import BaseObject, rot_quat
+    rng = np.random.default_rng(0)
+    q = normalize(rng.normal(size=(200, 4)))
+    q *= np.where(q[:, 0] < 0, -1, 1)[:, np.newaxis]
+    # matrices are Rodrigues rotations, and converting back gives the same rotation
+    axes, angles = rng.normal(size=(200, 3)), rng.uniform(-math.pi, math.pi, 200)
+    k = axes / np.linalg.norm(axes, axis=1)[:, np.newaxis]
+    cross = np.zeros((200, 3, 3))
+    cross[:, 0, 1], cross[:, 0, 2], cross[:, 1, 2] = -k[:, 2], k[:, 1], -k[:, 0]
+    cross -= cross.transpose(0, 2, 1)
+    rodrigues = (np.eye(3) + np.sin(angles)[:, None, None] * cross +
+                 (1 - np.cos(angles))[:, None, None] * cross @ cross)
+    assert np.allclose(to_matrix(from_axis_angle(axes, angles)), rodrigues)
+    assert np.allclose(from_matrix(to_matrix(q)), q)
+    # Euler angles round trip away from the poles of the Y rotation
+    euler = np.stack([rng.uniform(0, 360, 200), rng.uniform(-89, 89, 200), rng.uniform(0, 360, 200)], axis=1)
+    assert np.allclose(to_euler(from_euler(euler)), euler)
+    assert np.allclose(to_matrix(from_euler(to_euler(q))), to_matrix(q))
+    # rotate_vectors is the sandwich product q v q*, computed with multiply
+    v = rng.normal(size=(200, 3))
+    sandwich = multiply(multiply(q, np.concatenate([np.zeros((200, 1)), v], axis=1)), conjugate(q))
+    assert np.allclose(rotate_vectors(q, v), sandwich[:, 1:4])
+    # BaseObject.rotate agrees with the scalar product and the rot_quat pivot rule it replaced
+    for a, b, pivot in zip(q[:20], q[20:40], rng.normal(size=(20, 3))):
+        obj = BaseObject(position=np.array([1.0, 2.0, 3.0]), quaternion=a.copy())
+        obj.rotate(b, pivot)
+        s, t = a[0], b[0]
+        product = np.concatenate(([s * t - np.dot(a[1:4], b[1:4])],
+                                  s * b[1:4] + t * a[1:4] + np.cross(a[1:4], b[1:4])))
+        theta = 2 * math.acos(b[0])
+        moved = pivot + to_matrix(rot_quat(2 * b[1:4] / math.sin(theta), -theta))[0] @ (np.array([1.0, 2.0, 3.0]) - pivot)
+        assert np.allclose(obj.quaternion, product) and np.allclose(obj.position, moved)
+    # slerp starts at a, ends at b (up to sign, it takes the shorter arc) and halves the angle midway
+    a, b = q[:100], q[100:]
+    assert np.allclose(slerp(a, b, np.zeros(100)), a)
+    ends = slerp(a, b, np.ones(100))
+    assert np.allclose(np.abs(np.sum(ends * b, axis=1)), 1)
+    half = np.abs(np.sum(slerp(a, b, np.full(100, 0.5)) * a, axis=1))
+    assert np.allclose(2 * np.arccos(np.clip(half, -1, 1)), np.arccos(np.clip(np.abs(np.sum(a * b, axis=1)), -1, 1)))
+    print("quaternions", len(q), "rotations checked")
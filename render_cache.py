@@ -0,0 +1,141 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Memory budget (in bytes) shared by all cached framebuffers
+RENDER_CACHE_BUDGET = 256 * 1024 * 1024
+
+# Content hash of the objects of a scene, hashed through obj.key()
+def scene_digest(objs):
+    return hashlib.sha1(json.dumps([obj.key() for obj in objs]).encode()).hexdigest()
+
+# Content hash of everything that determines the pixels of a raytrace
+#     the scene is hashed through scene_digest, the camera through its pose, dims and viewport
+#     size, and mode holds any shading options (level, anti-aliasing, ...)
+#     scene may be a SceneCache holding the scene digest of objs
+def render_key(camera, objs, scene=None, **mode):
+    digest = hashlib.sha1()
+    digest.update((scene_digest(objs) if scene is None else scene.get("digest", lambda: scene_digest(objs))).encode())
+    digest.update(json.dumps(camera.dict()).encode())
+    digest.update(json.dumps(mode, sort_keys=True).encode())
+    return digest.hexdigest()
+
+# Least recently used cache of finished raytrace framebuffers
+#     safe to share between viewports that render on different threads
+class RenderCache:
+    def __init__(self, budget=RENDER_CACHE_BUDGET):
+        self.budget = budget
+        self.size = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    # Returns the cached framebuffer for key, or None on a miss
+    def get(self, key):
+        with self.lock:
+            frame = self.entries.get(key)
+            if frame is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return frame
+
+    # Stores a copy of a framebuffer, evicting least recently used frames beyond the budget
+    def put(self, key, frame):
+        if frame.nbytes > self.budget:
+            return
+        frame = np.array(frame)
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key).nbytes
+            self.entries[key] = frame
+            self.size += frame.nbytes
+            while self.size > self.budget:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted.nbytes
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    # Returns hit/miss counters and memory usage of the cache
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups > 0 else 0,
+            "evictions": self.evictions,
+            "frames": len(self.entries),
+            "bytes": self.size,
+            "budget": self.budget
+        }
+
+# Camera independent data of one scene version, shared by every viewport rendering it
+#     entries (scene digest, packed kernel geometry, object bounds, ...) are built by whichever
+#     viewport asks first and reused by the others until the scene version changes
+class SceneCache:
+    def __init__(self):
+        self.version = None
+        self.entries = {}
+        self.builds = 0
+        self.reuses = 0
+        # viewports may render concurrently, an entry being built makes the others wait for it
+        self.lock = threading.Lock()
+
+    # Drops every entry if the scene changed since the last update
+    def update(self, version):
+        with self.lock:
+            if version != self.version:
+                self.version = version
+                self.entries = {}
+
+    # Returns the entry called name, calling build() for it if it does not exist yet
+    def get(self, name, build):
+        with self.lock:
+            if name in self.entries:
+                self.reuses += 1
+            else:
+                self.entries[name] = build()
+                self.builds += 1
+            return self.entries[name]
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "entries": sorted(self.entries),
+            "builds": self.builds,
+            "reuses": self.reuses
+        }
+
+def test_render_cache():
+    from objects import Box, Camera
+    camera = Camera(viewport_dims=np.array([8, 8]))
+    objs = [Box(np.array([0., 2., 0.]), name="box1")]
+    cache = RenderCache(budget=2 * 8 * 8 * 4)
+    key = render_key(camera, objs, level=1)
+    assert cache.get(key) is None
+    cache.put(key, np.zeros((8, 8, 4), dtype=np.uint8))
+    assert cache.get(key) is not None
+    objs[0].position[0] += 1
+    assert render_key(camera, objs, level=1) != key
+    assert render_key(camera, objs, level=2) != render_key(camera, objs, level=1)
+    for level in range(3):
+        cache.put(render_key(camera, objs, level=level), np.zeros((8, 8, 4), dtype=np.uint8))
+    assert cache.stats()["evictions"] == 2 and cache.size <= cache.budget
+    print("render cache", cache.stats())
+    scene = SceneCache()
+    scene.update(0)
+    assert render_key(camera, objs, scene, level=1) == render_key(camera, objs, level=1)
+    assert render_key(Camera(position=np.ones(3)), objs, scene, level=1) != render_key(camera, objs, level=1)
+    assert scene.stats()["builds"] == 1 and scene.stats()["reuses"] == 1
+    scene.update(1)
+    assert scene.stats()["entries"] == []
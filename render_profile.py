@@ -0,0 +1,87 @@
+import numpy as np
+
+# Per-object cost counters collected by an instrumented raytrace
+#     pass a RenderProfile as the profile argument of Camera.raytrace (or trace) to fill it;
+#     without one the raytrace records nothing and takes its normal (kernel) path
+#     counters accumulate over every trace made with the same profile, e.g. all supersamples
+class RenderProfile:
+    def __init__(self):
+        # rays traced and how many of them hit nothing
+        self.rays = 0
+        self.background = 0
+        # seconds spent in the whole traces
+        self.seconds = 0.0
+        # per object index: name, type, ray tests, winning rays, intersection and shading seconds
+        self.objects = {}
+
+    def entry(self, k, obj):
+        k = int(k)
+        if k not in self.objects:
+            self.objects[k] = {
+                "name": obj.name,
+                "type": type(obj).__name__,
+                "tests": 0,
+                "hits": 0,
+                "distTime": 0.0,
+                "renderTime": 0.0
+            }
+        return self.objects[k]
+
+    # Records n rays tested against object k by ortho_dists, taking seconds
+    def record_tests(self, k, obj, n, seconds):
+        entry = self.entry(k, obj)
+        entry["tests"] += n
+        entry["distTime"] += seconds
+
+    # Records n rays won and shaded by object k, taking seconds
+    def record_hits(self, k, obj, n, seconds):
+        entry = self.entry(k, obj)
+        entry["hits"] += n
+        entry["renderTime"] += seconds
+
+    # Records one finished trace from the ids of the objects its rays hit
+    def record_trace(self, ids, seconds):
+        self.rays += len(ids)
+        self.background += int(np.count_nonzero(ids == -1))
+        self.seconds += seconds
+
+    # Returns one row per object, most expensive first
+    def rows(self):
+        rows = []
+        for k, entry in self.objects.items():
+            row = dict(entry, idx=k)
+            row["hitRatio"] = entry["hits"] / entry["tests"] if entry["tests"] > 0 else 0.0
+            row["time"] = entry["distTime"] + entry["renderTime"]
+            rows.append(row)
+        return sorted(rows, key=lambda row: row["time"], reverse=True)
+
+    # Returns totals over the whole profile
+    def stats(self):
+        tests = sum(entry["tests"] for entry in self.objects.values())
+        return {
+            "rays": self.rays,
+            "background": self.background,
+            "backgroundShare": self.background / self.rays if self.rays > 0 else 0.0,
+            "tests": tests,
+            "testsPerRay": tests / self.rays if self.rays > 0 else 0.0,
+            "distTime": sum(entry["distTime"] for entry in self.objects.values()),
+            "renderTime": sum(entry["renderTime"] for entry in self.objects.values()),
+            "seconds": self.seconds
+        }
+
+def test_render_profile():
+    import json
+    from objects import load_objs
+    with open("example.json") as file_ptr:
+        camera, objs = load_objs(json.load(file_ptr)["objs"])
+    camera.vdims = np.array([80, 80])
+    profile = RenderProfile()
+    profiled = camera.raytrace(objs, profile=profile)
+    assert np.array_equal(profiled, camera.raytrace(objs)), "profiled raytrace differs"
+    stats = profile.stats()
+    assert stats["rays"] == 80 * 80
+    assert sum(row["hits"] for row in profile.rows()) + stats["background"] == stats["rays"]
+    assert all(row["hits"] <= row["tests"] for row in profile.rows())
+    for row in profile.rows():
+        print(row)
+    print(stats)
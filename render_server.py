@@ -0,0 +1,409 @@
+import io
+import json
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import kernels
+from objects import load_objs
+from render_cache import RenderCache, render_key
+from tiled_render import write_png_to
+
+# Local HTTP render service for scenes in the app's save format, no GUI required.
+#     POST /render   {"objs": [...], "width": 480, "height": 480, "level": 1, "antialias": null,
+#                     "simple": false, "precision": "float64", "engine": "raytrace"} -> image/png
+#     GET /metrics   queue depth, latency histogram and throughput as JSON
+#     GET /health    200 once the service is accepting jobs
+# Jobs wait in a bounded queue for a pool of render threads. When the queue is full new jobs
+# are turned away with 503 and a Retry-After header. Identical requests share one job while it
+# is queued or rendering, and finished images are kept in a RenderCache. Request bodies over
+# MAX_BODY_BYTES are refused with 413 without being read.
+
+# Interface the server listens on, the service is only meant to be reached from localhost
+SERVER_HOST = "127.0.0.1"
+# Port the server listens on
+SERVER_PORT = 8765
+# Number of render worker threads
+RENDER_WORKERS = 2
+# Number of jobs that may wait for a worker before requests are rejected
+QUEUE_SIZE = 16
+# Longest time (in seconds) a request waits for its job before giving up
+JOB_TIMEOUT = 120
+# Largest image (in pixels) a single job may ask for, use tiled_render.py for anything bigger
+MAX_JOB_PIXELS = 4096 * 4096
+# Largest request body (in bytes) that is read, bigger requests are turned away with 413
+MAX_BODY_BYTES = 64 * 1024 * 1024
+# How often (in seconds) idle render workers check whether the service is stopping
+WORKER_POLL_INTERVAL = 0.1
+# Memory budget (in bytes) for finished PNGs kept to answer repeated requests
+RESULT_CACHE_BUDGET = 64 * 1024 * 1024
+# Upper bounds (in seconds) of the job latency histogram buckets
+LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, float("inf")]
+# Time window (in seconds) over which throughput is measured
+THROUGHPUT_WINDOW = 60
+# Render engines a job may ask for
+ENGINES = ["raytrace", "rasterize"]
+
+# Raised when the job queue is full
+class ServiceBusy(Exception):
+    pass
+
+# A render request, shared by every client that asked for the same image
+class RenderJob:
+    def __init__(self, key, camera, objs, options):
+        self.key = key
+        self.camera = camera
+        self.objs = objs
+        self.options = options
+        self.submitted = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def finish(self, result=None, error=None):
+        self.result, self.error = result, error
+        self.done.set()
+
+# Parses and validates a request body into a camera, objects and render options
+def parse_request(data):
+    if not isinstance(data, dict) or not isinstance(data.get("objs"), list):
+        raise ValueError("Request must be a JSON object with an \"objs\" list.")
+    # meshes name files on the server, which clients must not get read (or get caches written next to)
+    if any(isinstance(obj, dict) and obj.get("type") == "Mesh" for obj in data["objs"]):
+        raise ValueError("Mesh objects are not accepted by the render service.")
+    camera, objs = load_objs(data["objs"])
+    if camera is None:
+        raise ValueError("Scene has no camera.")
+    options = {
+        "width": int(data.get("width", camera.vdims[0])),
+        "height": int(data.get("height", camera.vdims[1])),
+        "level": int(data.get("level", 1)),
+        "antialias": data.get("antialias"),
+        "simple": bool(data.get("simple", False)),
+        "precision": data.get("precision", "float64"),
+        "engine": data.get("engine", "raytrace")
+    }
+    if options["width"] < 2 or options["height"] < 2 or options["width"] * options["height"] > MAX_JOB_PIXELS:
+        raise ValueError("Image size must be at least 2 x 2 and at most {0} pixels.".format(MAX_JOB_PIXELS))
+    if options["level"] < 1:
+        raise ValueError("Resolution level must be at least 1.")
+    if options["antialias"] not in [None, "edge", "ssaa"]:
+        raise ValueError("Unknown anti-aliasing mode {0}.".format(options["antialias"]))
+    if options["precision"] not in ["float64", "float32"]:
+        raise ValueError("Unknown precision {0}.".format(options["precision"]))
+    if options["engine"] not in ENGINES:
+        raise ValueError("Unknown render engine {0}.".format(options["engine"]))
+    camera.vdims = np.array([options["width"], options["height"]])
+    return camera, objs, options
+
+# Renders a job into PNG bytes
+def render_job(camera, objs, options):
+    if options["engine"] == "rasterize":
+        sheet = camera.rasterize(objs, options["simple"], options["level"])
+    else:
+        sheet = camera.raytrace(objs, options["simple"], options["level"], options["antialias"],
+                                precision=options["precision"])
+    buffer = io.BytesIO()
+    write_png_to(np.ascontiguousarray(sheet.transpose((1, 0, 2))).astype(np.uint8), buffer)
+    return buffer.getvalue()
+
+class RenderService:
+    def __init__(self, workers=RENDER_WORKERS, queue_size=QUEUE_SIZE, cache_budget=RESULT_CACHE_BUDGET):
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.pending = {}
+        self.cache = RenderCache(cache_budget)
+        self.lock = threading.Lock()
+        self.threads = [threading.Thread(target=self.work, daemon=True) for _ in range(workers)]
+        self.stopping = threading.Event()
+        self.busy = 0
+        # metrics
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.deduplicated = 0
+        self.cached = 0
+        self.latencyCounts = [0] * len(LATENCY_BUCKETS)
+        self.latencySum = 0.0
+        self.finishTimes = deque()
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    # Lets queued jobs finish, then stops the workers
+    #     workers leave once they find the queue empty, so stopping never waits for room in a full queue
+    def stop(self):
+        self.stopping.set()
+        for thread in self.threads:
+            thread.join()
+
+    # Queues a request, returning the job that will hold its image
+    #     raises ValueError for invalid requests and ServiceBusy when the queue is full
+    def submit(self, data):
+        camera, objs, options = parse_request(data)
+        key = render_key(camera, objs, **options)
+        with self.lock:
+            self.submitted += 1
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.cached += 1
+                job = RenderJob(key, camera, objs, options)
+                job.finish(cached.tobytes())
+                return job
+            if key in self.pending:
+                self.deduplicated += 1
+                return self.pending[key]
+            job = RenderJob(key, camera, objs, options)
+            try:
+                self.jobs.put_nowait(job)
+            except queue.Full:
+                self.rejected += 1
+                raise ServiceBusy()
+            self.pending[key] = job
+            return job
+
+    def work(self):
+        while True:
+            try:
+                job = self.jobs.get(timeout=WORKER_POLL_INTERVAL)
+            except queue.Empty:
+                if self.stopping.is_set():
+                    return
+                continue
+            with self.lock:
+                self.busy += 1
+            try:
+                result, error = render_job(job.camera, job.objs, job.options), None
+            except Exception as exception:
+                result, error = None, exception
+            with self.lock:
+                self.busy -= 1
+                del self.pending[job.key]
+                if error is None:
+                    self.cache.put(job.key, np.frombuffer(result, dtype=np.uint8))
+                self.record(job, error is None)
+            job.finish(result, error)
+
+    # Adds a finished job to the metrics, the service lock must be held
+    def record(self, job, succeeded):
+        now = time.perf_counter()
+        latency = now - job.submitted
+        if succeeded:
+            self.completed += 1
+        else:
+            self.failed += 1
+        self.latencySum += latency
+        self.latencyCounts[next(i for i, bound in enumerate(LATENCY_BUCKETS) if latency <= bound)] += 1
+        self.finishTimes.append(now)
+        while self.finishTimes[0] < now - THROUGHPUT_WINDOW:
+            self.finishTimes.popleft()
+
+    # Returns queue, latency and throughput metrics
+    def metrics(self):
+        with self.lock:
+            now = time.perf_counter()
+            recent = [t for t in self.finishTimes if t >= now - THROUGHPUT_WINDOW]
+            finished = self.completed + self.failed
+            return {
+                "queueDepth": self.jobs.qsize(),
+                "queueSize": self.jobs.maxsize,
+                "busyWorkers": self.busy,
+                "workers": len(self.threads),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "deduplicated": self.deduplicated,
+                "cached": self.cached,
+                "latency": {
+                    "buckets": [[str(bound), count] for bound, count in zip(LATENCY_BUCKETS, self.latencyCounts)],
+                    "count": finished,
+                    "mean": self.latencySum / finished if finished > 0 else 0
+                },
+                "throughput": len(recent) / THROUGHPUT_WINDOW,
+                "cache": self.cache.stats()
+            }
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            self.reply(200, json.dumps(self.server.service.metrics()).encode(), "application/json")
+        elif self.path == "/health":
+            self.reply(200, b"ok", "text/plain")
+        else:
+            self.reply(404, b"not found", "text/plain")
+
+    def do_POST(self):
+        if self.path != "/render":
+            self.reply(404, b"not found", "text/plain")
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if length < 0:
+                raise ValueError("Invalid Content-Length {0}.".format(length))
+            if length > MAX_BODY_BYTES:
+                # the body is left unread, so the connection cannot be reused
+                self.close_connection = True
+                self.reply(413, "Request body is larger than {0} bytes.".format(MAX_BODY_BYTES).encode(),
+                           "text/plain")
+                return
+            job = self.server.service.submit(json.loads(self.rfile.read(length)))
+        except ServiceBusy:
+            self.reply(503, b"render queue is full", "text/plain", {"Retry-After": "1"})
+            return
+        except (ValueError, KeyError, TypeError) as error:
+            self.reply(400, str(error).encode(), "text/plain")
+            return
+        if not job.done.wait(JOB_TIMEOUT):
+            self.reply(504, b"render timed out", "text/plain")
+        elif job.error is not None:
+            self.reply(500, str(job.error).encode(), "text/plain")
+        else:
+            self.reply(200, job.result, "image/png", {"X-Render-Key": job.key})
+
+    def reply(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Keeps request logging out of the console
+    def log_message(self, format, *args):
+        pass
+
+# Starts a render service and an HTTP server for it in a background thread
+#     port 0 picks a free port, see server.server_address
+def serve(host=SERVER_HOST, port=SERVER_PORT, workers=RENDER_WORKERS, queue_size=QUEUE_SIZE):
+    # render workers launch parallel kernels, see kernels.start_threads
+    kernels.start_threads()
+    server = ThreadingHTTPServer((host, port), RenderRequestHandler)
+    server.daemon_threads = True
+    server.service = RenderService(workers, queue_size).start()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def shutdown(server):
+    server.shutdown()
+    server.server_close()
+    server.service.stop()
+
+# Sends requests from concurrent clients and returns the status code counts and client side latencies
+def load_test(url, scenes, requests=64, concurrency=8):
+    from concurrent.futures import ThreadPoolExecutor
+    from urllib.error import HTTPError
+    from urllib.request import Request, urlopen
+    def send(i):
+        request = Request(url + "/render", data=json.dumps(scenes[i % len(scenes)]).encode(),
+                          headers={"Content-Type": "application/json"})
+        start = time.perf_counter()
+        try:
+            with urlopen(request, timeout=JOB_TIMEOUT) as response:
+                response.read()
+                status = response.status
+        except HTTPError as error:
+            status = error.code
+        return status, time.perf_counter() - start
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(send, range(requests)))
+    elapsed = time.perf_counter() - start
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    latencies = sorted(latency for _, latency in results)
+    return {
+        "statuses": statuses,
+        "elapsed": elapsed,
+        "requestsPerSecond": requests / elapsed,
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[int(len(latencies) * 0.95) - 1]
+    }
+
+# Varied scenes for load tests, built from a saved scene by moving its camera
+def load_test_scenes(path="example.json", count=8, size=160):
+    with open(path) as file_ptr:
+        data = json.load(file_ptr)["objs"]
+    scenes = []
+    for i in range(count):
+        objs = [dict(obj) for obj in data]
+        for obj in objs:
+            if obj["type"] == "Camera":
+                obj["position"] = [obj["position"][0] + 0.1 * i] + obj["position"][1:]
+        scenes.append({"objs": objs, "width": size, "height": size})
+    return scenes
+
+# Runs the service, e.g.
+#     python render_server.py [port]
+#     python render_server.py loadtest [requests] [concurrency]
+def main(argv):
+    if len(argv) > 1 and argv[1] == "loadtest":
+        server = serve(port=0)
+        url = "http://{0}:{1}".format(*server.server_address)
+        requests = int(argv[2]) if len(argv) > 2 else 64
+        concurrency = int(argv[3]) if len(argv) > 3 else 8
+        # every request is a different scene, so the service has to render all of them
+        print(json.dumps(load_test(url, load_test_scenes(count=requests), requests, concurrency), indent=2))
+        print(json.dumps(server.service.metrics(), indent=2))
+        shutdown(server)
+        return
+    server = serve(port=int(argv[1]) if len(argv) > 1 else SERVER_PORT)
+    print("Rendering on http://{0}:{1}".format(*server.server_address))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        shutdown(server)
+
+def test_render_server():
+    from urllib.error import HTTPError
+    from urllib.request import Request, urlopen
+    server = serve(port=0, workers=2, queue_size=2)
+    url = "http://{0}:{1}".format(*server.server_address)
+    scenes = load_test_scenes(count=6, size=96)
+    # identical scenes are rendered once, with small queues some requests are turned away
+    result = load_test(url, scenes, requests=24, concurrency=12)
+    metrics = server.service.metrics()
+    assert set(result["statuses"]) <= {200, 503}, result
+    assert metrics["completed"] <= len(scenes), metrics
+    assert metrics["deduplicated"] + metrics["cached"] + metrics["rejected"] >= 24 - len(scenes), metrics
+    try:
+        urlopen(url + "/render", data=b"{}")
+        assert False, "invalid request was accepted"
+    except HTTPError as error:
+        assert error.code == 400
+    # meshes would make the server read files named by the client
+    mesh = {"type": "Mesh", "path": "/etc/passwd", "position": [0, 0, 0], "name": "mesh", "quaternion": [1, 0, 0, 0],
+            "color": [0, 0, 0]}
+    try:
+        urlopen(url + "/render", data=json.dumps({"objs": [mesh] + scenes[0]["objs"]}).encode())
+        assert False, "mesh request was accepted"
+    except HTTPError as error:
+        assert error.code == 400
+    # oversized bodies are refused before they are read
+    try:
+        urlopen(Request(url + "/render", data=b"{}", headers={"Content-Length": str(MAX_BODY_BYTES + 1)}))
+        assert False, "oversized request was accepted"
+    except HTTPError as error:
+        assert error.code == 413
+    with urlopen(url + "/metrics") as response:
+        assert json.loads(response.read())["submitted"] == metrics["submitted"]
+    shutdown(server)
+    # stopping does not wait for room in a full queue
+    service = RenderService(workers=1, queue_size=1)
+    job = service.submit(scenes[0])
+    service.start().stop()
+    assert job.done.is_set() and job.error is None, "queued job did not finish before the service stopped"
+    print("render server", result, metrics["latency"]["count"], "jobs rendered")
+
+if __name__ == "__main__":
+    main(sys.argv)
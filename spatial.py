@@ -0,0 +1,402 @@
+from itertools import chain
+
+import numpy as np
+
+import quaternions
+from objects import Box
+
+# Spatial index over the bounds of scene objects for range, nearest-object and overlap queries.
+# Objects are hashed into a uniform grid of cubic cells by their axis aligned bounds, each cell
+# listing the slots of the objects whose bounds touch it. Slots are stable storage positions, so an
+# edit only rehashes the edited object and a removal only renumbers the slot to object index table.
+# Queries gather candidates from the cells they touch and then test them exactly: boxes as oriented
+# boxes, spheres as spheres and other objects (instances, meshes) through their bounding sphere.
+# Every query answers with object indices into the indexed list.
+
+# Cell edge length as a multiple of the median object extent, used when no cell size is given
+CELL_SIZE_FACTOR = 2.0
+# Objects whose bounds span more cells than this stay out of the grid and are tested by every query
+LARGE_OBJECT_CELLS = 64
+# Cell coordinates are clamped to [-CELL_COORD_LIMIT, CELL_COORD_LIMIT) so that three of them pack into one key
+CELL_COORD_LIMIT = 1 << 19
+# Slack of the separating axis tests, keeps boxes with parallel edges from being separated by rounding
+SAT_EPSILON = 1e-9
+# Slots allocated by an empty index
+INITIAL_SLOTS = 64
+
+# Query geometry of objects: whether each is a box, centers, bounding radii, (N, 3, 3) box bases,
+# box half extents and the lower and upper corners of the axis aligned bounds
+def object_geometry(objs):
+    N = len(objs)
+    boxes = np.zeros(N, dtype=bool)
+    centers, halves, radii = np.zeros((N, 3)), np.zeros((N, 3)), np.zeros(N)
+    rotations = np.tile([1.0, 0, 0, 0], (N, 1))
+    for k, obj in enumerate(objs):
+        centers[k] = obj.position
+        radii[k] = obj.bounding_radius()
+        if isinstance(obj, Box):
+            boxes[k] = True
+            halves[k] = 0.5 * obj.dims
+            rotations[k] = obj.quaternion
+    # same matrices as BaseObject.basis, rows are the box axes in world space
+    bases = quaternions.to_matrix(rotations) if N > 0 else np.zeros((0, 3, 3))
+    extents = np.where(boxes[:, None], np.einsum("kji,kj->ki", np.abs(bases), halves), radii[:, None])
+    return boxes, centers, radii, bases, halves, centers - extents, centers + extents
+
+# Distances from points to oriented boxes given by centers, bases and half extents, zero inside
+def box_distances(points, centers, bases, halves):
+    local = np.einsum("kij,kj->ki", bases, points - centers)
+    return np.linalg.norm(np.maximum(np.abs(local) - halves, 0), axis=1)
+
+# Whether pairs of oriented boxes overlap, by the separating axis theorem (Ericson, Real-Time
+# Collision Detection 4.4.1): the 3 + 3 face axes and the 9 edge cross products are tested
+def boxes_overlap(ca, ba, ha, cb, bb, hb):
+    # b's axes in a's frame, and b's center in a's frame
+    rot = np.einsum("kij,klj->kil", ba, bb)
+    absrot = np.abs(rot) + SAT_EPSILON
+    t = np.einsum("kij,kj->ki", ba, cb - ca)
+    separated = np.any(np.abs(t) > ha + np.einsum("kil,kl->ki", absrot, hb), axis=1)
+    separated |= np.any(np.abs(np.einsum("kil,ki->kl", rot, t)) > np.einsum("kil,ki->kl", absrot, ha) + hb, axis=1)
+    for i in range(3):
+        i1, i2 = (i + 1) % 3, (i + 2) % 3
+        for j in range(3):
+            j1, j2 = (j + 1) % 3, (j + 2) % 3
+            ra = ha[:, i1] * absrot[:, i2, j] + ha[:, i2] * absrot[:, i1, j]
+            rb = hb[:, j1] * absrot[:, i, j2] + hb[:, j2] * absrot[:, i, j1]
+            separated |= np.abs(t[:, i2] * rot[:, i1, j] - t[:, i1] * rot[:, i2, j]) > ra + rb
+    return ~separated
+
+# Uniform grid over the bounds of a list of objects, see the module comment
+#     the index reads objs again when told about edits through add, remove and update
+class SpatialIndex:
+    def __init__(self, objs, cell_size=None):
+        self.objs = objs
+        self.rebuild(cell_size)
+
+    # Rehashes every object, picking a cell size from the object extents unless one is given
+    def rebuild(self, cell_size=None):
+        geometry = object_geometry(self.objs)
+        N = len(self.objs)
+        capacity = max(N, INITIAL_SLOTS)
+        self.boxes = np.zeros(capacity, dtype=bool)
+        self.centers, self.radii = np.zeros((capacity, 3)), np.zeros(capacity)
+        self.bases, self.halves = np.zeros((capacity, 3, 3)), np.zeros((capacity, 3))
+        self.lows, self.highs = np.zeros((capacity, 3)), np.zeros((capacity, 3))
+        self.cell_lows = np.zeros((capacity, 3), dtype=np.int64)
+        self.cell_highs = np.zeros((capacity, 3), dtype=np.int64)
+        # object index of every slot, -1 for free slots
+        self.owners = np.full(capacity, -1, dtype=np.int64)
+        for array, values in zip(self.geometry_arrays(), geometry):
+            array[:N] = values
+        if cell_size is None:
+            extents = (geometry[6] - geometry[5]).max(axis=1) if N > 0 else np.zeros(0)
+            cell_size = CELL_SIZE_FACTOR * np.median(extents) if N > 0 else 1.0
+        self.cell_size = float(cell_size) if np.isfinite(cell_size) and cell_size > 0 else 1.0
+        self.slots = list(range(N))
+        self.owners[:N] = np.arange(N)
+        self.free = list(range(capacity - 1, N - 1, -1))
+        self.cells = {}
+        self.large = set()
+        self.hash_slots(np.arange(N))
+
+    def geometry_arrays(self):
+        return self.boxes, self.centers, self.radii, self.bases, self.halves, self.lows, self.highs
+
+    def __len__(self):
+        return len(self.slots)
+
+    # Integer cell coordinates of points
+    def cell_coords(self, points):
+        return np.clip(np.floor(np.asarray(points) / self.cell_size), -CELL_COORD_LIMIT,
+                       CELL_COORD_LIMIT - 1).astype(np.int64)
+
+    # Packs (..., 3) cell coordinates into integer keys of the cells dictionary
+    def cell_keys(self, coords):
+        shifted, stride = coords + CELL_COORD_LIMIT, 2 * CELL_COORD_LIMIT
+        return (shifted[..., 0] * stride + shifted[..., 1]) * stride + shifted[..., 2]
+
+    # Keys of every cell from cell coordinates lo to hi (inclusive)
+    def range_keys(self, lo, hi):
+        axes = [np.arange(a, b + 1) for a, b in zip(lo, hi)]
+        return self.cell_keys(np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape((-1, 3)))
+
+    # Adds slots to the cells their bounds touch, vectorized over slots
+    def hash_slots(self, slots):
+        self.cell_lows[slots] = self.cell_coords(self.lows[slots])
+        self.cell_highs[slots] = self.cell_coords(self.highs[slots])
+        spans = self.cell_highs[slots] - self.cell_lows[slots] + 1
+        counts = np.prod(spans, axis=1)
+        large = counts > LARGE_OBJECT_CELLS
+        self.large.update(slots[large].tolist())
+        slots, spans, counts = slots[~large], spans[~large], counts[~large]
+        # one entry per (slot, cell), the cells of a slot are enumerated like a C ordered array
+        entries = np.repeat(slots, counts)
+        offsets = np.arange(len(entries)) - np.repeat(np.cumsum(counts) - counts, counts)
+        spans = np.repeat(spans, counts, axis=0)
+        steps = np.stack([offsets // (spans[:, 1] * spans[:, 2]), (offsets // spans[:, 2]) % spans[:, 1],
+                          offsets % spans[:, 2]], axis=1)
+        keys = self.cell_keys(self.cell_lows[entries] + steps)
+        order = np.argsort(keys, kind="stable")
+        keys, entries = keys[order], entries[order]
+        unique, starts = np.unique(keys, return_index=True)
+        for key, group in zip(unique.tolist(), np.split(entries, starts[1:]) if len(entries) > 0 else []):
+            self.cells.setdefault(key, []).extend(group.tolist())
+
+    # Removes a slot from the cells it was hashed into
+    def unhash_slot(self, slot):
+        if slot in self.large:
+            self.large.discard(slot)
+            return
+        for key in self.range_keys(self.cell_lows[slot], self.cell_highs[slot]).tolist():
+            cell = self.cells[key]
+            cell.remove(slot)
+            if len(cell) == 0:
+                del self.cells[key]
+
+    # Doubles the slot storage
+    def grow(self):
+        capacity = len(self.owners)
+        for name in ["boxes", "centers", "radii", "bases", "halves", "lows", "highs", "cell_lows", "cell_highs"]:
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate([array, np.zeros_like(array)]))
+        self.owners = np.concatenate([self.owners, np.full(capacity, -1, dtype=np.int64)])
+        self.free.extend(range(2 * capacity - 1, capacity - 1, -1))
+
+    def store(self, slots, objs):
+        for array, values in zip(self.geometry_arrays(), object_geometry(objs)):
+            array[slots] = values
+
+    # Indexes the object that was inserted at idx of the indexed list
+    def add(self, idx):
+        if len(self.free) == 0:
+            self.grow()
+        slot = self.free.pop()
+        self.owners[self.owners >= idx] += 1
+        self.owners[slot] = idx
+        self.slots.insert(idx, slot)
+        self.store(np.array([slot]), [self.objs[idx]])
+        self.hash_slots(np.array([slot]))
+
+    # Forgets the object that was removed from idx of the indexed list
+    def remove(self, idx):
+        slot = self.slots.pop(idx)
+        self.unhash_slot(slot)
+        self.owners[slot] = -1
+        self.owners[self.owners > idx] -= 1
+        self.free.append(slot)
+
+    # Rehashes the object at idx, or the objects at a list of indices, after they moved, turned or changed size
+    #     a list is stored and hashed in one vectorized pass, e.g. for group transforms
+    def update(self, idxs):
+        idxs = np.atleast_1d(idxs)
+        slots = np.array([self.slots[idx] for idx in idxs], dtype=np.int64)
+        for slot in slots.tolist():
+            self.unhash_slot(slot)
+        self.store(slots, [self.objs[idx] for idx in idxs])
+        self.hash_slots(slots)
+
+    def live_slots(self):
+        return np.flatnonzero(self.owners >= 0)
+
+    # Slots hashed into cells from cell coordinates lo to hi and every large slot, may hold duplicates
+    #     ranges touching more cells than are occupied scan every slot instead
+    def candidates(self, lo, hi):
+        if np.prod(hi - lo + 1) > len(self.cells):
+            return self.live_slots()
+        found = [self.cells[key] for key in self.range_keys(lo, hi).tolist() if key in self.cells]
+        slots = np.fromiter(chain.from_iterable(found), dtype=np.int64)
+        return np.concatenate([slots, np.fromiter(self.large, dtype=np.int64, count=len(self.large))])
+
+    # Distances from point to the objects in slots, zero inside
+    def distances(self, slots, point):
+        dists = np.maximum(np.linalg.norm(point - self.centers[slots], axis=1) - self.radii[slots], 0)
+        boxes = slots[self.boxes[slots]]
+        dists[self.boxes[slots]] = box_distances(np.broadcast_to(point, (len(boxes), 3)), self.centers[boxes],
+                                                 self.bases[boxes], self.halves[boxes])
+        return dists
+
+    # Whether the objects in slots a overlap the objects in slots b, touching counts as overlapping
+    def pairs_overlap(self, a, b):
+        ca, cb, ra, rb = self.centers[a], self.centers[b], self.radii[a], self.radii[b]
+        boxes_a, boxes_b = self.boxes[a], self.boxes[b]
+        overlap = np.linalg.norm(ca - cb, axis=1) <= ra + rb
+        for first, second, sel in [(a, b, boxes_a & ~boxes_b), (b, a, ~boxes_a & boxes_b)]:
+            box, other = first[sel], second[sel]
+            overlap[sel] = box_distances(self.centers[other], self.centers[box], self.bases[box],
+                                         self.halves[box]) <= self.radii[other]
+        both = boxes_a & boxes_b
+        overlap[both] = boxes_overlap(ca[both], self.bases[a[both]], self.halves[a[both]],
+                                      cb[both], self.bases[b[both]], self.halves[b[both]])
+        return overlap
+
+    # Objects overlapping (or with contained, lying inside) the oriented box region of the given
+    # center, basis (rows are the box axes) and half extents, as sorted object indices
+    def query_region(self, center, basis, half, contained=False):
+        center, basis = np.asarray(center, dtype=float), np.asarray(basis, dtype=float)
+        half = np.asarray(half, dtype=float)
+        extent = np.abs(basis).T @ half
+        lo, hi = center - extent, center + extent
+        slots = np.unique(self.candidates(self.cell_coords(lo), self.cell_coords(hi)))
+        slots = slots[np.all((self.lows[slots] <= hi) & (self.highs[slots] >= lo), axis=1)]
+        boxes = self.boxes[slots]
+        n = len(slots)
+        if contained:
+            local = (self.centers[slots] - center) @ basis.T
+            # half extents of every object along the region axes
+            reach = np.repeat(self.radii[slots][:, None], 3, axis=1)
+            axes = np.abs(np.einsum("ij,klj->kil", basis, self.bases[slots[boxes]]))
+            reach[boxes] = np.einsum("kil,kl->ki", axes, self.halves[slots[boxes]])
+            keep = np.all(np.abs(local) + reach <= half, axis=1)
+        else:
+            regions = np.broadcast_to(center, (n, 3)), np.broadcast_to(basis, (n, 3, 3)), np.broadcast_to(half, (n, 3))
+            keep = box_distances(self.centers[slots], *regions) <= self.radii[slots]
+            keep[boxes] = boxes_overlap(regions[0][boxes], regions[1][boxes], regions[2][boxes],
+                                        self.centers[slots[boxes]], self.bases[slots[boxes]], self.halves[slots[boxes]])
+        return np.sort(self.owners[slots[keep]])
+
+    # Objects overlapping (or with contained, lying inside) the axis aligned box from lo to hi
+    def query_box(self, lo, hi, contained=False):
+        lo, hi = np.asarray(lo, dtype=float), np.asarray(hi, dtype=float)
+        return self.query_region(0.5 * (lo + hi), np.eye(3), 0.5 * (hi - lo), contained)
+
+    # Objects under the pixel rectangle lo to hi of a camera's viewport, e.g. a rubber band selection
+    #     pixels map to the camera plane like Camera.cull_spheres, and only objects reaching in front
+    #     of the camera count
+    def query_view(self, camera, lo, hi, contained=False):
+        live = self.live_slots()
+        basis = camera.basis()
+        basis = basis / np.linalg.norm(basis, axis=1)[:, None]
+        far = np.max((self.centers[live] - camera.position) @ basis[1] + self.radii[live]) if len(live) > 0 else -1
+        if far < 0:
+            return np.zeros(0, dtype=np.int64)
+        vp_ratio = camera.vdims[0] / camera.dims[0]
+        offset = 0.5 * np.array([camera.dims[0], camera.dims[1]])
+        lo, hi = np.asarray(lo, dtype=float) / vp_ratio - offset, np.asarray(hi, dtype=float) / vp_ratio - offset
+        local = np.array([0.5 * (lo[0] + hi[0]), 0.5 * far, 0.5 * (lo[1] + hi[1])])
+        half = np.array([0.5 * (hi[0] - lo[0]), 0.5 * far, 0.5 * (hi[1] - lo[1])])
+        return self.query_region(camera.position + basis.T @ local, basis, half, contained)
+
+    # Index of the object nearest to point and its distance (zero inside the object), or (-1, inf)
+    #     searches rings of cells around the point's cell until no unvisited cell can hold anything nearer
+    def nearest(self, point):
+        point = np.asarray(point, dtype=float)
+        best, best_slot = float("inf"), -1
+        def visit(slots):
+            nonlocal best, best_slot
+            if len(slots) > 0:
+                dists = self.distances(slots, point)
+                k = np.argmin(dists)
+                if dists[k] < best or (dists[k] == best and self.owners[slots[k]] < self.owners[best_slot]):
+                    best, best_slot = dists[k], slots[k]
+        visit(np.fromiter(self.large, dtype=np.int64, count=len(self.large)))
+        origin = self.cell_coords(point)
+        ring = 0
+        while True:
+            shell = (2 * ring + 1) ** 3 - max(2 * ring - 1, 0) ** 3
+            if shell > len(self.cells):
+                visit(self.live_slots())
+                break
+            lo, hi = origin - ring, origin + ring
+            axes = [np.arange(a, b + 1) for a, b in zip(lo, hi)]
+            coords = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape((-1, 3))
+            coords = coords[np.max(np.abs(coords - origin), axis=1) == ring]
+            found = [self.cells[key] for key in self.cell_keys(coords).tolist() if key in self.cells]
+            visit(np.unique(np.fromiter(chain.from_iterable(found), dtype=np.int64)))
+            # anything not yet visited lies outside the cube of visited cells
+            bound = min(np.min(point - lo * self.cell_size), np.min((hi + 1) * self.cell_size - point))
+            if best <= bound:
+                break
+            ring += 1
+        return (int(self.owners[best_slot]), float(best)) if best_slot != -1 else (-1, float("inf"))
+
+    # Index pairs (i < j) of overlapping objects as a lexicographically sorted (M, 2) array
+    #     pairs sharing several cells are only reported by the cell holding the larger of their lower corners
+    def overlapping_pairs(self):
+        sizes = np.fromiter((len(cell) for cell in self.cells.values()), dtype=np.int64, count=len(self.cells))
+        keys = np.repeat(np.fromiter(self.cells.keys(), dtype=np.int64, count=len(self.cells)), sizes)
+        entries = np.fromiter(chain.from_iterable(self.cells.values()), dtype=np.int64, count=np.sum(sizes))
+        # every entry is paired with the entries after it in its cell
+        ends = np.repeat(np.cumsum(sizes), sizes)
+        counts = ends - np.arange(len(entries)) - 1
+        first = np.repeat(np.arange(len(entries)), counts)
+        second = first + 1 + np.arange(len(first)) - np.repeat(np.cumsum(counts) - counts, counts)
+        a, b, cell = entries[first], entries[second], keys[first]
+        touching = np.all((self.lows[a] <= self.highs[b]) & (self.highs[a] >= self.lows[b]), axis=1)
+        a, b, cell = a[touching], b[touching], cell[touching]
+        reference = self.cell_keys(self.cell_coords(np.maximum(self.lows[a], self.lows[b])))
+        a, b = a[reference == cell], b[reference == cell]
+        # large objects are paired with every object whose bounds they touch
+        live = self.live_slots()
+        for slot in sorted(self.large):
+            others = live[(live != slot) & (~np.isin(live, list(self.large)) | (live > slot))]
+            others = others[np.all((self.lows[others] <= self.highs[slot]) & (self.highs[others] >= self.lows[slot]),
+                                   axis=1)]
+            a, b = np.concatenate([a, np.full(len(others), slot)]), np.concatenate([b, others])
+        overlap = self.pairs_overlap(a, b)
+        pairs = np.sort(np.stack([self.owners[a[overlap]], self.owners[b[overlap]]], axis=1), axis=1)
+        return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+    # Objects, occupied cells, objects kept out of the grid and the cell size
+    def stats(self):
+        return {
+            "objects": len(self.slots),
+            "cells": len(self.cells),
+            "large": len(self.large),
+            "cellSize": self.cell_size
+        }
+
+def test_spatial():
+    from objects import Sphere, rot_quat
+    rng = np.random.default_rng(3)
+    def random_object():
+        position = rng.uniform(-10, 10, 3)
+        if rng.random() < 0.5:
+            return Sphere(position, radius=rng.uniform(0.1, 1.0))
+        box = Box(position, dims=rng.uniform(0.2, 2.0, 3))
+        box.rotate(rot_quat(rng.normal(size=3), rng.uniform(0, np.pi)))
+        return box
+    # exact tests: a box turned by 45 degrees reaches 0.5 + sqrt(0.5) along x, a sphere off a box corner
+    turned = Box(np.array([1.2, 0, 0]))
+    turned.rotate(rot_quat([0, 0, 1], np.pi / 4))
+    pair = SpatialIndex([Box(np.zeros(3)), turned, Sphere(np.array([-0.8, -0.8, 0]), radius=0.4)])
+    assert pair.overlapping_pairs().tolist() == [[0, 1]]
+    turned.position[0] = 1.25
+    pair.update(1)
+    assert len(pair.overlapping_pairs()) == 0
+    assert pair.nearest([0, 0, 3]) == (0, 2.5)
+    # the big sphere spans more cells than LARGE_OBJECT_CELLS
+    objs = [random_object() for _ in range(300)] + [Sphere(np.zeros(3), radius=8.0)]
+    index = SpatialIndex(objs)
+    for _ in range(60):
+        action, idx = rng.integers(3), int(rng.integers(len(objs)))
+        if action == 0:
+            objs.insert(idx, random_object())
+            index.add(idx)
+        elif action == 1:
+            del objs[idx]
+            index.remove(idx)
+        else:
+            # a single index or a group moved together
+            group = rng.choice(len(objs), int(rng.integers(1, 6)), replace=False).tolist()
+            for member in group:
+                objs[member].translate(rng.normal(size=3) * 3)
+            index.update(group if len(group) > 1 else group[0])
+    assert len(index) == len(objs) and len(index.large) == 1
+    # a grid of one huge cell tests every object, which the edited index has to agree with
+    reference = SpatialIndex(objs, cell_size=1e6)
+    slots = reference.live_slots()
+    for _ in range(20):
+        lo = rng.uniform(-12, 8, 3)
+        hi = lo + rng.uniform(0.5, 6, 3)
+        for contained in [False, True]:
+            assert np.array_equal(index.query_box(lo, hi, contained), reference.query_box(lo, hi, contained))
+        basis = quaternions.to_matrix(rot_quat(rng.normal(size=3), rng.uniform(0, np.pi)))[0]
+        assert np.array_equal(index.query_region(lo, basis, hi - lo), reference.query_region(lo, basis, hi - lo))
+        point = rng.uniform(-15, 15, 3)
+        dists = reference.distances(slots, point)
+        assert index.nearest(point) == (int(np.argmin(dists)), float(np.min(dists)))
+    # slots of a fresh index are the object indices
+    a, b = np.triu_indices(len(objs), 1)
+    expected = np.stack([a, b], axis=1)[reference.pairs_overlap(a, b)]
+    assert np.array_equal(index.overlapping_pairs(), expected)
+    print("spatial index", index.stats(), "overlapping pairs", len(expected))
@@ -0,0 +1,170 @@
+import copy
+import json
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from objects import load_objs
+from render_cache import render_key
+
+# Renders very large images to disk one tile at a time.
+# Tiles are written into a memory-mapped raw RGB file (height x width x 3 uint8, row-major),
+# so peak memory only depends on the tile size. Finished tiles are recorded in a progress file
+# next to the output, which lets an interrupted job resume from the tiles already written.
+# The raw file can then be streamed into a PNG one band of rows at a time.
+
+# Width and height (in pixels) of each rendered tile
+TILE_SIZE = 256
+# Number of image rows compressed at a time when encoding a PNG
+PNG_ROWS_PER_CHUNK = 64
+
+# Path of the progress file that belongs to a raw output file
+def progress_path(path):
+    return path + ".progress"
+
+# Copy of a camera that renders at width x height pixels
+def _sized_camera(camera, width, height):
+    camera = copy.copy(camera)
+    camera.vdims = np.array([width, height])
+    return camera
+
+# Reads the tiles already finished for a job, or an empty set if the progress file belongs to another job
+def _load_progress(path, job):
+    done = set()
+    try:
+        with open(progress_path(path)) as file_ptr:
+            lines = file_ptr.read().splitlines()
+    except FileNotFoundError:
+        return done
+    if len(lines) == 0 or json.loads(lines[0]) != job:
+        return done
+    for line in lines[1:]:
+        # a job killed mid-write may leave a partial last line
+        try:
+            done.add(tuple(json.loads(line)))
+        except ValueError:
+            break
+    return done
+
+# Renders a width x height image into a memory-mapped raw RGB file at path, tile by tile
+#     already finished tiles of the same job are skipped, so calling this again resumes the job
+#     on_tile(done, total) is called after every finished tile
+#     returns the memory-mapped (height, width, 3) uint8 image
+def render_to_raw(camera, objs, path, width, height, simple=False, antialias=None, precision="float64",
+                  tile_size=TILE_SIZE, on_tile=None):
+    camera = _sized_camera(camera, width, height)
+    job = {
+        "scene": render_key(camera, objs, simple=simple, antialias=antialias, precision=precision),
+        "width": width,
+        "height": height,
+        "tileSize": tile_size
+    }
+    done = _load_progress(path, job)
+    if len(done) == 0 or not os.path.exists(path):
+        done = set()
+        image = np.memmap(path, dtype=np.uint8, mode="w+", shape=(height, width, 3))
+        with open(progress_path(path), "w") as file_ptr:
+            file_ptr.write(json.dumps(job) + "\n")
+    else:
+        image = np.memmap(path, dtype=np.uint8, mode="r+", shape=(height, width, 3))
+    tiles = [(i0, j0) for j0 in range(0, height, tile_size) for i0 in range(0, width, tile_size)]
+    with open(progress_path(path), "a") as progress:
+        for i0, j0 in tiles:
+            if (i0, j0) in done:
+                continue
+            i1, j1 = min(i0 + tile_size, width), min(j0 + tile_size, height)
+            sheet = camera.raytrace(objs, simple, 1, antialias, (i0, i1, j0, j1), precision)
+            image[j0:j1, i0:i1] = sheet.transpose((1, 0, 2))
+            # the tile must be on disk before it is recorded as finished
+            image.flush()
+            progress.write(json.dumps([i0, j0]) + "\n")
+            progress.flush()
+            done.add((i0, j0))
+            if on_tile is not None:
+                on_tile(len(done), len(tiles))
+    return image
+
+# Writes one PNG chunk
+def _write_chunk(file_ptr, tag, data):
+    file_ptr.write(struct.pack(">I", len(data)))
+    file_ptr.write(tag)
+    file_ptr.write(data)
+    file_ptr.write(struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff))
+
+# Streams a (height, width, 3) uint8 image (e.g. a memory map) as an RGB PNG into an open binary file
+#     rows are filtered and compressed PNG_ROWS_PER_CHUNK at a time
+def write_png_to(image, file_ptr):
+    height, width = image.shape[0], image.shape[1]
+    compressor = zlib.compressobj(6)
+    file_ptr.write(b"\x89PNG\r\n\x1a\n")
+    _write_chunk(file_ptr, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+    for j0 in range(0, height, PNG_ROWS_PER_CHUNK):
+        rows = np.asarray(image[j0:min(j0 + PNG_ROWS_PER_CHUNK, height)], dtype=np.uint8)
+        # every scanline starts with filter type 0 (none)
+        scanlines = np.zeros((len(rows), 1 + 3 * width), dtype=np.uint8)
+        scanlines[:, 1:] = rows.reshape((len(rows), 3 * width))
+        data = compressor.compress(scanlines.tobytes())
+        if len(data) > 0:
+            _write_chunk(file_ptr, b"IDAT", data)
+    _write_chunk(file_ptr, b"IDAT", compressor.flush())
+    _write_chunk(file_ptr, b"IEND", b"")
+
+# Streams a (height, width, 3) uint8 image into an RGB PNG file at path
+def write_png(image, path):
+    with open(path, "wb") as file_ptr:
+        write_png_to(image, file_ptr)
+
+# Renders a width x height PNG through a resumable raw file next to it
+#     the raw and progress files are removed once the PNG is written unless keep_raw is set
+def render_to_png(camera, objs, path, width, height, simple=False, antialias=None, precision="float64",
+                  tile_size=TILE_SIZE, on_tile=None, keep_raw=False):
+    raw = path + ".raw"
+    image = render_to_raw(camera, objs, raw, width, height, simple, antialias, precision, tile_size, on_tile)
+    write_png(image, path)
+    del image
+    if not keep_raw:
+        os.remove(raw)
+        os.remove(progress_path(raw))
+
+# Renders a scene saved in the app's JSON format, e.g.
+#     python tiled_render.py scene.json poster.png 16384 16384
+def main(argv):
+    with open(argv[1]) as file_ptr:
+        camera, objs = load_objs(json.load(file_ptr)["objs"])
+    width, height = int(argv[3]), int(argv[4])
+    report = lambda done, total: print("\rtile {0}/{1}".format(done, total), end="", flush=True)
+    render_to_png(camera, objs, argv[2], width, height, on_tile=report)
+    print()
+
+def test_tiled_render():
+    import tempfile
+    with open("example.json") as file_ptr:
+        camera, objs = load_objs(json.load(file_ptr)["objs"])
+    expected = _sized_camera(camera, 150, 100).raytrace(objs).transpose((1, 0, 2))
+    with tempfile.TemporaryDirectory() as directory:
+        raw = os.path.join(directory, "frame.raw")
+        # interrupt the job after a few tiles, then resume it
+        class Interrupt(Exception):
+            pass
+        def interrupt(done, total):
+            if done == 3:
+                raise Interrupt()
+        try:
+            render_to_raw(camera, objs, raw, 150, 100, tile_size=32, on_tile=interrupt)
+        except Interrupt:
+            pass
+        rendered = []
+        image = render_to_raw(camera, objs, raw, 150, 100, tile_size=32, on_tile=lambda done, total: rendered.append(done))
+        assert rendered[0] == 4 and rendered[-1] == 20, "resumed job did not skip finished tiles"
+        assert np.array_equal(image, expected), "tiled render differs from raytrace"
+        png = os.path.join(directory, "frame.png")
+        write_png(image, png)
+        with open(png, "rb") as file_ptr:
+            assert file_ptr.read(8) == b"\x89PNG\r\n\x1a\n"
+    print("tiled render matches raytrace and resumes from finished tiles")
+
+if __name__ == "__main__":
+    import sys
+    main(sys.argv)
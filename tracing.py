@@ -0,0 +1,166 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+# Timing spans of the editor's edit and render pipeline in Chrome trace-event format.
+# Set CUBETEA_TRACE to a file path to record a session, then open the file in chrome://tracing or
+# ui.perfetto.dev. Spans of one thread nest by time, so everything a frame did (raytrace, image
+# conversion, painting, ...) shows up under its "frame" span. Events are appended to the file as
+# they are buffered up, which leaves a usable trace even if the app does not exit cleanly.
+# While tracing is off span() hands out a shared no-op span.
+
+# Trace file to record into, tracing is off when unset
+TRACE_PATH = os.environ.get("CUBETEA_TRACE")
+# Number of buffered events that are written to the trace file at once
+TRACE_FLUSH_EVENTS = 256
+
+# Writes complete ("X") events and metadata ("M") events into a JSON array trace file
+class Tracer:
+    def __init__(self, path):
+        self.path = path
+        self.pid = os.getpid()
+        self.start = time.perf_counter()
+        self.events = []
+        self.written = 0
+        # small per-thread ids, in the order threads first recorded a span
+        self.threads = {}
+        self.lock = threading.Lock()
+        self.file_ptr = open(path, "w")
+        self.file_ptr.write("[")
+        self.events.append(self.metadata("process_name", 0, "CubeTea"))
+
+    # Microseconds since the tracer was created
+    def now(self):
+        return (time.perf_counter() - self.start) * 1e6
+
+    def metadata(self, kind, tid, name):
+        return {"name": kind, "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}}
+
+    def thread_id(self):
+        ident = threading.get_ident()
+        if ident not in self.threads:
+            self.threads[ident] = len(self.threads) + 1
+            self.events.append(self.metadata("thread_name", self.threads[ident], threading.current_thread().name))
+        return self.threads[ident]
+
+    # Records a span of dur microseconds that started at ts
+    def complete(self, name, cat, ts, dur, args):
+        with self.lock:
+            self.events.append({"name": name, "cat": cat, "ph": "X", "ts": ts, "dur": dur,
+                                "pid": self.pid, "tid": self.thread_id(), "args": args})
+            if len(self.events) >= TRACE_FLUSH_EVENTS:
+                self.write_events()
+
+    def write_events(self):
+        if self.file_ptr is None:
+            return
+        for event in self.events:
+            self.file_ptr.write(("\n" if self.written == 0 else ",\n") + json.dumps(event))
+            self.written += 1
+        self.file_ptr.flush()
+        self.events = []
+
+    def flush(self):
+        with self.lock:
+            self.write_events()
+
+    # Writes what is left and terminates the JSON array
+    def close(self):
+        with self.lock:
+            if self.file_ptr is None:
+                return
+            self.write_events()
+            self.file_ptr.write("\n]\n")
+            self.file_ptr.close()
+            self.file_ptr = None
+
+# Context manager timing one stage, arguments are shown with the span in the trace viewer
+class Span:
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.ts = self.tracer.now()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.complete(self.name, self.cat, self.ts, self.tracer.now() - self.ts, self.args)
+        return False
+
+    # Adds arguments only known once the stage ran, e.g. whether a frame came from a cache
+    def set(self, **args):
+        self.args.update(args)
+
+# Span handed out while tracing is off
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+NULL_SPAN = NullSpan()
+
+_tracer = None
+
+# Starts recording into a trace file at path, the file is completed when the interpreter exits
+def enable(path):
+    global _tracer
+    disable()
+    _tracer = Tracer(path)
+    atexit.register(_tracer.close)
+    return _tracer
+
+# Stops recording and completes the trace file
+def disable():
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+        atexit.unregister(_tracer.close)
+        _tracer = None
+
+def enabled():
+    return _tracer is not None
+
+# Returns a span timing the stage name of category cat, e.g.
+#     with tracing.span("raytrace", "render", objects=len(objs)) as span:
+#         ...
+#         span.set(cached=False)
+def span(name, cat="app", **args):
+    if _tracer is None:
+        return NULL_SPAN
+    return Span(_tracer, name, cat, args)
+
+if TRACE_PATH:
+    enable(TRACE_PATH)
+
+def test_tracing():
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "trace.json")
+        enable(path)
+        with span("frame", "paint", objects=2):
+            with span("raytrace", "render") as inner:
+                inner.set(cached=False)
+        worker = threading.Thread(target=lambda: span("autosave", "io").__enter__().__exit__())
+        worker.start()
+        worker.join()
+        disable()
+        assert span("frame") is NULL_SPAN
+        with open(path) as file_ptr:
+            events = json.load(file_ptr)
+    spans = {event["name"]: event for event in events if event["ph"] == "X"}
+    frame, raytrace = spans["frame"], spans["raytrace"]
+    assert frame["ts"] <= raytrace["ts"] and raytrace["ts"] + raytrace["dur"] <= frame["ts"] + frame["dur"]
+    assert raytrace["args"] == {"cached": False} and frame["args"] == {"objects": 2}
+    assert spans["autosave"]["tid"] != frame["tid"]
+    assert len([event for event in events if event["name"] == "thread_name"]) == 2
+    print("trace events", len(events))